@@ -1,9 +1,13 @@
-import os
 from aiogram import Bot
-from app.config import TELEGRAM_BOT_TOKEN
+from aiogram.client.session.aiohttp import AiohttpSession
 
-# Используем BOT_TOKEN из твоего config.py
-if not TELEGRAM_BOT_TOKEN:
-    raise ValueError("Не найден BOT_TOKEN в config.py")
+from app.services.tenants import tenant_registry
 
-bot = Bot(token=TELEGRAM_BOT_TOKEN)
\ No newline at end of file
+# Одна сессия aiohttp (общий пул соединений) на ботов всех арендаторов
+session = AiohttpSession()
+
+# Боты по id арендатора
+bots = {tenant.id: Bot(token=tenant.token, session=session) for tenant in tenant_registry}
+
+if not bots:
+    raise ValueError("Не найден ни один BOT_TOKEN (TELEGRAM_BOT_TOKEN или TENANTS_CONFIG_PATH)")
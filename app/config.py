@@ -1,6 +1,7 @@
 # config.py
 import base64
 import os
+import secrets
 import tempfile
 
 from dotenv import load_dotenv
@@ -13,6 +14,8 @@ load_dotenv()
 TELEGRAM_BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
 TIMEZONE = os.getenv("TIMEZONE")
 SUPPORT_CHAT_ID = os.getenv("SUPPORT_CHAT_ID")
+# Файл арендаторов (несколько ботов в одном процессе). Без него используется один бот из переменных выше
+TENANTS_CONFIG_PATH = os.getenv("TENANTS_CONFIG_PATH")
 
 # Google
 GOOGLE_CREDENTIALS_PATH = os.getenv("GOOGLE_CREDENTIALS_PATH")
@@ -35,12 +38,58 @@ SCOPES_SHEETS = ['https://www.googleapis.com/auth/spreadsheets']
 SCOPES_FEED_DRIVE = ["https://spreadsheets.google.com/feeds", "https://www.googleapis.com/auth/drive"]
 SCOPES_CALENDAR = ['https://www.googleapis.com/auth/calendar']
 SUPPORT_LOG_WORKSHEET_NAME = os.getenv("SUPPORT_LOG_WORKSHEET_NAME")
+# Партиционирование лога поддержки: "none" — один лист, "month" — отдельный лист на каждый месяц
+SUPPORT_LOG_PARTITION = os.getenv("SUPPORT_LOG_PARTITION", "none")
+SUPPORT_LOG_HOT_PARTITIONS = int(os.getenv("SUPPORT_LOG_HOT_PARTITIONS", "3"))  # сколько месяцев держать в таблице
+# Каталог архива старых партиций — только постоянный (volume): после архивации лист удаляется из таблицы.
+# Без значения старые партиции остаются в таблице
+SUPPORT_LOG_ARCHIVE_DIR = os.getenv("SUPPORT_LOG_ARCHIVE_DIR")
 GOOGLE_SHEET_NAME = os.getenv("GOOGLE_SHEET_NAME")
 GOOGLE_ID_EMAIL = os.getenv("GOOGLE_ID_EMAIL")
 
+# FAQ (база знаний для самостоятельного решения вопросов)
+FAQ_FILE_PATH = os.getenv("FAQ_FILE_PATH")  # .csv (id, question, answer) или .yaml
+FAQ_TOP_K = int(os.getenv("FAQ_TOP_K", "3"))
+FAQ_MIN_SCORE = float(os.getenv("FAQ_MIN_SCORE", "0.3"))
+FAQ_RELOAD_INTERVAL = float(os.getenv("FAQ_RELOAD_INTERVAL", "60"))  # секунды
 
 
 
+# Предохранители внешних сервисов и очередь отложенной работы
+BREAKER_FAILURE_RATE = float(os.getenv("BREAKER_FAILURE_RATE", "0.5"))  # доля ошибок в окне для размыкания
+BREAKER_SLOW_CALL_SECONDS = float(os.getenv("BREAKER_SLOW_CALL_SECONDS", "5"))  # вызов дольше считается медленным
+BREAKER_OPEN_SECONDS = float(os.getenv("BREAKER_OPEN_SECONDS", "30"))  # сколько держать цепь разомкнутой до пробы
+# Каталог очередей отложенной работы; в контейнере — постоянный том, иначе очереди пропадут вместе с ним
+OUTBOX_DIR = os.getenv("OUTBOX_DIR", "outbox")
+OUTBOX_FLUSH_INTERVAL = float(os.getenv("OUTBOX_FLUSH_INTERVAL", "30"))  # секунды
+# После стольких неудачных повторов задание уходит в файл недоставленных (<outbox>.dead.jsonl)
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "20"))
+
+# Склейка вопроса из нескольких сообщений подряд
+QUESTION_QUIET_WINDOW = float(os.getenv("QUESTION_QUIET_WINDOW", "3"))  # секунды тишины до создания обращения, 0 — без склейки
+QUESTION_MAX_MESSAGES = int(os.getenv("QUESTION_MAX_MESSAGES", "10"))
+QUESTION_MAX_CHARS = int(os.getenv("QUESTION_MAX_CHARS", "3500"))  # с запасом до лимита сообщения Telegram (4096)
+
+# Контроль допуска апдейтов (защита от всплесков нагрузки)
+# Одновременно обрабатываемых апдейтов во всем процессе; лимит арендатора (max_concurrency) действует внутри него
+ADMISSION_MAX_CONCURRENCY = int(os.getenv("ADMISSION_MAX_CONCURRENCY", "50"))
+ADMISSION_MAX_QUEUE = int(os.getenv("ADMISSION_MAX_QUEUE", "500"))  # ожидающих апдейтов, остальные отклоняются
+ADMISSION_MAX_PENDING_PER_USER = int(os.getenv("ADMISSION_MAX_PENDING_PER_USER", "10"))
+
+# Запись входящего трафика для воспроизведения (python -m app.tools.replay)
+CAPTURE_FILE_PATH = os.getenv("CAPTURE_FILE_PATH")  # например, capture.jsonl.gz; без значения запись выключена
+# Соль для хеширования id пользователей; без нее — случайная на каждый запуск
+CAPTURE_SALT = os.getenv("CAPTURE_SALT") or secrets.token_hex(16)
+
+# Плавная остановка (SIGTERM) и передача состояний FSM следующему процессу
+DRAIN_TIMEOUT = float(os.getenv("DRAIN_TIMEOUT", "8"))  # секунды; docker stop ждет 10 с до SIGKILL
+# Абсолютный путь на томе, общем со следующим процессом (новый контейнер не видит файлов старого).
+# Без значения снимок выключен
+FSM_SNAPSHOT_PATH = os.getenv("FSM_SNAPSHOT_PATH")
+# Снимок старше (секунды) не загружается: состояния и апдейты в нем уже неактуальны
+FSM_SNAPSHOT_MAX_AGE = float(os.getenv("FSM_SNAPSHOT_MAX_AGE", "600"))
+
+
 # Настройки логирования
 LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
 LOG_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
@@ -51,5 +100,12 @@ if not os.path.exists(GOOGLE_CREDENTIALS_PATH):
     raise FileNotFoundError(f"Файл {GOOGLE_CREDENTIALS_PATH} не найден! Проверьте путь или наличие GOOGLE_CREDENTIALS_B64.")
 
 # Проверка обязательных переменных окружения
-if not TELEGRAM_BOT_TOKEN:
-    raise EnvironmentError("Не все обязательные переменные окружения установлены!")
\ No newline at end of file
+if not TELEGRAM_BOT_TOKEN and not TENANTS_CONFIG_PATH:
+    raise EnvironmentError("Не все обязательные переменные окружения установлены!")
+
+# Снимок передает работу следующему процессу вместе с outbox — оба должны лежать на общем томе
+if FSM_SNAPSHOT_PATH:
+    for variable, path in (("FSM_SNAPSHOT_PATH", FSM_SNAPSHOT_PATH), ("OUTBOX_DIR", os.getenv("OUTBOX_DIR"))):
+        if not path or not os.path.isabs(path):
+            raise EnvironmentError(f"При включенном FSM_SNAPSHOT_PATH переменная {variable} должна быть задана "
+                                   f"абсолютным путем на общем (постоянном) томе, сейчас: {path!r}")
\ No newline at end of file
@@ -2,13 +2,16 @@
 # app/handlers/common.py
 """Модуль содержит общие обработчики и функции для работы с ботом."""
 
+from html import escape
+
 from aiogram import types
 from aiogram.fsm.context import FSMContext
 from aiogram.filters import StateFilter # Добавляем фильтр состояний
 from aiogram.fsm.state import default_state # Состояние по умолчанию
 
 from app.keyboards.inline_buttons import create_inline_universal_keyboard # Нужна функция для кнопок
-from app.utils.constants import WELCOME_TEXT, FEEDBACK_TEXT, HELP_BUTTON_TEXT, START_QUERY_CALLBACK # Константы
+from app.utils.constants import FEEDBACK_TEXT, HELP_BUTTON_TEXT, START_QUERY_CALLBACK # Константы
+from app.services.tenants import Tenant
 from app.utils.logger import setup_logger
 from app.stats.state_manager import state_manager # Нужен state_manager
 
@@ -26,7 +29,7 @@ async def send_message_with_keyboard(message: types.Message, text: str, keyboard
         return await message.answer("Произошла ошибка при отправке сообщения. Попробуйте позже.")
 
 # 🔹 Обработчик /start
-async def start_handler(message: types.Message, state: FSMContext):
+async def start_handler(message: types.Message, state: FSMContext, tenant: Tenant):
     """Обрабатывает команду /start, приветствует и ПОКАЗЫВАЕТ КНОПКУ."""
     await state.clear() # Всегда очищаем состояние при /start
     user_name = message.from_user.first_name
@@ -40,7 +43,7 @@ async def start_handler(message: types.Message, state: FSMContext):
     # Отправляем приветствие с кнопкой
     await send_message_with_keyboard(
         message,
-        WELCOME_TEXT.format(user_name=user_name),
+        tenant.format_welcome_text(user_name=escape(user_name or "")), # У каждого арендатора свое приветствие
         keyboard=keyboard # Передаем клавиатуру
     )
     # НЕ устанавливаем состояние и НЕ вызываем state_manager здесь
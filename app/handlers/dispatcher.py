@@ -1,35 +1,72 @@
 from aiogram import Dispatcher, Router, F
-from aiogram.filters import Command, StateFilter
+from aiogram.filters import Command, StateFilter, or_f
 from aiogram.fsm.state import default_state
 
 from app.handlers.common import start_handler, start_query_callback_handler
-from app.handlers.process_query import process_enter_query
+from app.handlers.monitoring import find_handler, status_handler
+from app.handlers.faq import (faq_answer_callback_handler, faq_decision_text_handler, faq_escalate_callback_handler,
+                              faq_solved_callback_handler)
+from app.handlers.process_query import process_enter_query, question_in_progress
+from app.middlewares.admission import admission_control
+from app.middlewares.capture import capture_middleware
+from app.middlewares.inflight import inflight_middleware
+from app.middlewares.tenant import TenantMiddleware
 from app.stats.question_stats import QuestionStates
-from app.utils.constants import HELP_BUTTON_CALLBACK, HELP_BUTTON_TEXT, START_QUERY_CALLBACK
+from app.utils.constants import (HELP_BUTTON_CALLBACK, HELP_BUTTON_TEXT, START_QUERY_CALLBACK,
+                                 FAQ_ANSWER_CALLBACK_PREFIX, FAQ_ESCALATE_CALLBACK, FAQ_SOLVED_CALLBACK)
 from app.utils.logger import setup_logger
 
 logger = setup_logger(__name__)
-router = Router()
 
 
 def setup_dispatcher(dp: Dispatcher):
     """Регистрируем все обработчики команд и состояний"""
+    # Свой роутер на каждый диспетчер: роутер можно подключить только к одному (replay создает диспетчер заново)
+    router = Router()
+
+    # 📌 Учет апдейтов в обработке (для передачи незавершенных следующему процессу) и отсев повторных
+    dp.update.outer_middleware(inflight_middleware)
+
+    # 📌 Запись трафика — до остальных проверок, чтобы попали и отклоненные апдейты
+    if capture_middleware:
+        dp.update.outer_middleware(capture_middleware)
+
+    # 📌 Определение арендатора и ограничение нагрузки (отдельно для каждого) — до всех обработчиков
+    dp.update.outer_middleware(TenantMiddleware())
+    dp.update.outer_middleware(admission_control)
 
     # 📌 Общие команды
     router.message.register(start_handler, Command("start"))
+    router.message.register(status_handler, Command("status"))
+    router.message.register(find_handler, Command("find"))
 
     router.callback_query.register(start_query_callback_handler,
         F.data == START_QUERY_CALLBACK,
         StateFilter(default_state))
 
-    # 📌 Обработка ввода вопроса
+    # 📌 Обработка ввода вопроса (и его продолжения, пока предыдущая часть еще обрабатывается)
     router.message.register(
         process_enter_query,
-        StateFilter(QuestionStates.waiting_for_question), # <--- ИЗМЕНИ ЗДЕСЬ
+        or_f(StateFilter(QuestionStates.waiting_for_question), question_in_progress),
         F.text,
         ~F.text.startswith('/')
     )
 
+    # 📌 Выбор готового ответа из FAQ
+    router.callback_query.register(faq_answer_callback_handler,
+        F.data.startswith(FAQ_ANSWER_CALLBACK_PREFIX),
+        StateFilter(QuestionStates.waiting_for_faq_decision))
+    router.callback_query.register(faq_solved_callback_handler,
+        F.data == FAQ_SOLVED_CALLBACK,
+        StateFilter(QuestionStates.waiting_for_faq_decision))
+    router.callback_query.register(faq_escalate_callback_handler,
+        F.data == FAQ_ESCALATE_CALLBACK,
+        StateFilter(QuestionStates.waiting_for_faq_decision))
+    # Текст вместо выбора (после продолжения вопроса, которое еще копится, — оно обработано выше)
+    router.message.register(faq_decision_text_handler,
+        StateFilter(QuestionStates.waiting_for_faq_decision),
+        F.text,
+        ~F.text.startswith('/'))
 
     logger.info("Все обработчики бота успешно зарегистрированы")
     dp.include_router(router)
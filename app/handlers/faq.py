@@ -0,0 +1,117 @@
+# app/handlers/faq.py
+"""Обработчики выбора готового ответа из FAQ перед созданием обращения."""
+
+from html import escape
+
+from aiogram import types
+from aiogram.fsm.context import FSMContext
+
+from app.handlers.process_query import submit_support_query
+from app.keyboards.inline_buttons import create_inline_universal_keyboard
+from app.services.faq_engine import faq_engine
+from app.services.tenants import Tenant, record_tenant_event
+from app.stats.state_manager import state_manager
+from app.utils.constants import (FAQ_ANSWER_CALLBACK_PREFIX, FAQ_ANSWER_TEXT, FAQ_ESCALATE_BUTTON_TEXT,
+                                 FAQ_ESCALATE_CALLBACK, FAQ_NO_MATCHES_TEXT, FAQ_OUTDATED_TEXT,
+                                 FAQ_SOLVED_BUTTON_TEXT, FAQ_SOLVED_CALLBACK, FAQ_SOLVED_TEXT)
+from app.utils.formatters import sanitize_callback_data
+from app.utils.logger import setup_logger
+
+logger = setup_logger(__name__)
+
+
+async def faq_answer_callback_handler(callback_query: types.CallbackQuery, state: FSMContext):
+    """
+    Показывает ответ на выбранный вопрос из FAQ и спрашивает, помог ли он.
+    Если ответа уже нет (база обновилась), вопрос ищется заново и ответы предлагаются еще раз.
+    """
+    user_data = await state.get_data()
+
+    # callback_data содержит очищенный id, поэтому сверяем по нему, а не ищем напрямую
+    entry = None
+    for entry_id in user_data.get("faq_matches", []):
+        if sanitize_callback_data(f"{FAQ_ANSWER_CALLBACK_PREFIX}{entry_id}") == callback_query.data:
+            entry = faq_engine.get(entry_id)
+            break
+
+    if entry is None:
+        logger.warning(f"Ответ FAQ для callback '{callback_query.data}' user {callback_query.from_user.id} не найден (база могла обновиться).")
+        await callback_query.answer(FAQ_OUTDATED_TEXT)
+        await reoffer_faq_answers(callback_query.message, state, user_data.get("query", ""))
+        return
+
+    await callback_query.answer()
+    logger.info(f"User {callback_query.from_user.id} открыл ответ FAQ '{entry.id}'")
+    keyboard = create_inline_universal_keyboard(
+        {FAQ_SOLVED_BUTTON_TEXT: FAQ_SOLVED_CALLBACK, FAQ_ESCALATE_BUTTON_TEXT: FAQ_ESCALATE_CALLBACK}, 1
+    )
+    await callback_query.message.answer(
+        FAQ_ANSWER_TEXT.format(question=escape(entry.question), answer=escape(entry.answer)),
+        parse_mode="HTML",
+        reply_markup=keyboard
+    )
+
+
+async def reoffer_faq_answers(message: types.Message, state: FSMContext, query_text: str):
+    """Заново ищет ответы на вопрос в обновленной базе FAQ и показывает их вместо устаревших кнопок."""
+    try:
+        await message.edit_reply_markup(reply_markup=None)
+    except Exception as e:
+        logger.warning(f"Не удалось убрать кнопки из сообщения {message.message_id}: {e}")
+
+    faq_matches = faq_engine.search(query_text)
+    if faq_matches:
+        await state.update_data(faq_matches=[entry.id for entry, _ in faq_matches])
+        await state_manager.handle_transition(message, state, "faq")
+        return
+
+    # Подходящих ответов не осталось — обращение создаст сам пользователь (кнопкой или дописав вопрос)
+    await state.update_data(faq_matches=[])
+    keyboard = create_inline_universal_keyboard({FAQ_ESCALATE_BUTTON_TEXT: FAQ_ESCALATE_CALLBACK}, 1)
+    suggestion = await message.answer(FAQ_NO_MATCHES_TEXT, parse_mode="HTML", reply_markup=keyboard)
+    await state.update_data(faq_message_id=suggestion.message_id)
+
+
+async def faq_solved_callback_handler(callback_query: types.CallbackQuery, state: FSMContext, tenant: Tenant):
+    """Пользователь решил вопрос с помощью FAQ — обращение не создается."""
+    await callback_query.answer()
+    record_tenant_event(tenant, "faq_solved")
+    logger.info(f"User {callback_query.from_user.id} решил вопрос с помощью FAQ, обращение не создано.")
+    try:
+        await callback_query.message.edit_reply_markup(reply_markup=None)
+    except Exception as e:
+        logger.warning(f"Не удалось убрать кнопки из сообщения {callback_query.message.message_id}: {e}")
+    await state.clear()
+    await callback_query.message.answer(FAQ_SOLVED_TEXT, parse_mode="HTML")
+
+
+async def faq_decision_text_handler(message: types.Message, state: FSMContext):
+    """
+    Пользователь не выбрал ответ из FAQ, а написал текст — ответы не подошли.
+    Создаем обращение с исходным вопросом и дописанным текстом.
+    """
+    user_data = await state.get_data()
+    faq_message_id = user_data.get("faq_message_id")
+    if faq_message_id:
+        try:
+            await message.bot.edit_message_reply_markup(chat_id=message.chat.id, message_id=faq_message_id,
+                                                        reply_markup=None)
+        except Exception as e:
+            logger.warning(f"Не удалось убрать кнопки из сообщения {faq_message_id}: {e}")
+
+    query_text = "\n".join(part for part in (user_data.get("query", ""), message.text.strip()) if part)
+    logger.info(f"User {message.from_user.id} ответил текстом на предложение FAQ, создаем обращение.")
+    await submit_support_query(message, state, message.from_user, query_text)
+
+
+async def faq_escalate_callback_handler(callback_query: types.CallbackQuery, state: FSMContext):
+    """Ответы из FAQ не подошли — создаем обращение с исходным текстом вопроса."""
+    await callback_query.answer()
+    try:
+        await callback_query.message.edit_reply_markup(reply_markup=None)
+    except Exception as e:
+        logger.warning(f"Не удалось убрать кнопки из сообщения {callback_query.message.message_id}: {e}")
+
+    user_data = await state.get_data()
+    logger.info(f"User {callback_query.from_user.id} отказался от ответов FAQ, создаем обращение.")
+    await submit_support_query(callback_query.message, state, callback_query.from_user, user_data.get("query", ""))
@@ -0,0 +1,92 @@
+# app/handlers/monitoring.py
+"""Служебные команды для мониторинга состояния бота."""
+
+from html import escape
+
+from aiogram import types
+from aiogram.filters import CommandObject
+
+from app.middlewares.admission import admission_control
+from app.services.circuit_breaker import get_circuit_breakers_state
+from app.services.outbox import get_outboxes_state
+from app.services.tenants import Tenant, tenant_metrics
+from app.utils.constants import FIND_NOT_FOUND_TEXT, FIND_USAGE_TEXT
+from app.utils.google_sheet_utils import find_support_log
+from app.utils.logger import setup_logger
+
+logger = setup_logger(__name__)
+
+STATE_ICONS = {"closed": "🟢", "half_open": "🟡", "open": "🔴"}
+
+
+def is_tenant_resource(name: str, tenant: Tenant) -> bool:
+    """Общий предохранитель/outbox или принадлежащий арендатору (его чат поддержки или таблица), но не чужой."""
+    if ":" not in name:
+        return True
+    return name in (f"support_chat:{tenant.id}", f"google_sheets:{tenant.google_sheet_name}")
+
+
+def format_status(tenant: Tenant) -> str:
+    """Собирает текстовый отчет о состоянии внешних сервисов и очередей арендатора."""
+    lines = [f"<b>📊 Состояние бота ({tenant.id})</b>\n", "<b>Предохранители:</b>"]
+    for breaker in get_circuit_breakers_state():
+        if not is_tenant_resource(breaker["name"], tenant):
+            continue
+        lines.append(
+            f"{STATE_ICONS.get(breaker['state'], '⚪')} {breaker['name']}: {breaker['state']} "
+            f"(ошибки {breaker['failure_rate']:.0%}, медленные {breaker['slow_call_rate']:.0%}, "
+            f"отклонено {breaker['rejected']})"
+        )
+    load = admission_control.get(tenant).snapshot()
+    lines.append("\n<b>Нагрузка:</b>")
+    lines.append(
+        f"⚙️ в работе {load['in_flight']}/{load['max_concurrency']}, в очереди {load['waiting']}/{load['max_queue']}, "
+        f"принято {load['admitted']}, отклонено {load['shed']}"
+    )
+    process_load = admission_control.global_snapshot()
+    lines.append(f"🖥 всего в процессе {process_load['in_flight']}/{process_load['max_concurrency']}")
+    lines.append(
+        f"⏱ ожидание p50 {load['queue_time_p50_ms']} мс, p95 {load['queue_time_p95_ms']} мс, max {load['queue_time_max_ms']} мс"
+    )
+    counters = tenant_metrics[tenant.id]
+    lines.append(
+        f"📈 апдейтов {counters['updates']}, обращений {counters['tickets']}, "
+        f"решено через FAQ {counters['faq_solved']}"
+    )
+    lines.append("\n<b>Отложенные задания:</b>")
+    for outbox in get_outboxes_state():
+        if not is_tenant_resource(outbox["name"], tenant):
+            continue
+        dead = f", недоставлено: {outbox['dead']}" if outbox['dead'] else ""
+        lines.append(f"📦 {outbox['name']}: {outbox['pending']}{dead}")
+    return "\n".join(lines)
+
+
+async def status_handler(message: types.Message, tenant: Tenant):
+    """Обрабатывает команду /status — доступна только в чате поддержки арендатора."""
+    if str(message.chat.id) != str(tenant.support_chat_id):
+        logger.warning(f"Команда /status из постороннего чата {message.chat.id} проигнорирована.")
+        return
+    await message.answer(format_status(tenant), parse_mode="HTML")
+
+
+def format_support_log(record: dict) -> str:
+    """Запись обращения из лога поддержки для чата поддержки."""
+    return "\n".join(f"<b>{escape(str(key))}:</b> {escape(str(value))}" for key, value in record.items())
+
+
+async def find_handler(message: types.Message, command: CommandObject, tenant: Tenant):
+    """Обрабатывает команду /find <id_query> — ищет обращение в логе (в партиции, архиве или старом листе)."""
+    if str(message.chat.id) != str(tenant.support_chat_id):
+        logger.warning(f"Команда /find из постороннего чата {message.chat.id} проигнорирована.")
+        return
+    id_query = (command.args or "").strip()
+    if not id_query:
+        await message.answer(FIND_USAGE_TEXT)
+        return
+    record = await find_support_log(id_query, sheet_name=tenant.google_sheet_name,
+                                    base_name=tenant.support_log_worksheet_name)
+    if record is None:
+        await message.answer(FIND_NOT_FOUND_TEXT.format(id_query=escape(id_query)), parse_mode="HTML")
+        return
+    await message.answer(format_support_log(record), parse_mode="HTML")
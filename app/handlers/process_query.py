@@ -1,16 +1,25 @@
 # Лучше назвать process_query.py
 
 from datetime import datetime
+from html import escape
+from typing import Optional
 
 import pytz
 from aiogram import Router, types
 from aiogram.fsm.context import FSMContext
 
-from app.bot_instance import bot
-from app.config import SUPPORT_CHAT_ID, TIMEZONE
+from app.config import (TIMEZONE, QUESTION_QUIET_WINDOW, QUESTION_MAX_MESSAGES,
+                        QUESTION_MAX_CHARS)
+from app.middlewares.admission import admission_control
+from app.services.faq_engine import faq_engine
+from app.services.question_aggregator import QuestionAggregator
+from app.services.support_notifier import notify_support
+from app.services.tenants import record_tenant_event, tenant_registry
 from app.stats import state_manager
 from app.stats.question_stats import QuestionStates
 from app.stats.state_manager import state_manager
+from app.utils.constants import FOLLOW_UP_ACCEPTED_TEXT
+from app.utils.formatters import truncate_text
 from app.utils.google_sheet_utils import add_support_log_to_sheet
 from app.utils.logger import setup_logger
 
@@ -21,11 +30,12 @@ router = Router()
 async def process_enter_query(message: types.Message, state: FSMContext):
     """
     Обрабатывает ввод вопроса пользователем в состоянии waiting_for_question.
-    Сохраняет данные, записывает в таблицу, уведомляет поддержку и переходит к следующему шагу.
+    Сообщения, отправленные подряд, копятся в question_aggregator и после паузы
+    обрабатываются одним обращением в handle_question.
     """
     current_state = await state.get_state()
-    # Доп. проверка, что мы точно в нужном состоянии
-    if current_state != QuestionStates.waiting_for_question.state:
+    # Доп. проверка, что мы точно в нужном состоянии (или вопрос еще копится/обрабатывается)
+    if current_state != QuestionStates.waiting_for_question.state and not question_aggregator.is_collecting(state.key):
         logger.warning(f"Получено сообщение от {message.from_user.id} в неожиданном состоянии: {current_state}. Ожидалось: {QuestionStates.waiting_for_question.state}")
         return
 
@@ -36,9 +46,87 @@ async def process_enter_query(message: types.Message, state: FSMContext):
         # Остаемся в том же состоянии, ждем корректный ввод
         return
 
-    query_text = message.text.strip()
-    user_id = message.from_user.id
-    user_name = message.from_user.username if message.from_user.username else message.from_user.first_name
+    # Пользователь часто пишет вопрос несколькими сообщениями подряд — копим их и создаем одно обращение
+    question_aggregator.add(message, state, message.text.strip())
+
+
+def question_in_progress(message: types.Message, state: FSMContext) -> bool:
+    """
+    Фильтр: вопрос пользователя еще копится или обрабатывается. Тогда сообщение — его продолжение,
+    даже если состояние уже сменилось (первая часть переполнилась и ушла в обработку).
+    """
+    return question_aggregator.is_collecting(state.key)
+
+
+async def handle_question_admitted(message: types.Message, state: FSMContext, query_text: str,
+                                   follow_up: bool = False, previous: Optional[str] = None) -> Optional[str]:
+    """
+    Склеенный вопрос обрабатывается уже после выхода из обработчика апдейта, поэтому слот
+    в контроле допуска и очередь пользователя он занимает сам — запись в таблицу
+    и уведомление подчиняются тем же ограничениям, что и апдейты.
+    """
+    tenant = tenant_registry.for_bot(message.bot)
+    async with admission_control.slot(tenant, message.from_user.id):
+        return await handle_question(message, state, query_text, follow_up, previous)
+
+
+async def handle_question(message: types.Message, state: FSMContext, query_text: str,
+                          follow_up: bool = False, previous: Optional[str] = None) -> Optional[str]:
+    """
+    Обрабатывает вопрос целиком (после склейки сообщений): предлагает ответы из FAQ
+    или сразу регистрирует обращение. Возвращает id_query созданного обращения.
+    follow_up — продолжение предыдущей части вопроса, previous — ее id_query.
+    """
+    current_state = await state.get_state()
+    if follow_up and current_state != QuestionStates.waiting_for_question.state:
+        return await handle_question_follow_up(message, state, query_text, current_state, previous)
+
+    # Пока копились сообщения, пользователь мог начать заново (/start)
+    if current_state != QuestionStates.waiting_for_question.state:
+        logger.info(f"Вопрос user {message.from_user.id} не обработан: состояние сменилось на {current_state}.")
+        return None
+
+    # Сначала пробуем найти готовый ответ в базе знаний — если он подойдет, обращение не создается
+    faq_matches = faq_engine.search(query_text)
+    if faq_matches:
+        logger.info(f"Для вопроса user {message.from_user.id} найдено {len(faq_matches)} ответов в FAQ: {[entry.id for entry, _ in faq_matches]}")
+        record_tenant_event(tenant_registry.for_bot(message.bot), "faq_offered")
+        await state.update_data(query=query_text, faq_matches=[entry.id for entry, _ in faq_matches])
+        await state_manager.handle_transition(message, state, "faq")
+        return None
+
+    return await submit_support_query(message, state, message.from_user, query_text)
+
+
+async def handle_question_follow_up(message: types.Message, state: FSMContext, query_text: str,
+                                    current_state: Optional[str], previous: Optional[str]) -> Optional[str]:
+    """Продолжение вопроса, первая часть которого уже обработана."""
+    if current_state == QuestionStates.waiting_for_faq_decision.state:
+        # Пользователь выбирает среди ответов FAQ — продолжение войдет в обращение, если он его создаст
+        user_data = await state.get_data()
+        await state.update_data(query=f"{user_data.get('query', '')}\n{query_text}")
+        logger.info(f"Продолжение вопроса user {message.from_user.id} добавлено к вопросу на выборе FAQ.")
+        return previous
+    if previous:
+        await submit_follow_up(message, message.from_user, previous, query_text)
+        return previous
+    logger.info(f"Продолжение вопроса user {message.from_user.id} не обработано: состояние {current_state}, "
+                f"первая часть не стала обращением.")
+    return None
+
+
+async def submit_support_query(message: types.Message, state: FSMContext, user: types.User,
+                               query_text: str) -> str:
+    """
+    Регистрирует обращение: сохраняет данные в state, записывает в таблицу,
+    уведомляет поддержку и переходит к показу сводки.
+    """
+    user_id = user.id
+    user_name = user.username if user.username else user.first_name
+    # Арендатор определяется по боту, получившему сообщение: от него зависят таблица и чат поддержки
+    bot = message.bot
+    tenant = tenant_registry.for_bot(bot)
+    record_tenant_event(tenant, "tickets")
 
     # Получаем текущую дату и время в нужном формате и зоне
     tz = pytz.timezone(TIMEZONE)
@@ -65,8 +153,6 @@ async def process_enter_query(message: types.Message, state: FSMContext):
 
     # --- Выполнение действий: Запись в таблицу и Уведомление ---
     # Эти действия выполняются ЗДЕСЬ, перед переходом к показу сводки
-
-    # 2. Попытка записи в Google Sheets
     sheet_log_data = {
         "date": date_str_sheet, # Дата для таблицы
         'user_id': str(user_id),
@@ -74,43 +160,75 @@ async def process_enter_query(message: types.Message, state: FSMContext):
         'query': query_text,
         'id_query': id_query # Добавь, если столбец есть в таблице и EXPECTED_HEADERS
     }
+    notification_body = (
+        f"<b>❗️ Новое обращение!</b>\n\n"
+        f"🆔 <b>ID Заявки:</b> {id_query}\n"
+        f"👤 <b>Пользователь:</b> {escape(user_name or '')} (ID: {user_id})\n"
+        f"📅 <b>Время:</b> {date_str_sheet}\n\n" # Используем время записи
+        f"📝 <b>Вопрос/Проблема:</b>\n{escape(truncate_text(query_text, QUESTION_MAX_CHARS))}\n"
+    )
+    await _record_and_notify(bot, tenant, sheet_log_data, notification_body)
+
+    # --- Конец выполнения действий ---
+
+    # 2. Переход к следующему состоянию через StateManager
+    # Следующее состояние покажет пользователю сводку
+    logger.debug(f"Запуск перехода в следующее состояние из process_enter_query для user {user_id}")
+    await state_manager.handle_transition(message, state, "next")
+    return id_query
+
+
+async def submit_follow_up(message: types.Message, user: types.User, id_query: str, query_text: str):
+    """
+    Регистрирует продолжение уже созданного обращения: отдельная строка в таблице с тем же id_query
+    и уведомление поддержки. Состояние FSM не меняется — диалог по обращению уже завершен.
+    """
+    bot = message.bot
+    tenant = tenant_registry.for_bot(bot)
+    user_name = user.username if user.username else user.first_name
+    date_str_sheet = datetime.now(pytz.timezone(TIMEZONE)).strftime('%Y-%m-%d %H:%M:%S')
+    logger.info(f"User {user.id} дополнил обращение {id_query}: '{query_text}'")
+
+    sheet_log_data = {
+        "date": date_str_sheet,
+        'user_id': str(user.id),
+        'user_name': user_name,
+        'query': f"[Дополнение] {query_text}",
+        'id_query': id_query
+    }
+    notification_body = (
+        f"<b>📎 Дополнение к обращению</b>\n\n"
+        f"🆔 <b>ID Заявки:</b> {id_query}\n"
+        f"👤 <b>Пользователь:</b> {escape(user_name or '')} (ID: {user.id})\n"
+        f"📅 <b>Время:</b> {date_str_sheet}\n\n"
+        f"📝 <b>Продолжение вопроса:</b>\n{escape(truncate_text(query_text, QUESTION_MAX_CHARS))}\n"
+    )
+    await _record_and_notify(bot, tenant, sheet_log_data, notification_body)
+    await message.answer(FOLLOW_UP_ACCEPTED_TEXT.format(id_query=id_query), parse_mode="HTML")
+
+
+async def _record_and_notify(bot, tenant, sheet_log_data: dict, notification_body: str):
+    """Записывает обращение в таблицу арендатора и уведомляет поддержку (при сбоях — через outbox)."""
+    user_id = sheet_log_data['user_id']
     try:
-        # Можно показать временное сообщение "Обрабатываю..."
-        # await message.answer("⏳ Минутку, обрабатываю ваш запрос...")
-        log_added = await add_support_log_to_sheet(sheet_log_data)
+        log_added = await add_support_log_to_sheet(sheet_log_data, tenant.google_sheet_name, tenant.support_log_worksheet_name)
         if log_added:
             logger.info(f"Вопрос user_id={user_id} успешно записан в Google Sheets.")
         else:
-            logger.error(f"Не удалось записать вопрос user_id={user_id} в Google Sheets (add_support_log_to_sheet вернул False).")
+            logger.warning(f"Вопрос user_id={user_id} не записан в Google Sheets сразу и отложен в outbox.")
     except Exception as log_err:
         logger.error(f"Ошибка при вызове add_support_log_to_sheet для user_id={user_id}: {log_err}", exc_info=True)
     # Ошибка записи не должна прерывать основной поток для пользователя
 
-    # 3. Отправка уведомления в чат поддержки
-    try:
-        if not SUPPORT_CHAT_ID:
-             logger.error("ID чата поддержки (SUPPORT_CHAT_ID) не настроен!")
-        else:
-            notification_body = (
-                f"<b>❗️ Новое обращение!</b>\n\n"
-                f"🆔 <b>ID Заявки:</b> {id_query}\n"
-                f"👤 <b>Пользователь:</b> {user_name} (ID: {user_id})\n"
-                f"📅 <b>Время:</b> {date_str_sheet}\n\n" # Используем время записи
-                f"📝 <b>Вопрос/Проблема:</b>\n{query_text}\n"
-            )
-            await bot.send_message(
-                chat_id=SUPPORT_CHAT_ID,
-                text=notification_body,
-                parse_mode="HTML",
-                disable_web_page_preview=True
-            )
-            logger.info(f"Уведомление об обращении user_id={user_id} отправлено в чат {SUPPORT_CHAT_ID}.")
-    except Exception as notify_err:
-        logger.error(f"Не удалось отправить уведомление в чат поддержки {SUPPORT_CHAT_ID} для user_id={user_id}: {notify_err}", exc_info=True)
+    # Отправка уведомления в чат поддержки (при недоступности уйдет в outbox)
+    if await notify_support(bot, tenant, notification_body):
+        logger.info(f"Уведомление об обращении user_id={user_id} отправлено в чат {tenant.support_chat_id}.")
 
-    # --- Конец выполнения действий ---
 
-    # 4. Переход к следующему состоянию через StateManager
-    # Следующее состояние покажет пользователю сводку
-    logger.debug(f"Запуск перехода в следующее состояние из process_enter_query для user {user_id}")
-    await state_manager.handle_transition(message, state, "next")
+# Инициализация question_aggregator для использования в остальной части проекта
+question_aggregator = QuestionAggregator(
+    handle_question_admitted,
+    quiet_window=QUESTION_QUIET_WINDOW,
+    max_messages=QUESTION_MAX_MESSAGES,
+    max_chars=QUESTION_MAX_CHARS,
+)
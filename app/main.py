@@ -2,14 +2,29 @@
 import asyncio
 import logging
 import sys # Добавь sys для логирования в stdout
+from typing import Awaitable, Callable, Dict, List
 
-# Используем общий экземпляр бота
-from bot_instance import bot
 from aiogram import Dispatcher, Bot
+from aiogram.fsm.context import FSMContext
+from aiogram.fsm.storage.base import StorageKey
 from aiogram.fsm.storage.memory import MemoryStorage
-from aiogram.types import BotCommand
+from aiogram.types import BotCommand, Message, Update
 
+# Боты всех арендаторов (с общей сессией aiohttp)
+from app.bot_instance import bots, session
+from app.config import (DRAIN_TIMEOUT, FAQ_RELOAD_INTERVAL, FSM_SNAPSHOT_MAX_AGE, FSM_SNAPSHOT_PATH,
+                        OUTBOX_FLUSH_INTERVAL)
 from app.handlers.dispatcher import setup_dispatcher
+from app.handlers.process_query import question_aggregator
+from app.middlewares.capture import capture_middleware
+from app.middlewares.inflight import RESTORED_UPDATE_KEY, inflight_middleware
+from app.services.faq_engine import faq_engine
+from app.services.fsm_snapshot import PendingWork, dump_question, dump_update, load_fsm_snapshot, save_fsm_snapshot
+from app.services.outbox import Outbox
+from app.services.question_aggregator import QuestionChunk
+from app.services.support_notifier import deliver_notification, get_notification_outbox
+from app.services.tenants import tenant_registry
+from app.utils.google_sheet_utils import deliver_support_log, get_sheets_outbox
 
 from app.utils.logger import setup_logger
 
@@ -24,6 +39,131 @@ async def set_default_commands(bot_instance: Bot): # Принимаем bot ка
     await bot_instance.set_my_commands(commands)
 
 
+async def prepare_bot(tenant_id: str, bot: Bot, drop_pending_updates: bool) -> bool:
+    """
+    Проверяет токен бота арендатора и готовит его к polling. Возвращает False, если бот
+    недоступен (например, токен отозван): такой арендатор пропускается, остальные работают.
+    """
+    try:
+        # Результат кешируется в боте, поэтому polling не повторит этот запрос и не упадет на нем
+        me = await bot.me()
+        await bot.delete_webhook(drop_pending_updates=drop_pending_updates)
+    except Exception as e:
+        logger.error(f"Бот арендатора '{tenant_id}' недоступен и не будет запущен: {e}", exc_info=True)
+        return False
+    try:
+        await set_default_commands(bot)
+    except Exception as e:
+        logger.warning(f"Не удалось установить команды бота арендатора '{tenant_id}': {e}")
+    logger.info(f"Бот арендатора '{tenant_id}' (@{me.username}) готов к работе.")
+    return True
+
+
+def deliver_parked_notification(item: dict):
+    return deliver_notification(bots.get(item["tenant_id"]), item)
+
+
+def get_outbox_handlers() -> Dict[Outbox, Callable[[dict], Awaitable]]:
+    """Outbox каждого арендатора (таблица и чат поддержки) с функцией повторной доставки его заданий."""
+    handlers = {}
+    for tenant in tenant_registry:
+        handlers[get_sheets_outbox(tenant.google_sheet_name)] = deliver_support_log
+        handlers[get_notification_outbox(tenant.id)] = deliver_parked_notification
+    return handlers
+
+
+async def drain(timeout: float) -> PendingWork:
+    """
+    Плавная остановка после выхода из polling (новые апдейты уже не принимаются):
+    ждем обработчики, которые еще работают, отправляем недописанные вопросы и пробуем
+    доставить отложенную работу. Все это укладывается в timeout секунд. Апдейты и части
+    вопросов, которые не успели обработаться, прерываются и возвращаются для снимка FSM —
+    их обработает следующий процесс; отложенная доставка остается в outbox на диске.
+    Обработка, прерванная на середине (например, во время записи в таблицу), будет повторена
+    целиком: повторная строка обращения лучше потерянного вопроса.
+    """
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    # Апдейты, полученные предыдущим процессом и не дошедшие до этого, тоже не должны вернуться повторно
+    pending_work = PendingWork(last_update_ids={**inflight_middleware.skip_until, **inflight_middleware.last_update_ids})
+
+    # Задачи обработки апдейтов, запущенные polling, и апдейты из снимка предыдущего процесса
+    handler_tasks = inflight_middleware.tasks()
+    if handler_tasks:
+        logger.info(f"Ожидание {len(handler_tasks)} обрабатываемых апдейтов...")
+        _, pending = await asyncio.wait(handler_tasks, timeout=max(0.0, deadline - loop.time()))
+        # В порядке получения, чтобы следующий процесс обработал их в том же порядке
+        for task in handler_tasks:
+            if task in pending:
+                pending_work.updates.append(dump_update(*inflight_middleware.get(task)))
+                task.cancel()
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
+            logger.warning(f"{len(pending)} апдейтов не успели обработаться и прерваны, "
+                           f"их обработает следующий процесс.")
+
+    if len(question_aggregator):
+        logger.info(f"Отправка {len(question_aggregator)} недописанных вопросов...")
+    unfinished = await question_aggregator.flush_all(timeout=max(0.0, deadline - loop.time()))
+    if unfinished:
+        pending_work.questions = [dump_question(chunk) for chunk in unfinished]
+        logger.warning(f"{len(unfinished)} частей вопросов не успели стать обращениями, "
+                       f"их обработает следующий процесс.")
+
+    for outbox, handler in get_outbox_handlers().items():
+        if not len(outbox):
+            continue
+        try:
+            await asyncio.wait_for(outbox.flush(handler), timeout=max(0.0, deadline - loop.time()))
+        except asyncio.TimeoutError:
+            pass
+        if len(outbox):
+            logger.warning(f"Outbox '{outbox.name}': {len(outbox)} заданий останутся до следующего запуска.")
+    return pending_work
+
+
+async def feed_restored_update(dp: Dispatcher, bot: Bot, update: Update):
+    try:
+        await dp.feed_update(bot, update, **{RESTORED_UPDATE_KEY: True})
+    except Exception as e:
+        logger.error(f"Ошибка при обработке апдейта {update.update_id} из снимка: {e}", exc_info=True)
+
+
+def resume_pending_work(dp: Dispatcher, storage: MemoryStorage, pending_work: PendingWork) -> List[asyncio.Task]:
+    """
+    Возобновляет работу, прерванную предыдущим процессом: сначала части вопросов (их сообщения
+    пришли раньше), затем апдейты — в исходном порядке. Возвращает задачи обработки апдейтов.
+    """
+    bots_by_id = {bot.id: bot for bot in bots.values()}
+    inflight_middleware.skip_until.update(pending_work.last_update_ids)
+
+    for item in pending_work.questions:
+        bot = bots_by_id.get(item["key"]["bot_id"])
+        if bot is None:
+            logger.error(f"Часть вопроса user {item['key']['user_id']} из снимка пропущена: бот не найден.")
+            continue
+        question_aggregator.resume(QuestionChunk(
+            message=Message.model_validate(item["message"], context={"bot": bot}),
+            state=FSMContext(storage=storage, key=StorageKey(**item["key"])),
+            parts=item["parts"],
+            chars=sum(len(part) for part in item["parts"]),
+            follow_up=item["follow_up"],
+            previous=item["previous"],
+        ))
+
+    tasks = []
+    for item in pending_work.updates:
+        bot = bots_by_id.get(item["bot_id"])
+        if bot is None:
+            logger.error(f"Апдейт {item['update'].get('update_id')} из снимка пропущен: бот {item['bot_id']} не найден.")
+            continue
+        update = Update.model_validate(item["update"], context={"bot": bot})
+        tasks.append(asyncio.create_task(feed_restored_update(dp, bot, update)))
+    if pending_work.questions or tasks:
+        logger.info(f"Возобновлено из снимка: {len(pending_work.questions)} частей вопросов, {len(tasks)} апдейтов.")
+    return tasks
+
+
 async def main():
     # Конфигурируем логирование
     logging.basicConfig(level=logging.INFO, stream=sys.stdout,
@@ -33,19 +173,55 @@ async def main():
     # Инициализация хранилища FSM
     storage = MemoryStorage()
     dp = Dispatcher(storage=storage)
+    # Состояния пользователей и незавершенная работа, сохраненные предыдущим процессом при остановке
+    restored = load_fsm_snapshot(storage, FSM_SNAPSHOT_PATH, FSM_SNAPSHOT_MAX_AGE) if FSM_SNAPSHOT_PATH else None
 
-    # Настройка обработчиков (передаем bot для единообразия, если другие хендлеры его ожидают)
+    # Настройка обработчиков — один диспетчер и одно хранилище FSM на всех арендаторов
     setup_dispatcher(dp)
-    await set_default_commands(bot) # Используем импортированный bot
 
+    # Загружаем базу знаний FAQ и следим за ее изменениями в фоне
+    await faq_engine.reload_if_changed()
+    faq_watcher = asyncio.create_task(faq_engine.watch(FAQ_RELOAD_INTERVAL)) if faq_engine.path else None
 
-    logger.info("Запуск polling...")
+    # Повторная доставка отложенных записей в таблицу и уведомлений в чат поддержки
+    outbox_flushers = [
+        asyncio.create_task(outbox.run(handler, OUTBOX_FLUSH_INTERVAL))
+        for outbox, handler in get_outbox_handlers().items()
+    ]
+
+    # Ссылки на задачи апдейтов из снимка держим до конца работы, иначе их может собрать сборщик мусора
+    restored_tasks: List[asyncio.Task] = []
     try:
-        await bot.delete_webhook(drop_pending_updates=True)
-        await dp.start_polling(bot, allowed_updates=dp.resolve_used_update_types())
+        # После передачи состояний от предыдущего процесса апдейты, пришедшие во время
+        # перезапуска, обрабатываем, а не выбрасываем (полученные им повторно пропустит inflight_middleware)
+        ready = await asyncio.gather(*(prepare_bot(tenant_id, bot, restored is None) for tenant_id, bot in bots.items()))
+        polling_bots = [bot for bot, is_ready in zip(bots.values(), ready) if is_ready]
+        if not polling_bots:
+            raise RuntimeError("Ни один бот арендаторов не удалось запустить")
+        if restored is not None:
+            restored_tasks.extend(resume_pending_work(dp, storage, restored))
+
+        logger.info(f"Запуск polling для {len(polling_bots)} из {len(bots)} ботов...")
+        # Сессию закрываем сами после drain: обработчикам еще нужно отвечать пользователям
+        await dp.start_polling(*polling_bots, allowed_updates=dp.resolve_used_update_types(), close_bot_session=False)
     finally:
         logger.info("Остановка бота...")
-        await bot.session.close()
+        if faq_watcher:
+            faq_watcher.cancel()
+        for flusher in outbox_flushers:
+            flusher.cancel()
+        pending_work = await drain(DRAIN_TIMEOUT)
+        if capture_middleware:
+            await capture_middleware.flush()
+        if FSM_SNAPSHOT_PATH:
+            try:
+                save_fsm_snapshot(storage, FSM_SNAPSHOT_PATH, pending_work)
+            except Exception as e:
+                logger.error(f"Не удалось сохранить снимок FSM: {e}", exc_info=True)
+        elif pending_work.updates or pending_work.questions:
+            logger.error(f"Снимок FSM выключен: {len(pending_work.updates)} апдейтов и "
+                         f"{len(pending_work.questions)} частей вопросов потеряны.")
+        await session.close()
         logger.info("Бот остановлен.")
 
 
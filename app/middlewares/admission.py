@@ -0,0 +1,209 @@
+# app/middlewares/admission.py
+"""Контроль допуска апдейтов: ограничение параллелизма и сброс нагрузки при всплесках."""
+
+import asyncio
+import time
+from collections import deque
+from contextlib import asynccontextmanager, nullcontext
+from typing import Any, Awaitable, Callable, Dict, Optional, Set
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject, Update
+
+from app.config import ADMISSION_MAX_CONCURRENCY, ADMISSION_MAX_PENDING_PER_USER, ADMISSION_MAX_QUEUE
+from app.utils.constants import BUSY_QUEUED_TEXT, OVERLOADED_TEXT
+from app.utils.logger import setup_logger
+
+logger = setup_logger(__name__)
+
+
+class AdmissionControlMiddleware(BaseMiddleware):
+    """
+    Внешний middleware для dp.update:
+      - не больше max_concurrency апдейтов обрабатываются одновременно;
+      - апдейты одного пользователя обрабатываются строго по очереди;
+      - ожидающих апдейтов не больше max_queue (и max_pending_per_user на пользователя),
+        остальные сразу отклоняются с коротким ответом.
+    outer_slots — общий семафор нескольких контролей (например, на весь процесс): слот
+    занимается и в нем, поэтому суммарный параллелизм не превышает его предела.
+    """
+
+    def __init__(self, max_concurrency: int, max_queue: int, max_pending_per_user: int,
+                 outer_slots: Optional[asyncio.Semaphore] = None):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.max_pending_per_user = max_pending_per_user
+
+        self._slots = asyncio.Semaphore(max_concurrency)
+        self._outer_slots = outer_slots
+        self._user_locks: Dict[int, asyncio.Lock] = {}
+        self._user_pending: Dict[int, int] = {}
+        self._waiting = 0
+        self._in_flight = 0
+        # Пользователи, которым уже сказали, что их сообщения ждут очереди, — до конца их ожидания
+        self._busy_notified: Set[int] = set()
+        self._reply_tasks: Set[asyncio.Task] = set()
+
+        # Метрики
+        self._admitted = 0
+        self._shed = 0
+        self._queue_times: deque = deque(maxlen=1000)  # секунды ожидания последних апдейтов
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: Update,
+        data: Dict[str, Any],
+    ) -> Any:
+        user = data.get("event_from_user")
+        user_id = user.id if user else None
+
+        if self._waiting >= self.max_queue or (
+            user_id is not None and self._user_pending.get(user_id, 0) >= self.max_pending_per_user
+        ):
+            self._shed += 1
+            logger.warning(f"Перегрузка: апдейт {event.update_id} от user {user_id} отклонен "
+                           f"(ожидают {self._waiting}, в работе {self._in_flight}).")
+            await self._reply(event, OVERLOADED_TEXT)
+            return None
+
+        if self.is_saturated() and event.message and user_id is not None and user_id not in self._busy_notified:
+            # Все слоты заняты — сообщаем, что сообщение принято и ждет очереди: один раз за ожидание
+            # и в фоне, чтобы при перегрузке не удваивать запросы к Telegram и не задерживать апдейт.
+            # На callback не отвечаем: ответить на него можно только один раз, это сделает обработчик
+            self._busy_notified.add(user_id)
+            task = asyncio.create_task(self._reply(event, BUSY_QUEUED_TEXT))
+            self._reply_tasks.add(task)
+            task.add_done_callback(self._reply_tasks.discard)
+
+        async with self.slot(user_id):
+            return await handler(event, data)
+
+    @asynccontextmanager
+    async def slot(self, user_id: Optional[int]):
+        """
+        Ждет своей очереди среди работы пользователя и свободный слот, без сброса нагрузки.
+        Используется и для апдейтов, и для отложенной работы (например, склеенного вопроса).
+        """
+        enqueued_at = time.monotonic()
+        waiting = True
+        self._waiting += 1
+        if user_id is not None:
+            self._user_pending[user_id] = self._user_pending.get(user_id, 0) + 1
+        try:
+            user_lock = self._user_locks.setdefault(user_id, asyncio.Lock()) if user_id is not None else None
+            async with user_lock if user_lock else nullcontext():
+                async with self._slots, self._outer_slots or nullcontext():
+                    waiting = False
+                    self._waiting -= 1
+                    self._queue_times.append(time.monotonic() - enqueued_at)
+                    self._admitted += 1
+                    self._in_flight += 1
+                    try:
+                        yield
+                    finally:
+                        self._in_flight -= 1
+        finally:
+            if waiting:
+                self._waiting -= 1
+            if user_id is not None:
+                self._user_pending[user_id] -= 1
+                if not self._user_pending[user_id]:
+                    # Никто из этого пользователя больше не ждет — освобождаем память
+                    del self._user_pending[user_id]
+                    self._user_locks.pop(user_id, None)
+                    self._busy_notified.discard(user_id)
+
+    def is_saturated(self) -> bool:
+        """Свободного слота нет — новый апдейт будет ждать."""
+        return self._slots.locked() or (self._outer_slots is not None and self._outer_slots.locked())
+
+    @staticmethod
+    async def _reply(event: Update, text: str):
+        """Быстрый ответ пользователю без захода в обработчики."""
+        try:
+            if event.message:
+                await event.message.answer(text)
+            elif event.callback_query:
+                await event.callback_query.answer(text)
+        except Exception as e:
+            logger.warning(f"Не удалось отправить ответ о перегрузке для апдейта {event.update_id}: {e}")
+
+    def snapshot(self) -> dict:
+        """Метрики для мониторинга, время ожидания в миллисекундах."""
+        queue_times = sorted(self._queue_times)
+
+        def percentile(p: float) -> float:
+            if not queue_times:
+                return 0.0
+            return round(queue_times[min(len(queue_times) - 1, int(p * len(queue_times)))] * 1000, 1)
+
+        return {
+            "in_flight": self._in_flight,
+            "waiting": self._waiting,
+            "max_concurrency": self.max_concurrency,
+            "max_queue": self.max_queue,
+            "admitted": self._admitted,
+            "shed": self._shed,
+            "queue_time_p50_ms": percentile(0.5),
+            "queue_time_p95_ms": percentile(0.95),
+            "queue_time_max_ms": round(queue_times[-1] * 1000, 1) if queue_times else 0.0,
+        }
+
+
+class TenantAdmissionMiddleware(BaseMiddleware):
+    """
+    Отдельный AdmissionControlMiddleware на каждого арендатора (data['tenant']),
+    чтобы всплеск у одного бренда не забирал слоты и очередь у остальных.
+    Поверх лимитов арендаторов действует общий лимит процесса max_concurrency:
+    ресурсы (пул соединений, CPU, потоки для gspread) у всех арендаторов общие.
+    """
+
+    def __init__(self, max_concurrency: int, max_queue: int, max_pending_per_user: int):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.max_pending_per_user = max_pending_per_user
+        self._global_slots = asyncio.Semaphore(max_concurrency)
+        self._controls: Dict[str, AdmissionControlMiddleware] = {}
+
+    def get(self, tenant) -> AdmissionControlMiddleware:
+        control = self._controls.get(tenant.id)
+        if control is None:
+            control = self._controls[tenant.id] = AdmissionControlMiddleware(
+                max_concurrency=tenant.max_concurrency,
+                max_queue=self.max_queue,
+                max_pending_per_user=self.max_pending_per_user,
+                outer_slots=self._global_slots,
+            )
+        return control
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: Update,
+        data: Dict[str, Any],
+    ) -> Any:
+        return await self.get(data["tenant"])(handler, event, data)
+
+    def slot(self, tenant, user_id: Optional[int]):
+        """Слот в контроле допуска арендатора (см. AdmissionControlMiddleware.slot)."""
+        return self.get(tenant).slot(user_id)
+
+    def snapshot(self) -> Dict[str, dict]:
+        """Метрики по арендаторам."""
+        return {tenant_id: control.snapshot() for tenant_id, control in self._controls.items()}
+
+    def global_snapshot(self) -> dict:
+        """Загрузка общего лимита процесса."""
+        return {
+            "in_flight": sum(control._in_flight for control in self._controls.values()),
+            "max_concurrency": self.max_concurrency,
+        }
+
+
+# Инициализация admission_control для использования в остальной части проекта
+admission_control = TenantAdmissionMiddleware(
+    max_concurrency=ADMISSION_MAX_CONCURRENCY,
+    max_queue=ADMISSION_MAX_QUEUE,
+    max_pending_per_user=ADMISSION_MAX_PENDING_PER_USER,
+)
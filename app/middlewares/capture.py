@@ -0,0 +1,136 @@
+# app/middlewares/capture.py
+"""Запись входящих апдейтов в сжатый JSON Lines для последующего воспроизведения (app/tools/replay.py)."""
+
+import asyncio
+import gzip
+import hashlib
+import json
+import time
+from typing import Any, Awaitable, Callable, Dict, List
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject, Update
+
+from app.config import CAPTURE_FILE_PATH, CAPTURE_SALT
+from app.middlewares.inflight import RESTORED_UPDATE_KEY
+from app.services.tenants import tenant_registry
+from app.utils.logger import setup_logger
+
+logger = setup_logger(__name__)
+
+# Объекты апдейта, в которых лежат данные пользователя
+_USER_KEYS = ("from", "user", "chat", "sender_chat", "sender_user", "forward_from", "left_chat_member")
+_USER_LIST_KEYS = ("new_chat_members",)
+_NAME_FIELDS = ("first_name", "last_name", "username", "title")
+# Поля с личными данными вне объектов пользователя: обязательные заменяются заглушкой, остальные удаляются
+_PLACEHOLDER_FIELDS = {"phone_number": "0", "sender_user_name": "user"}
+_DROPPED_FIELDS = ("vcard",)
+
+
+def hash_user_id(user_id: int, salt: str) -> int:
+    """Стабильно заменяет id пользователя: один и тот же id с той же солью дает тот же результат."""
+    digest = hashlib.sha256(f"{salt}:{user_id}".encode()).digest()
+    return int.from_bytes(digest[:6], "big")
+
+
+def _anonymize_user(key: str, value: dict, salt: str) -> dict:
+    value = dict(value)
+    if isinstance(value.get("id"), int) and (key != "chat" or value.get("type") == "private"):
+        value["id"] = hash_user_id(value["id"], salt)
+    for name_field in _NAME_FIELDS:
+        if name_field in value:
+            value[name_field] = "user" if name_field == "first_name" else None
+    return {k: v for k, v in value.items() if v is not None}
+
+
+def anonymize_update(raw: Any, salt: str) -> Any:
+    """
+    Хеширует id пользователей и личных чатов и убирает имена, телефоны и другие личные данные
+    (в том числе из контактов и пересланных сообщений). Id групп (например, чата поддержки)
+    не меняются. Текст сообщений сохраняется — он нужен для воспроизведения.
+    """
+    if isinstance(raw, list):
+        return [anonymize_update(item, salt) for item in raw]
+    if not isinstance(raw, dict):
+        return raw
+
+    result = {}
+    for key, value in raw.items():
+        if key in _USER_KEYS and isinstance(value, dict):
+            result[key] = _anonymize_user(key, value, salt)
+        elif key in _USER_LIST_KEYS and isinstance(value, list):
+            result[key] = [_anonymize_user(key, user, salt) if isinstance(user, dict) else user for user in value]
+        elif key == "contact" and isinstance(value, dict):
+            # id контакта — тот же пользователь, что и в from, поэтому хешируется так же
+            contact = _anonymize_user(key, anonymize_update(value, salt), salt)
+            if isinstance(contact.get("user_id"), int):
+                contact["user_id"] = hash_user_id(contact["user_id"], salt)
+            result[key] = contact
+        elif key in _PLACEHOLDER_FIELDS:
+            result[key] = _PLACEHOLDER_FIELDS[key]
+        elif key in _DROPPED_FIELDS:
+            continue
+        else:
+            result[key] = anonymize_update(value, salt)
+    return result
+
+
+class CaptureMiddleware(BaseMiddleware):
+    """
+    Внешний middleware для dp.update: записывает каждый апдейт (до всех проверок и ограничений)
+    с временем получения и арендатором. Запись на диск идет пачками в отдельном потоке.
+    """
+
+    def __init__(self, path: str, salt: str, batch_size: int = 100, flush_interval: float = 5.0):
+        self.path = path
+        self.salt = salt
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._buffer: List[str] = []
+        self._last_flush = time.monotonic()
+        self._write_lock = asyncio.Lock()
+        self._pending_writes = set()
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: Update,
+        data: Dict[str, Any],
+    ) -> Any:
+        if data.get(RESTORED_UPDATE_KEY):
+            # Апдейт из снимка уже записан предыдущим процессом
+            return await handler(event, data)
+        try:
+            tenant = tenant_registry.for_bot(data["bot"])
+            record = {
+                "ts": time.time(),
+                "tenant": tenant.id if tenant else None,
+                "update": anonymize_update(event.model_dump(mode="json", exclude_none=True, by_alias=True), self.salt),
+            }
+            self._buffer.append(json.dumps(record, ensure_ascii=False))
+            if len(self._buffer) >= self.batch_size or time.monotonic() - self._last_flush >= self.flush_interval:
+                self._last_flush = time.monotonic()
+                task = asyncio.create_task(self.flush())
+                self._pending_writes.add(task)
+                task.add_done_callback(self._pending_writes.discard)
+        except Exception as e:
+            # Запись трафика не должна мешать обработке
+            logger.warning(f"Не удалось записать апдейт {event.update_id}: {e}")
+        return await handler(event, data)
+
+    async def flush(self):
+        """Дописывает накопленные апдейты в файл (gzip допускает дописывание новыми блоками)."""
+        async with self._write_lock:
+            if not self._buffer:
+                return
+            lines, self._buffer = self._buffer, []
+            await asyncio.to_thread(self._write, lines)
+
+    def _write(self, lines: List[str]):
+        with gzip.open(self.path, "at", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+        logger.debug(f"Записано {len(lines)} апдейтов в {self.path}")
+
+
+# Инициализация capture_middleware (None, если запись трафика выключена)
+capture_middleware = CaptureMiddleware(CAPTURE_FILE_PATH, CAPTURE_SALT) if CAPTURE_FILE_PATH else None
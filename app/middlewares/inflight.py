@@ -0,0 +1,66 @@
+# app/middlewares/inflight.py
+"""Учет апдейтов в обработке: для плавной остановки и передачи незавершенной работы следующему процессу."""
+
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, List, Tuple
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject, Update
+
+from app.utils.logger import setup_logger
+
+logger = setup_logger(__name__)
+
+# Ключ data, которым помечаются апдейты, возвращенные из снимка предыдущего процесса
+RESTORED_UPDATE_KEY = "restored_update"
+
+
+class InFlightMiddleware(BaseMiddleware):
+    """
+    Внешний middleware для dp.update, самый первый:
+      - помнит задачу обработки каждого апдейта вместе с ботом и самим апдейтом — при остановке
+        незавершенные апдейты сохраняются в снимок и обрабатываются следующим процессом;
+      - помнит последний полученный апдейт каждого бота, а после передачи работы от предыдущего
+        процесса пропускает апдейты, которые тот уже получил (skip_until). Telegram подтверждает
+        получение только следующим getUpdates, поэтому последнюю пачку апдейтов перед остановкой
+        он отдаст новому процессу еще раз.
+    """
+
+    def __init__(self):
+        self._tasks: Dict[asyncio.Task, Tuple[int, Update]] = {}
+        self.last_update_ids: Dict[int, int] = {}  # id бота -> последний полученный update_id
+        self.skip_until: Dict[int, int] = {}  # id бота -> последний update_id, полученный предыдущим процессом
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: Update,
+        data: Dict[str, Any],
+    ) -> Any:
+        bot_id = data["bot"].id
+        if not data.get(RESTORED_UPDATE_KEY):
+            if event.update_id <= self.skip_until.get(bot_id, -1):
+                logger.info(f"Апдейт {event.update_id} бота {bot_id} уже получен предыдущим процессом, пропускаем.")
+                return None
+            self.last_update_ids[bot_id] = max(event.update_id, self.last_update_ids.get(bot_id, -1))
+
+        task = asyncio.current_task()
+        self._tasks[task] = (bot_id, event)
+        try:
+            return await handler(event, data)
+        finally:
+            self._tasks.pop(task, None)
+
+    def __len__(self):
+        return len(self._tasks)
+
+    def tasks(self) -> List[asyncio.Task]:
+        return list(self._tasks)
+
+    def get(self, task: asyncio.Task) -> Tuple[int, Update]:
+        """(id бота, апдейт) задачи, которая еще обрабатывается."""
+        return self._tasks[task]
+
+
+# Инициализация inflight_middleware для использования в остальной части проекта
+inflight_middleware = InFlightMiddleware()
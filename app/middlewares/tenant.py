@@ -0,0 +1,30 @@
+# app/middlewares/tenant.py
+"""Определение арендатора по боту, получившему апдейт."""
+
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject, Update
+
+from app.services.tenants import record_tenant_event, tenant_registry
+from app.utils.logger import setup_logger
+
+logger = setup_logger(__name__)
+
+
+class TenantMiddleware(BaseMiddleware):
+    """Внешний middleware для dp.update: кладет в data['tenant'] настройки арендатора бота."""
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: Update,
+        data: Dict[str, Any],
+    ) -> Any:
+        tenant = tenant_registry.for_bot(data["bot"])
+        if tenant is None:
+            logger.error(f"Апдейт {event.update_id} от неизвестного бота {data['bot'].id} пропущен.")
+            return None
+        data["tenant"] = tenant
+        record_tenant_event(tenant, "updates")
+        return await handler(event, data)
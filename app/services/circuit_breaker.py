@@ -0,0 +1,172 @@
+# app/services/circuit_breaker.py
+"""Предохранитель (circuit breaker) для внешних сервисов: Google Sheets, чат поддержки."""
+
+import time
+from collections import deque
+from enum import Enum
+from typing import Awaitable, Callable, Dict, Tuple, Type
+
+from app.utils.logger import setup_logger
+
+logger = setup_logger(__name__)
+
+
+class CircuitState(str, Enum):
+    CLOSED = "closed"        # вызовы проходят, ошибки считаются
+    OPEN = "open"            # вызовы сразу отклоняются
+    HALF_OPEN = "half_open"  # пропускаются пробные вызовы
+
+
+class CircuitOpenError(Exception):
+    """Вызов отклонен без обращения к сервису, потому что предохранитель разомкнут."""
+
+    def __init__(self, name: str):
+        super().__init__(f"Предохранитель '{name}' разомкнут")
+        self.name = name
+
+
+class CircuitBreaker:
+    """
+    Размыкается, когда в окне последних вызовов доля ошибок или медленных вызовов
+    превышает порог. Через open_timeout пропускает пробные вызовы (half-open):
+    успешные пробы замыкают цепь, неудачная — снова размыкает.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        failure_rate_threshold: float = 0.5,
+        slow_call_seconds: float = 5.0,
+        slow_call_rate_threshold: float = 0.8,
+        window_size: int = 20,
+        min_calls: int = 5,
+        open_timeout: float = 30.0,
+        half_open_max_calls: int = 1,
+        ignore_exceptions: Tuple[Type[BaseException], ...] = (),
+    ):
+        self.name = name
+        self.failure_rate_threshold = failure_rate_threshold
+        self.slow_call_seconds = slow_call_seconds
+        self.slow_call_rate_threshold = slow_call_rate_threshold
+        self.min_calls = min_calls
+        self.open_timeout = open_timeout
+        self.half_open_max_calls = half_open_max_calls
+        # Ошибки, которые не говорят о недоступности сервиса (например, неверный запрос)
+        self.ignore_exceptions = ignore_exceptions
+
+        self._window: deque = deque(maxlen=window_size)  # (ошибка, медленный вызов)
+        self._state = CircuitState.CLOSED
+        self._opened_at = 0.0
+        self._probes_in_flight = 0
+        self._probe_successes = 0
+        self._rejected = 0
+
+        circuit_breakers[name] = self
+
+    @property
+    def state(self) -> CircuitState:
+        if self._state == CircuitState.OPEN and time.monotonic() - self._opened_at >= self.open_timeout:
+            self._transition(CircuitState.HALF_OPEN)
+        return self._state
+
+    def allow_request(self) -> bool:
+        """Проверяет, можно ли выполнить вызов, и резервирует пробу в состоянии half-open."""
+        state = self.state
+        if state == CircuitState.CLOSED:
+            return True
+        if state == CircuitState.HALF_OPEN and self._probes_in_flight < self.half_open_max_calls:
+            self._probes_in_flight += 1
+            return True
+        self._rejected += 1
+        return False
+
+    async def call(self, func: Callable[..., Awaitable], *args, **kwargs):
+        """Выполняет корутину через предохранитель. При разомкнутой цепи сразу бросает CircuitOpenError."""
+        if not self.allow_request():
+            raise CircuitOpenError(self.name)
+
+        started = time.monotonic()
+        try:
+            result = await func(*args, **kwargs)
+        except self.ignore_exceptions:
+            self._record(failed=False, duration=time.monotonic() - started)
+            raise
+        except Exception:
+            self._record(failed=True, duration=time.monotonic() - started)
+            raise
+        except BaseException:
+            # Вызов отменен (например, при остановке) — о сервисе это ничего не говорит,
+            # но занятую пробу нужно вернуть, иначе half-open больше не пропустит ни одного вызова
+            self._release_probe()
+            raise
+        self._record(failed=False, duration=time.monotonic() - started)
+        return result
+
+    def _release_probe(self):
+        if self._state == CircuitState.HALF_OPEN:
+            self._probes_in_flight = max(0, self._probes_in_flight - 1)
+
+    def _record(self, failed: bool, duration: float):
+        slow = duration >= self.slow_call_seconds
+
+        if self._state == CircuitState.HALF_OPEN:
+            self._probes_in_flight = max(0, self._probes_in_flight - 1)
+            if failed or slow:
+                self._transition(CircuitState.OPEN)
+                return
+            self._probe_successes += 1
+            if self._probe_successes >= self.half_open_max_calls:
+                self._transition(CircuitState.CLOSED)
+            return
+
+        self._window.append((failed, slow))
+        if self._state == CircuitState.CLOSED and len(self._window) >= self.min_calls:
+            failure_rate, slow_call_rate = self._rates()
+            if failure_rate >= self.failure_rate_threshold or slow_call_rate >= self.slow_call_rate_threshold:
+                self._transition(CircuitState.OPEN)
+
+    def _rates(self) -> Tuple[float, float]:
+        calls = len(self._window)
+        if not calls:
+            return 0.0, 0.0
+        return (sum(1 for failed, _ in self._window if failed) / calls,
+                sum(1 for _, slow in self._window if slow) / calls)
+
+    def _transition(self, new_state: CircuitState):
+        if new_state == self._state:
+            return
+        old_state = self._state
+        self._state = new_state
+        self._probes_in_flight = 0
+        self._probe_successes = 0
+        if new_state == CircuitState.OPEN:
+            self._opened_at = time.monotonic()
+            logger.warning(f"Предохранитель '{self.name}': {old_state.value} -> open на {self.open_timeout} сек.")
+        elif new_state == CircuitState.CLOSED:
+            self._window.clear()
+            logger.info(f"Предохранитель '{self.name}': {old_state.value} -> closed, сервис восстановлен.")
+        else:
+            logger.info(f"Предохранитель '{self.name}': {old_state.value} -> half_open, пропускаем пробные вызовы.")
+
+    def snapshot(self) -> dict:
+        """Состояние для мониторинга."""
+        failure_rate, slow_call_rate = self._rates()
+        state = self.state
+        return {
+            "name": self.name,
+            "state": state.value,
+            "failure_rate": round(failure_rate, 3),
+            "slow_call_rate": round(slow_call_rate, 3),
+            "calls_in_window": len(self._window),
+            "rejected": self._rejected,
+            "open_for_seconds": round(time.monotonic() - self._opened_at, 1) if state != CircuitState.CLOSED else 0.0,
+        }
+
+
+# Все созданные предохранители по имени — для мониторинга
+circuit_breakers: Dict[str, CircuitBreaker] = {}
+
+
+def get_circuit_breakers_state():
+    """Возвращает состояние всех предохранителей."""
+    return [breaker.snapshot() for breaker in circuit_breakers.values()]
@@ -0,0 +1,216 @@
+# app/services/faq_engine.py
+"""FAQ-движок: поиск готовых ответов по базе знаний через TF-IDF."""
+
+import asyncio
+import csv
+import os
+import re
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import yaml
+from scipy import sparse
+
+from app.config import FAQ_FILE_PATH, FAQ_MIN_SCORE, FAQ_TOP_K
+from app.utils.logger import setup_logger
+
+logger = setup_logger(__name__)
+
+_TOKEN_RE = re.compile(r"[a-zа-я0-9]+")
+
+# Частые служебные слова, которые не несут смысла для поиска
+RUSSIAN_STOPWORDS = frozenset("""
+и в во не что он на я с со как а то все она так его но да ты к у же вы за бы по только ее мне было
+вот от меня еще нет о из ему теперь когда даже ну вдруг ли если уже или ни быть был него до вас
+нибудь опять уж вам ведь там потом себя ничего ей может они тут где есть надо ней для мы тебя их
+чем была сам чтоб без будто чего раз тоже себе под будет ж тогда кто этот того потому этого какой
+совсем ним здесь этом один почти мой тем чтобы нее сейчас были куда зачем всех никогда можно при
+наконец два об другой хоть после над больше тот через эти нас про всего них какая много разве три
+эту моя впрочем хорошо свою этой перед иногда лучше чуть том нельзя такой им более всегда конечно
+всю между это мое мои ваш ваша ваше ваши у меня пожалуйста здравствуйте привет добрый день
+""".split())
+
+# Окончания русских слов (от длинных к коротким) — упрощенный стемминг
+RUSSIAN_SUFFIXES = tuple(sorted("""
+ивши ывши вшись ующий ующая ующее ующие ими ыми его ого ему ому ее ие ые ое ей ий ый ой ем им ым
+ом их ых ую юю ая яя ою ею ам ям ах ях ами ями ия ья ие ье ию ью ев ов ете ите ишь ешь ить ать ять
+еть уть ться тся ет ит ут ют ат ят ть ся сь а е и й о у ы ь ю я
+""".split(), key=len, reverse=True))
+
+MIN_STEM_LENGTH = 3
+
+
+def _stem(word: str) -> str:
+    """Отрезает типичное русское окончание, если остается достаточно длинная основа."""
+    for suffix in RUSSIAN_SUFFIXES:
+        if word.endswith(suffix) and len(word) - len(suffix) >= MIN_STEM_LENGTH:
+            return word[:-len(suffix)]
+    return word
+
+
+def tokenize(text: str) -> List[str]:
+    """Разбивает текст на нормализованные токены (нижний регистр, ё -> е, стемминг, без стоп-слов)."""
+    text = text.lower().replace("ё", "е")
+    return [_stem(token) for token in _TOKEN_RE.findall(text) if token not in RUSSIAN_STOPWORDS]
+
+
+@dataclass(frozen=True)
+class FaqEntry:
+    id: str
+    question: str
+    answer: str
+
+
+@dataclass(frozen=True)
+class _FaqIndex:
+    """Неизменяемый снимок индекса — подменяется целиком при перезагрузке."""
+    entries: Tuple[FaqEntry, ...]
+    by_id: Dict[str, FaqEntry]
+    vocabulary: Dict[str, int]
+    idf: np.ndarray
+    matrix: sparse.csr_matrix  # (кол-во записей x размер словаря), строки нормированы по L2
+
+
+def _read_entries(path: str) -> List[FaqEntry]:
+    """Читает базу знаний из CSV (колонки id, question, answer) или YAML (список словарей)."""
+    extension = os.path.splitext(path)[1].lower()
+    if extension in (".yaml", ".yml"):
+        with open(path, encoding="utf-8") as f:
+            rows = yaml.safe_load(f) or []
+    elif extension == ".csv":
+        with open(path, encoding="utf-8", newline="") as f:
+            rows = list(csv.DictReader(f))
+    else:
+        raise ValueError(f"Неподдерживаемый формат базы знаний FAQ: {path}")
+
+    entries = []
+    for number, row in enumerate(rows, start=1):
+        question = str(row.get("question") or "").strip()
+        answer = str(row.get("answer") or "").strip()
+        if not question or not answer:
+            logger.warning(f"Запись FAQ №{number} пропущена: нет вопроса или ответа.")
+            continue
+        entry_id = str(row.get("id") or number).strip()
+        entries.append(FaqEntry(id=entry_id, question=question, answer=answer))
+    return entries
+
+
+def _build_index(entries: List[FaqEntry]) -> _FaqIndex:
+    """Строит разреженную TF-IDF матрицу по вопросам и ответам базы знаний."""
+    vocabulary: Dict[str, int] = {}
+    rows, cols, values = [], [], []
+    for row, entry in enumerate(entries):
+        # Вопрос важнее ответа, поэтому учитываем его токены дважды
+        tokens = tokenize(entry.question) * 2 + tokenize(entry.answer)
+        counts: Dict[int, int] = {}
+        for token in tokens:
+            col = vocabulary.setdefault(token, len(vocabulary))
+            counts[col] = counts.get(col, 0) + 1
+        for col, count in counts.items():
+            rows.append(row)
+            cols.append(col)
+            values.append(1.0 + np.log(count))  # сублинейный TF
+
+    shape = (len(entries), len(vocabulary))
+    tf = sparse.csr_matrix((values, (rows, cols)), shape=shape, dtype=np.float64)
+
+    # Сглаженный IDF: log((1 + N) / (1 + df)) + 1
+    df = np.bincount(tf.indices, minlength=shape[1])
+    idf = np.log((1.0 + shape[0]) / (1.0 + df)) + 1.0
+    matrix = tf.multiply(idf).tocsr()
+
+    norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+    norms[norms == 0] = 1.0
+    matrix = sparse.diags(1.0 / norms).dot(matrix).tocsr()
+
+    return _FaqIndex(
+        entries=tuple(entries),
+        by_id={entry.id: entry for entry in entries},
+        vocabulary=vocabulary,
+        idf=idf,
+        matrix=matrix,
+    )
+
+
+class FaqEngine:
+    """
+    Поиск похожих вопросов в базе знаний.
+
+    Индекс строится в отдельном потоке и подменяется одной операцией присваивания,
+    поэтому поиск никогда не видит частично собранный индекс и не блокирует цикл событий.
+    """
+
+    def __init__(self, path: Optional[str], top_k: int = 3, min_score: float = 0.3):
+        self.path = path
+        self.top_k = top_k
+        self.min_score = min_score
+        self._index: Optional[_FaqIndex] = None
+        self._mtime: Optional[float] = None
+
+    @property
+    def enabled(self) -> bool:
+        return self._index is not None and len(self._index.entries) > 0
+
+    def get(self, entry_id: str) -> Optional[FaqEntry]:
+        index = self._index
+        return index.by_id.get(entry_id) if index else None
+
+    def search(self, text: str, top_k: Optional[int] = None) -> List[Tuple[FaqEntry, float]]:
+        """Возвращает до top_k записей, чья косинусная близость к тексту не ниже min_score."""
+        index = self._index
+        if index is None or not index.entries:
+            return []
+
+        counts: Dict[int, int] = {}
+        for token in tokenize(text):
+            col = index.vocabulary.get(token)
+            if col is not None:
+                counts[col] = counts.get(col, 0) + 1
+        if not counts:
+            return []
+
+        cols = np.fromiter(counts.keys(), dtype=np.int64, count=len(counts))
+        weights = (1.0 + np.log(np.fromiter(counts.values(), dtype=np.float64, count=len(counts)))) * index.idf[cols]
+        weights /= np.linalg.norm(weights)
+        query = sparse.csr_matrix((weights, (np.zeros_like(cols), cols)), shape=(1, len(index.vocabulary)))
+
+        scores = index.matrix.dot(query.T).toarray().ravel()
+        k = min(top_k or self.top_k, len(scores))
+        best = np.argpartition(-scores, k - 1)[:k]
+        best = best[np.argsort(-scores[best])]
+        return [(index.entries[i], float(scores[i])) for i in best if scores[i] >= self.min_score]
+
+    async def reload_if_changed(self) -> bool:
+        """Перечитывает базу знаний, если файл изменился. Индекс собирается вне цикла событий."""
+        if not self.path:
+            return False
+        try:
+            mtime = os.path.getmtime(self.path)
+        except OSError as e:
+            logger.warning(f"Файл базы знаний FAQ '{self.path}' недоступен: {e}")
+            return False
+        if mtime == self._mtime:
+            return False
+
+        try:
+            index = await asyncio.to_thread(lambda: _build_index(_read_entries(self.path)))
+        except Exception as e:
+            # Оставляем прежний индекс — лучше старые ответы, чем никаких
+            logger.error(f"Ошибка при загрузке базы знаний FAQ '{self.path}': {e}", exc_info=True)
+            return False
+
+        self._index = index
+        self._mtime = mtime
+        logger.info(f"База знаний FAQ загружена: {len(index.entries)} записей, словарь {len(index.vocabulary)} токенов.")
+        return True
+
+    async def watch(self, interval: float):
+        """Периодически проверяет файл базы знаний и перезагружает его при изменении."""
+        while True:
+            await asyncio.sleep(interval)
+            await self.reload_if_changed()
+
+
+# Инициализация faq_engine для использования в остальной части проекта
+faq_engine = FaqEngine(FAQ_FILE_PATH, top_k=FAQ_TOP_K, min_score=FAQ_MIN_SCORE)
@@ -0,0 +1,114 @@
+# app/services/fsm_snapshot.py
+"""
+Снимок состояний FSM из MemoryStorage и незавершенной работы (апдейтов и частей вопросов,
+прерванных при остановке): сохраняется при остановке и загружается при запуске.
+"""
+
+import dataclasses
+import gzip
+import json
+import os
+import time
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+from aiogram.fsm.storage.base import StorageKey
+from aiogram.fsm.storage.memory import MemoryStorage, MemoryStorageRecord
+from aiogram.types import Update
+
+from app.services.question_aggregator import QuestionChunk
+
+from app.utils.logger import setup_logger
+
+logger = setup_logger(__name__)
+
+_SNAPSHOT_VERSION = 1
+
+
+@dataclass
+class PendingWork:
+    """Работа, которую процесс не успел выполнить до остановки и передает следующему."""
+    updates: List[dict] = field(default_factory=list)  # {"bot_id", "update"} в порядке получения
+    questions: List[dict] = field(default_factory=list)  # части вопросов, см. dump_question
+    last_update_ids: Dict[int, int] = field(default_factory=dict)  # id бота -> последний полученный update_id
+    restored_states: int = 0  # сколько состояний FSM восстановлено из снимка
+
+
+def dump_update(bot_id: int, update: Update) -> dict:
+    return {"bot_id": bot_id, "update": update.model_dump(mode="json", exclude_none=True, by_alias=True)}
+
+
+def dump_question(chunk: QuestionChunk) -> dict:
+    return {
+        "key": dataclasses.asdict(chunk.state.key),
+        "message": chunk.message.model_dump(mode="json", exclude_none=True, by_alias=True),
+        "parts": chunk.parts,
+        "follow_up": chunk.follow_up,
+        "previous": chunk.previous,
+    }
+
+
+def save_fsm_snapshot(storage: MemoryStorage, path: str, pending: Optional[PendingWork] = None) -> int:
+    """
+    Записывает непустые записи хранилища (ключ, состояние, данные) и незавершенную работу
+    в сжатый JSON. Файл подменяется атомарно. Возвращает число сохраненных записей.
+    """
+    pending = pending or PendingWork()
+    records = [
+        {"key": dataclasses.asdict(key), "state": record.state, "data": record.data}
+        for key, record in storage.storage.items()
+        if record.state is not None or record.data
+    ]
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with gzip.open(tmp_path, "wt", encoding="utf-8") as f:
+        json.dump({
+            "version": _SNAPSHOT_VERSION,
+            "saved_at": time.time(),
+            "records": records,
+            "updates": pending.updates,
+            "questions": pending.questions,
+            "last_update_ids": pending.last_update_ids,
+        }, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+    logger.info(f"Снимок FSM сохранен в {path}: {len(records)} записей, {len(pending.updates)} незавершенных "
+                f"апдейтов, {len(pending.questions)} необработанных частей вопросов.")
+    return len(records)
+
+
+def load_fsm_snapshot(storage: MemoryStorage, path: str, max_age: Optional[float] = None) -> Optional[PendingWork]:
+    """
+    Восстанавливает записи из снимка в хранилище и удаляет файл, чтобы после аварийного
+    перезапуска не вернуть устаревшие состояния. Снимок старше max_age секунд отбрасывается.
+    Возвращает незавершенную работу предыдущего процесса или None, если снимка нет.
+    """
+    if not os.path.exists(path):
+        return None
+    try:
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            snapshot = json.load(f)
+        if snapshot.get("version") != _SNAPSHOT_VERSION:
+            logger.error(f"Снимок FSM {path} имеет неизвестную версию {snapshot.get('version')}, пропускаем.")
+            return None
+        age = time.time() - snapshot["saved_at"]
+        if max_age is not None and age > max_age:
+            logger.warning(f"Снимок FSM {path} сохранен {age:.0f} с назад (допустимо {max_age:.0f} с), отбрасываем.")
+            os.remove(path)
+            return None
+        for item in snapshot["records"]:
+            storage.storage[StorageKey(**item["key"])] = MemoryStorageRecord(data=item["data"], state=item["state"])
+        pending = PendingWork(
+            updates=snapshot.get("updates", []),
+            questions=snapshot.get("questions", []),
+            # Ключи JSON — строки
+            last_update_ids={int(bot_id): update_id for bot_id, update_id in snapshot.get("last_update_ids", {}).items()},
+            restored_states=len(snapshot["records"]),
+        )
+    except Exception as e:
+        logger.error(f"Не удалось загрузить снимок FSM {path}: {e}", exc_info=True)
+        return None
+
+    os.remove(path)
+    logger.info(f"Снимок FSM загружен из {path}: {pending.restored_states} записей, {len(pending.updates)} "
+                f"незавершенных апдейтов, {len(pending.questions)} частей вопросов (сохранен {age:.0f} с назад).")
+    return pending
@@ -1,16 +1,42 @@
 
+import csv
+import gzip
 import os
+import re
+import threading
+from datetime import datetime
+
 import gspread
+import pytz
 from oauth2client.service_account import ServiceAccountCredentials
-from app.config import GOOGLE_CREDENTIALS_PATH, SCOPES_FEED_DRIVE, GOOGLE_SHEET_NAME, SUPPORT_LOG_WORKSHEET_NAME
+from app.config import (GOOGLE_CREDENTIALS_PATH, SCOPES_FEED_DRIVE, GOOGLE_SHEET_NAME, SUPPORT_LOG_WORKSHEET_NAME,
+                        SUPPORT_LOG_PARTITION, SUPPORT_LOG_HOT_PARTITIONS, SUPPORT_LOG_ARCHIVE_DIR, TIMEZONE)
 from app.utils.logger import setup_logger
 
 logger = setup_logger(__name__)
 
+# Заголовки, с которыми создаются новые листы-партиции лога поддержки
+SUPPORT_LOG_HEADERS = ['date', 'user_id', 'user_name', 'query', 'id_query']
+
+_PARTITION_SUFFIX_FORMAT = "%Y_%m"
+_ID_QUERY_RE = re.compile(r"^q_\d+_(\d{12})$")
+
 
-_support_log_worksheet = None
 _google_sheets_client = None
+# Кэш открытых таблиц по имени (у каждого арендатора может быть своя)
+_spreadsheets = {}
+# Кэш рабочих листов по (имя таблицы, имя партиции)
+_partition_worksheets = {}
+# Создание партиций и запись архивов идут из рабочих потоков — выполняем их по одному
+_partition_lock = threading.RLock()
+
+
+class PartitionArchivedError(Exception):
+    """Партиция уже перенесена в архив, создавать ее в таблице заново нельзя."""
 
+    def __init__(self, partition_name: str):
+        super().__init__(f"Партиция '{partition_name}' уже в архиве")
+        self.partition_name = partition_name
 
 
 def get_google_sheets_client():
@@ -32,20 +58,198 @@ def get_google_sheets_client():
     return _google_sheets_client
 
 
-def get_support_log_worksheet():
-    """Возвращает рабочий лист 'BookingsLog'."""
-    global _support_log_worksheet
-    if _support_log_worksheet is None:
+def set_google_sheets_client(client):
+    """Подменяет клиента Google Sheets (например, на эмулятор при воспроизведении трафика)."""
+    global _google_sheets_client
+    _google_sheets_client = client
+    _spreadsheets.clear()
+    _partition_worksheets.clear()
+
+
+def get_spreadsheet(sheet_name: str = GOOGLE_SHEET_NAME):
+    """Возвращает таблицу по имени (каждая открывается один раз, клиент Google общий)."""
+    spreadsheet = _spreadsheets.get(sheet_name)
+    if spreadsheet is None:
+        client = get_google_sheets_client()
+        spreadsheet = _spreadsheets[sheet_name] = client.open(sheet_name)
+    return spreadsheet
+
+
+def get_partition_name(moment: datetime = None, base_name: str = SUPPORT_LOG_WORKSHEET_NAME) -> str:
+    """
+    Возвращает имя листа-партиции для момента времени.
+    При SUPPORT_LOG_PARTITION=month это '<base_name>_ГГГГ_ММ', иначе — один общий лист base_name.
+    """
+    if SUPPORT_LOG_PARTITION != "month":
+        return base_name
+    if moment is None:
+        moment = datetime.now(pytz.timezone(TIMEZONE))
+    return f"{base_name}_{moment.strftime(_PARTITION_SUFFIX_FORMAT)}"
+
+
+def get_partition_name_for_id_query(id_query: str, base_name: str = SUPPORT_LOG_WORKSHEET_NAME):
+    """
+    Определяет партицию по id_query: он имеет вид q_<user_id>_<ггммддЧЧММСС>,
+    то есть уже содержит время создания обращения. Возвращает None для id другого формата.
+    """
+    match = _ID_QUERY_RE.match(id_query or "")
+    if not match:
+        return None
+    try:
+        return get_partition_name(datetime.strptime(match.group(1), "%y%m%d%H%M%S"), base_name)
+    except ValueError:
+        return None
+
+
+def list_partitions(sheet_name: str = GOOGLE_SHEET_NAME, base_name: str = SUPPORT_LOG_WORKSHEET_NAME):
+    """Возвращает имена листов-партиций лога в таблице, от старых к новым."""
+    pattern = re.compile(rf"^{re.escape(base_name)}_\d{{4}}_\d{{2}}$")
+    return sorted(ws.title for ws in get_spreadsheet(sheet_name).worksheets() if pattern.match(ws.title))
+
+
+def get_support_log_worksheet(partition_name: str = None, create: bool = False,
+                              sheet_name: str = GOOGLE_SHEET_NAME, base_name: str = SUPPORT_LOG_WORKSHEET_NAME):
+    """
+    Возвращает рабочий лист лога поддержки для партиции (по умолчанию — текущей).
+    При create=True отсутствующая партиция создается с заголовками (ротация). Партицию старше
+    самой новой в таблице (она уже в архиве или ее время прошло) не создаем — PartitionArchivedError.
+    """
+    name = partition_name or get_partition_name(base_name=base_name)
+    worksheet = _partition_worksheets.get((sheet_name, name))
+    if worksheet is not None:
+        return worksheet
+
+    with _partition_lock:
+        # Пока ждали блокировку, партицию мог получить или создать другой поток
+        worksheet = _partition_worksheets.get((sheet_name, name))
+        if worksheet is not None:
+            return worksheet
         try:
-            client = get_google_sheets_client()
-            spreadsheet = client.open(GOOGLE_SHEET_NAME)
-            # Используем имя листа из конфига
-            _support_log_worksheet = spreadsheet.worksheet(SUPPORT_LOG_WORKSHEET_NAME)
-            logger.info(f"Рабочий лист '{SUPPORT_LOG_WORKSHEET_NAME}' успешно получен.")
+            spreadsheet = get_spreadsheet(sheet_name)
+            try:
+                worksheet = spreadsheet.worksheet(name)
+            except gspread.exceptions.WorksheetNotFound:
+                if not create or name == base_name:
+                    raise
+                if _is_cold_partition(name, sheet_name, base_name):
+                    raise PartitionArchivedError(name)
+                worksheet = _create_partition(spreadsheet, sheet_name, base_name, name)
+            logger.info(f"Рабочий лист '{name}' успешно получен.")
+        except PartitionArchivedError:
+            raise
         except gspread.exceptions.WorksheetNotFound:
-             logger.error(f"Лист '{SUPPORT_LOG_WORKSHEET_NAME}' не найден в таблице '{GOOGLE_SHEET_NAME}'!")
-             raise
+            logger.error(f"Лист '{name}' не найден в таблице '{sheet_name}'!")
+            raise
         except Exception as e:
-            logger.error(f"Ошибка при получении рабочего листа '{SUPPORT_LOG_WORKSHEET_NAME}': {e}", exc_info=True)
+            logger.error(f"Ошибка при получении рабочего листа '{name}': {e}", exc_info=True)
             raise
-    return _support_log_worksheet
\ No newline at end of file
+
+        _partition_worksheets[(sheet_name, name)] = worksheet
+    return worksheet
+
+
+def _is_cold_partition(name: str, sheet_name: str, base_name: str) -> bool:
+    """Партиция уже в архиве или старше самой новой партиции в таблице."""
+    if not SUPPORT_LOG_ARCHIVE_DIR:
+        # Без архива партиции не удаляются: отсутствующей просто еще не было — ее можно создать
+        return False
+    if os.path.exists(get_archive_path(name, sheet_name)):
+        return True
+    partitions = list_partitions(sheet_name, base_name)
+    return bool(partitions) and name < partitions[-1]
+
+
+def _create_partition(spreadsheet, sheet_name: str, base_name: str, name: str):
+    """Создает новый лист-партицию с заголовками и переносит в архив устаревшие партиции."""
+    worksheet = spreadsheet.add_worksheet(title=name, rows=1000, cols=len(SUPPORT_LOG_HEADERS))
+    worksheet.append_row(SUPPORT_LOG_HEADERS, value_input_option='RAW')
+    logger.info(f"Создана новая партиция лога поддержки '{name}' в таблице '{sheet_name}'.")
+
+    try:
+        archive_cold_partitions(sheet_name=sheet_name, base_name=base_name)
+    except Exception as e:
+        # Архивация не должна мешать записи нового обращения
+        logger.error(f"Ошибка при архивации старых партиций: {e}", exc_info=True)
+    return worksheet
+
+
+def get_archive_path(partition_name: str, sheet_name: str = GOOGLE_SHEET_NAME) -> str:
+    return os.path.join(SUPPORT_LOG_ARCHIVE_DIR, sheet_name, f"{partition_name}.csv.gz")
+
+
+def archive_cold_partitions(keep: int = SUPPORT_LOG_HOT_PARTITIONS,
+                            sheet_name: str = GOOGLE_SHEET_NAME, base_name: str = SUPPORT_LOG_WORKSHEET_NAME):
+    """
+    Выгружает все партиции, кроме `keep` последних, в сжатые CSV в SUPPORT_LOG_ARCHIVE_DIR/<таблица>
+    и удаляет их из таблицы. Существующий архив партиции не перезаписывается, а дополняется.
+    Лист удаляется только после успешной записи архива; без SUPPORT_LOG_ARCHIVE_DIR ничего не удаляется.
+    """
+    if not SUPPORT_LOG_ARCHIVE_DIR:
+        logger.debug("SUPPORT_LOG_ARCHIVE_DIR не задан, старые партиции остаются в таблице.")
+        return []
+    with _partition_lock:
+        partitions = list_partitions(sheet_name, base_name)
+        cold = partitions[:-keep] if keep > 0 else partitions
+        if not cold:
+            return []
+
+        os.makedirs(os.path.join(SUPPORT_LOG_ARCHIVE_DIR, sheet_name), exist_ok=True)
+        spreadsheet = get_spreadsheet(sheet_name)
+        archived = []
+        for name in cold:
+            worksheet = spreadsheet.worksheet(name)
+            rows = worksheet.get_all_values()
+            existing = read_archived_partition(name, sheet_name)
+            if existing:
+                rows = _merge_archive_rows(existing, rows)
+            path = get_archive_path(name, sheet_name)
+            _write_archive(path, rows)
+
+            spreadsheet.del_worksheet(worksheet)
+            _partition_worksheets.pop((sheet_name, name), None)
+            archived.append(name)
+            logger.info(f"Партиция '{name}' ({len(rows)} строк) перенесена в архив {path}.")
+        return archived
+
+
+def append_to_archived_partition(partition_name: str, record: dict, sheet_name: str = GOOGLE_SHEET_NAME):
+    """Дописывает запись в архив партиции (например, обращение, пришедшее из outbox после архивации)."""
+    with _partition_lock:
+        rows = read_archived_partition(partition_name, sheet_name) or [list(SUPPORT_LOG_HEADERS)]
+        rows.append([str(record.get(header, '')) for header in rows[0]])
+        os.makedirs(os.path.join(SUPPORT_LOG_ARCHIVE_DIR, sheet_name), exist_ok=True)
+        _write_archive(get_archive_path(partition_name, sheet_name), rows)
+
+
+def _merge_archive_rows(archived_rows, sheet_rows):
+    """Добавляет к строкам архива строки листа (по заголовкам архива), пропуская уже имеющиеся."""
+    if len(sheet_rows) < 2:
+        return archived_rows
+    headers = archived_rows[0]
+    merged = list(archived_rows)
+    seen = {tuple(row) for row in archived_rows[1:]}
+    for row in sheet_rows[1:]:
+        record = dict(zip(sheet_rows[0], row))
+        aligned = [record.get(header, '') for header in headers]
+        if tuple(aligned) not in seen:
+            seen.add(tuple(aligned))
+            merged.append(aligned)
+    return merged
+
+
+def _write_archive(path: str, rows):
+    tmp_path = f"{path}.tmp"
+    with gzip.open(tmp_path, "wt", encoding="utf-8", newline="") as f:
+        csv.writer(f).writerows(rows)
+    os.replace(tmp_path, path)
+
+
+def read_archived_partition(partition_name: str, sheet_name: str = GOOGLE_SHEET_NAME):
+    """Читает строки архивной партиции (включая заголовки) или возвращает None, если архива нет."""
+    if not SUPPORT_LOG_ARCHIVE_DIR:
+        return None
+    path = get_archive_path(partition_name, sheet_name)
+    if not os.path.exists(path):
+        return None
+    with gzip.open(path, "rt", encoding="utf-8", newline="") as f:
+        return list(csv.reader(f))
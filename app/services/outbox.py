@@ -0,0 +1,144 @@
+# app/services/outbox.py
+"""Очередь отложенной работы (outbox) для операций, которые не удалось выполнить сразу."""
+
+import asyncio
+import hashlib
+import json
+import os
+import re
+import time
+from collections import deque
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from app.services.circuit_breaker import CircuitOpenError
+from app.utils.logger import setup_logger
+
+logger = setup_logger(__name__)
+
+
+class Outbox:
+    """
+    Хранит отложенные задания (JSON-словари) в памяти и в файле JSON Lines,
+    чтобы они пережили перезапуск. Задания выполняются повторно в порядке поступления.
+
+    Задание, которое не выполнить никогда (is_permanent(ошибка) == True) или не удалось
+    выполнить max_attempts раз, уходит в файл недоставленных (dead letter) и не держит очередь.
+    """
+
+    def __init__(self, name: str, path: str, max_attempts: int = 20,
+                 is_permanent: Optional[Callable[[Exception], bool]] = None):
+        self.name = name
+        self.path = path
+        self.dead_letter_path = f"{os.path.splitext(path)[0]}.dead.jsonl"
+        self.max_attempts = max_attempts
+        self.is_permanent = is_permanent or (lambda error: False)
+        self._items: deque = deque()
+        self._dead = 0
+        self._flush_lock = asyncio.Lock()
+        self._load()
+        outboxes[name] = self
+
+    def __len__(self):
+        return len(self._items)
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                self._items.extend(json.loads(line) for line in f if line.strip())
+            if self._items:
+                logger.info(f"Outbox '{self.name}': загружено {len(self._items)} отложенных заданий из {self.path}.")
+        except Exception as e:
+            logger.error(f"Outbox '{self.name}': не удалось прочитать {self.path}: {e}", exc_info=True)
+        if os.path.exists(self.dead_letter_path):
+            with open(self.dead_letter_path, encoding="utf-8") as f:
+                self._dead = sum(1 for line in f if line.strip())
+
+    def _save(self):
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            for item in self._items:
+                f.write(json.dumps(item, ensure_ascii=False) + "\n")
+        os.replace(tmp_path, self.path)
+
+    def park(self, item: Dict):
+        """Откладывает задание: добавляет в очередь и дописывает в файл."""
+        self._items.append(item)
+        try:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(item, ensure_ascii=False) + "\n")
+        except Exception as e:
+            logger.error(f"Outbox '{self.name}': не удалось сохранить задание на диск: {e}", exc_info=True)
+        logger.warning(f"Outbox '{self.name}': задание отложено, в очереди {len(self._items)}.")
+
+    def dead_letter(self, item: Dict, error: Exception):
+        """Сохраняет задание, которое не будет выполнено, в файл недоставленных для ручного разбора."""
+        self._dead += 1
+        record = {"failed_at": time.time(), "error": f"{type(error).__name__}: {error}", "item": item}
+        try:
+            os.makedirs(os.path.dirname(self.dead_letter_path) or ".", exist_ok=True)
+            with open(self.dead_letter_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        except Exception as e:
+            logger.error(f"Outbox '{self.name}': не удалось сохранить недоставленное задание {record}: {e}", exc_info=True)
+        logger.error(f"Outbox '{self.name}': задание не будет выполнено ({record['error']}), "
+                     f"перенесено в {self.dead_letter_path}.")
+
+    async def flush(self, handler: Callable[[Dict], Awaitable]) -> int:
+        """
+        Повторно выполняет отложенные задания по порядку. На временной ошибке останавливается,
+        чтобы не нарушать порядок; невыполнимые задания переносит в dead letter и идет дальше.
+        Возвращает число выполненных.
+        """
+        async with self._flush_lock:
+            done = 0
+            changed = False
+            while self._items:
+                item = self._items[0]
+                try:
+                    await handler(item)
+                except CircuitOpenError:
+                    break
+                except Exception as e:
+                    changed = True
+                    item["_attempts"] = item.get("_attempts", 0) + 1
+                    if self.is_permanent(e) or item["_attempts"] >= self.max_attempts:
+                        self._items.popleft()
+                        self.dead_letter(item, e)
+                        continue
+                    logger.warning(f"Outbox '{self.name}': повтор задания не удался "
+                                   f"(попытка {item['_attempts']} из {self.max_attempts}): {e}")
+                    break
+                self._items.popleft()
+                done += 1
+                changed = True
+
+            if changed:
+                self._save()
+            if done:
+                logger.info(f"Outbox '{self.name}': выполнено {done} отложенных заданий, осталось {len(self._items)}.")
+            return done
+
+    async def run(self, handler: Callable[[Dict], Awaitable], interval: float):
+        """Периодически пытается выполнить отложенные задания."""
+        while True:
+            await asyncio.sleep(interval)
+            if self._items:
+                await self.flush(handler)
+
+
+def outbox_file_name(prefix: str, key: str) -> str:
+    """Имя файла очереди для ключа (название таблицы, id арендатора), безопасное для файловой системы."""
+    slug = re.sub(r"[^\w.-]+", "_", key).strip("_")[:40]
+    digest = hashlib.sha1(key.encode("utf-8")).hexdigest()[:8]  # разные ключи с одинаковым slug не совпадут
+    return f"{prefix}_{slug}_{digest}.jsonl"
+
+
+# Все созданные очереди по имени — для мониторинга
+outboxes: Dict[str, Outbox] = {}
+
+
+def get_outboxes_state() -> List[dict]:
+    return [{"name": outbox.name, "pending": len(outbox), "dead": outbox._dead} for outbox in outboxes.values()]
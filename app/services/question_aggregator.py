@@ -0,0 +1,262 @@
+# app/services/question_aggregator.py
+"""Склейка нескольких сообщений пользователя, отправленных подряд, в одно обращение."""
+
+import asyncio
+from collections import defaultdict
+from dataclasses import dataclass, field
+from functools import partial
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from aiogram import types
+from aiogram.fsm.context import FSMContext
+from aiogram.fsm.storage.base import StorageKey
+
+from app.utils.logger import setup_logger
+
+logger = setup_logger(__name__)
+
+
+@dataclass
+class QuestionChunk:
+    """
+    Сообщения пользователя, склеенные в одну часть вопроса.
+    follow_up — продолжение части, которая уже ушла в обработку (она переполнилась или
+    обрабатывается прямо сейчас); previous — результат обработки предыдущей части.
+    ready — продолжение готово к обработке и ждет только завершения предыдущей части.
+    """
+    message: types.Message  # последнее сообщение — на него отвечаем
+    state: FSMContext
+    parts: List[str] = field(default_factory=list)
+    chars: int = 0
+    follow_up: bool = False
+    previous: Any = None
+    after: Optional[asyncio.Task] = None  # задача предыдущей части: обрабатываемся строго после нее
+    timer: Optional[asyncio.TimerHandle] = None
+    ready: bool = False
+
+    @property
+    def text(self) -> str:
+        return "\n".join(self.parts)
+
+
+@dataclass
+class ReplayTimer:
+    when: float
+    callback: Callable
+    args: tuple
+    cancelled: bool = False
+
+    def cancel(self):
+        self.cancelled = True
+
+
+class ReplayClock:
+    """
+    Часы воспроизведения записанного трафика без пауз (app/tools/replay.py): у каждого
+    пользователя свое время записи, таймеры срабатывают, когда QuestionAggregator.advance
+    переводит его часы, а не по реальному времени.
+    """
+
+    def __init__(self):
+        self.now: Dict[StorageKey, float] = {}
+        self._timers: Dict[StorageKey, List[ReplayTimer]] = defaultdict(list)
+
+    def call_later(self, key: StorageKey, delay: float, callback: Callable, *args) -> ReplayTimer:
+        timer = ReplayTimer(self.now.get(key, 0.0) + delay, callback, args)
+        self._timers[key].append(timer)
+        return timer
+
+    def pop_due(self, key: StorageKey, now: float) -> Optional[ReplayTimer]:
+        """Самый ранний таймер пользователя, время которого наступило к now."""
+        timers = [timer for timer in self._timers.pop(key, []) if not timer.cancelled]
+        due = min(timers, key=lambda timer: timer.when, default=None)
+        if due is not None and due.when <= now:
+            timers.remove(due)
+        else:
+            due = None
+        if timers:
+            self._timers[key] = timers
+        return due
+
+
+class QuestionAggregator:
+    """
+    Копит сообщения пользователя, пока он пишет, и передает их в on_flush одним текстом
+    после quiet_window секунд тишины. На каждого пользователя — один таймер loop.call_later,
+    который переставляется при новом сообщении. Часть ограничена max_messages и max_chars:
+    при переполнении она отправляется сразу, а следующие сообщения копятся в продолжение
+    (follow_up), которое обрабатывается после нее. Продолжением считаются и сообщения, пришедшие
+    в течение quiet_window после обработки части: пока она шла, они ждали в очереди пользователя.
+    У пользователя не больше одной обрабатываемой части и одного продолжения: пока часть
+    обрабатывается, продолжение не ограничено max_messages и max_chars, иначе поток сообщений
+    превратился бы в цепочку обращений. Сообщения не теряются и не обрезаются.
+
+    on_flush(message, state, text, follow_up, previous) возвращает результат обработки части,
+    он передается продолжению как previous.
+    """
+
+    def __init__(
+        self,
+        on_flush: Callable[[types.Message, FSMContext, str, bool, Any], Awaitable[Any]],
+        quiet_window: float,
+        max_messages: int,
+        max_chars: int,
+    ):
+        self.on_flush = on_flush
+        self.quiet_window = quiet_window
+        self.max_messages = max_messages
+        self.max_chars = max_chars
+        self._buffers: Dict[StorageKey, QuestionChunk] = {}
+        # Последняя отправленная в обработку часть пользователя (пока она не завершилась)
+        self._chains: Dict[StorageKey, asyncio.Task] = {}
+        self._running: Dict[asyncio.Task, QuestionChunk] = {}
+        # Результат последней обработанной части — хранится quiet_window после ее завершения
+        self._finished: Dict[StorageKey, Tuple[asyncio.Task, Any]] = {}
+        # При воспроизведении трафика без пауз таймеры идут по времени записи (см. advance)
+        self.replay_clock: Optional[ReplayClock] = None
+
+    def __len__(self):
+        return len(self._buffers)
+
+    def is_collecting(self, key: StorageKey) -> bool:
+        """Вопрос пользователя еще копится или обрабатывается — новые сообщения относятся к нему."""
+        return key in self._buffers or key in self._chains or key in self._finished
+
+    def add(self, message: types.Message, state: FSMContext, text: str):
+        """Добавляет сообщение в буфер пользователя и переставляет таймер тишины."""
+        key = state.key
+        chunk = self._buffers.get(key)
+        if chunk is None:
+            chunk = self._buffers[key] = QuestionChunk(message=message, state=state)
+            if key in self._chains:
+                chunk.follow_up = True  # previous подставит _on_done предыдущей части
+            elif key in self._finished:
+                chunk.follow_up, chunk.previous = True, self._finished[key][1]
+        elif chunk.timer:
+            chunk.timer.cancel()
+
+        chunk.message = message
+        chunk.state = state
+        chunk.parts.append(text)
+        chunk.chars += len(text)
+
+        if chunk.ready:
+            return  # ждет завершения предыдущей части и принимает все, что пришло до этого
+        if self.quiet_window <= 0 or len(chunk.parts) >= self.max_messages or chunk.chars >= self.max_chars:
+            self._flush(key)
+        else:
+            chunk.timer = self._call_later(key, self.quiet_window, self._flush, key)
+
+    def _call_later(self, key: StorageKey, delay: float, callback: Callable, *args):
+        if self.replay_clock is not None:
+            return self.replay_clock.call_later(key, delay, callback, *args)
+        return asyncio.get_running_loop().call_later(delay, callback, *args)
+
+    def _flush(self, key: StorageKey):
+        chunk = self._buffers.get(key)
+        if chunk is None:
+            return
+        if chunk.timer:
+            chunk.timer.cancel()
+            chunk.timer = None
+        if key in self._chains:
+            chunk.ready = True  # запустится из _on_done предыдущей части
+            return
+        del self._buffers[key]
+        logger.debug(f"Склеено {len(chunk.parts)} сообщений user {key.user_id} в одно обращение"
+                     f"{' (продолжение)' if chunk.follow_up else ''}")
+        self._start(key, chunk)
+
+    def _start(self, key: StorageKey, chunk: QuestionChunk):
+        task = asyncio.create_task(self._run(chunk))
+        self._chains[key] = task
+        self._running[task] = chunk
+        task.add_done_callback(partial(self._on_done, key))
+
+    def _on_done(self, key: StorageKey, task: asyncio.Task):
+        self._running.pop(task, None)
+        if self._chains.get(key) is task:
+            del self._chains[key]
+        if task.cancelled():
+            return
+        chunk = self._buffers.get(key)
+        if chunk is not None and chunk.ready and key not in self._chains:
+            del self._buffers[key]
+            chunk.previous = task.result()
+            self._start(key, chunk)
+            return
+        if self.quiet_window <= 0:
+            return
+        self._finished[key] = (task, task.result())
+        self._call_later(key, self.quiet_window, self._forget, key, task)
+
+    def _forget(self, key: StorageKey, task: asyncio.Task):
+        if self._finished.get(key, (None,))[0] is task:
+            del self._finished[key]
+
+    async def _run(self, chunk: QuestionChunk):
+        if chunk.after is not None:
+            await asyncio.wait([chunk.after])
+            if not chunk.after.cancelled() and chunk.after.exception() is None:
+                chunk.previous = chunk.after.result()
+            chunk.after = None
+        try:
+            return await self.on_flush(chunk.message, chunk.state, chunk.text, chunk.follow_up, chunk.previous)
+        except Exception as e:
+            logger.error(f"Ошибка при обработке склеенного обращения user {chunk.state.key.user_id}: {e}", exc_info=True)
+            return None
+
+    async def advance(self, key: StorageKey, now: float):
+        """
+        Переводит часы воспроизведения пользователя (replay_clock) на now секунд записи:
+        срабатывают таймеры, время которых наступило. Обработка частей в записи считается
+        мгновенной — ее дожидаемся, прежде чем двигать часы дальше.
+        """
+        while True:
+            # По завершении части может запуститься ее продолжение — ждем всю цепочку
+            while key in self._chains:
+                await asyncio.wait([self._chains[key]])
+            timer = self.replay_clock.pop_due(key, now)
+            if timer is None:
+                break
+            self.replay_clock.now[key] = timer.when
+            timer.callback(*timer.args)
+        self.replay_clock.now[key] = now
+
+    def resume(self, chunk: QuestionChunk):
+        """
+        Возобновляет часть вопроса, которую не успел обработать предыдущий процесс.
+        Части одного пользователя обрабатываются в порядке возобновления.
+        """
+        key = chunk.state.key
+        if key in self._chains:
+            chunk.follow_up, chunk.after = True, self._chains[key]
+        self._start(key, chunk)
+
+    async def flush_all(self, timeout: Optional[float] = None) -> List[QuestionChunk]:
+        """
+        Немедленно отправляет все накопленные буферы и ждет их обработки не дольше timeout секунд.
+        Не успевшие обработаться части отменяются и возвращаются в порядке очереди,
+        чтобы их можно было передать следующему процессу (см. resume).
+        """
+        for key in list(self._buffers):
+            self._flush(key)
+        loop = asyncio.get_running_loop()
+        deadline = None if timeout is None else loop.time() + timeout
+        # Продолжения запускаются по завершении предыдущих частей — ждем, пока обработка не кончится
+        while self._running:
+            remaining = None if deadline is None else max(0.0, deadline - loop.time())
+            _, pending = await asyncio.wait(list(self._running), timeout=remaining)
+            if pending:
+                break
+        unfinished = list(self._running.values())
+        pending = list(self._running)
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+        # Продолжения, которые ждали прерванные части, идут за ними
+        unfinished += [self._buffers.pop(key) for key in list(self._buffers)]
+        for chunk in unfinished:
+            chunk.after = None
+            chunk.ready = False
+        return unfinished
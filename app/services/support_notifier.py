@@ -0,0 +1,104 @@
+# app/services/support_notifier.py
+"""Отправка уведомлений об обращениях в чат поддержки через предохранитель."""
+
+import os
+from typing import Dict, Optional
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError, TelegramUnauthorizedError
+
+from app.config import (BREAKER_FAILURE_RATE, BREAKER_OPEN_SECONDS, BREAKER_SLOW_CALL_SECONDS, OUTBOX_DIR,
+                        OUTBOX_MAX_ATTEMPTS)
+from app.services.circuit_breaker import CircuitBreaker, CircuitOpenError
+from app.services.outbox import Outbox, outbox_file_name
+from app.services.tenants import Tenant, record_tenant_event
+from app.utils.logger import setup_logger
+
+logger = setup_logger(__name__)
+
+class BotNotFoundError(Exception):
+    """Уведомление отложено для арендатора, бота которого больше нет в конфигурации."""
+
+
+def is_permanent_notification_error(error: Exception) -> bool:
+    """
+    Ошибка, которую повтор не исправит: токен отозван, бот удален из чата, неверный chat_id
+    или разметка сообщения. Такие уведомления уходят в dead letter, а не теряются молча.
+    """
+    return isinstance(error, (TelegramUnauthorizedError, TelegramForbiddenError, TelegramBadRequest,
+                              BotNotFoundError))
+
+
+# У каждого бота свои лимиты Telegram, поэтому и предохранитель у каждого арендатора свой
+_notification_breakers: Dict[str, CircuitBreaker] = {}
+_notification_outboxes: Dict[str, Outbox] = {}
+
+
+def get_notification_breaker(tenant_id: str) -> CircuitBreaker:
+    breaker = _notification_breakers.get(tenant_id)
+    if breaker is None:
+        breaker = _notification_breakers[tenant_id] = CircuitBreaker(
+            f"support_chat:{tenant_id}",
+            failure_rate_threshold=BREAKER_FAILURE_RATE,
+            slow_call_seconds=BREAKER_SLOW_CALL_SECONDS,
+            open_timeout=BREAKER_OPEN_SECONDS,
+            # Неверный chat_id или бот удален из чата — повтор не поможет, Telegram при этом доступен
+            ignore_exceptions=(TelegramBadRequest, TelegramForbiddenError),
+        )
+    return breaker
+
+
+def get_notification_outbox(tenant_id: str) -> Outbox:
+    """Уведомления арендатора, которые не удалось доставить: {"tenant_id", "chat_id", "text"}."""
+    outbox = _notification_outboxes.get(tenant_id)
+    if outbox is None:
+        outbox = _notification_outboxes[tenant_id] = Outbox(
+            f"support_chat:{tenant_id}",
+            os.path.join(OUTBOX_DIR, outbox_file_name("support_notifications", tenant_id)),
+            max_attempts=OUTBOX_MAX_ATTEMPTS,
+            is_permanent=is_permanent_notification_error,
+        )
+    return outbox
+
+
+async def deliver_notification(bot: Optional[Bot], item: dict):
+    """
+    Отправляет уведомление через предохранитель. При неудаче бросает исключение;
+    неисправимые ошибки распознает is_permanent_notification_error.
+    """
+    if bot is None:
+        raise BotNotFoundError(f"Бот арендатора '{item.get('tenant_id')}' не найден")
+    await get_notification_breaker(item["tenant_id"]).call(
+        bot.send_message,
+        chat_id=item["chat_id"],
+        text=item["text"],
+        parse_mode="HTML",
+        disable_web_page_preview=True
+    )
+
+
+async def notify_support(bot: Bot, tenant: Tenant, text: str) -> bool:
+    """
+    Отправляет уведомление в чат поддержки арендатора.
+    Если Telegram недоступен (или предохранитель разомкнут), уведомление откладывается в outbox.
+    """
+    if not tenant.support_chat_id:
+        logger.error(f"ID чата поддержки для арендатора '{tenant.id}' не настроен!")
+        return False
+
+    item = {"tenant_id": tenant.id, "chat_id": tenant.support_chat_id, "text": text}
+    try:
+        await deliver_notification(bot, item)
+        return True
+    except CircuitOpenError:
+        logger.warning(f"Чат поддержки арендатора '{tenant.id}' недоступен (предохранитель разомкнут), уведомление отложено.")
+    except Exception as e:
+        outbox = get_notification_outbox(tenant.id)
+        if outbox.is_permanent(e):
+            outbox.dead_letter(item, e)
+            return False
+        logger.error(f"Не удалось отправить уведомление в чат поддержки {tenant.support_chat_id}: {e}", exc_info=True)
+
+    record_tenant_event(tenant, "notifications_parked")
+    get_notification_outbox(tenant.id).park(item)
+    return False
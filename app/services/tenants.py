@@ -0,0 +1,137 @@
+# app/services/tenants.py
+"""Реестр арендаторов (брендов): у каждого свой бот, чат поддержки, таблица и тексты."""
+
+import os
+from collections import Counter, defaultdict
+from dataclasses import dataclass
+from typing import Dict, Iterator, Optional
+
+import yaml
+from aiogram import Bot
+
+from app.config import (TELEGRAM_BOT_TOKEN, SUPPORT_CHAT_ID, GOOGLE_SHEET_NAME, SUPPORT_LOG_WORKSHEET_NAME,
+                        TENANTS_CONFIG_PATH, ADMISSION_MAX_CONCURRENCY)
+from app.utils.constants import SPECIALIST_NAME, WELCOME_TEXT_TEMPLATE
+from app.utils.logger import setup_logger
+
+logger = setup_logger(__name__)
+
+DEFAULT_TENANT_ID = "default"
+
+
+@dataclass(frozen=True)
+class Tenant:
+    """
+    Настройки одного арендатора. Состояния FSM разных арендаторов не пересекаются:
+    id бота входит в ключ хранилища (StorageKey.bot_id).
+    """
+    id: str
+    token: str
+    support_chat_id: Optional[str]
+    google_sheet_name: str
+    support_log_worksheet_name: str
+    specialist_name: str = SPECIALIST_NAME
+    custom_welcome_text: Optional[str] = None
+    max_concurrency: int = ADMISSION_MAX_CONCURRENCY
+
+    @property
+    def bot_id(self) -> int:
+        return int(self.token.split(":")[0])
+
+    def format_welcome_text(self, user_name: str) -> str:
+        """
+        Приветствие арендатора. Шаблон подставляется за один вызов format: в нем доступны
+        {specialist_name} и {user_name}, а фигурные скобки в подставленных значениях не трогаются.
+        """
+        template = self.custom_welcome_text or WELCOME_TEXT_TEMPLATE
+        return template.format(specialist_name=self.specialist_name, user_name=user_name)
+
+
+def _tenant_from_dict(raw: dict) -> Tenant:
+    tenant_id = str(raw["id"])
+    # Токен можно не хранить в файле, а взять из переменной окружения
+    token = raw.get("token") or os.getenv(raw.get("token_env", ""))
+    if not token:
+        raise ValueError(f"Для арендатора '{tenant_id}' не задан token или token_env")
+    tenant = Tenant(
+        id=tenant_id,
+        token=token,
+        support_chat_id=str(raw["support_chat_id"]) if raw.get("support_chat_id") else None,
+        google_sheet_name=raw.get("google_sheet_name", GOOGLE_SHEET_NAME),
+        support_log_worksheet_name=raw.get("support_log_worksheet_name", SUPPORT_LOG_WORKSHEET_NAME),
+        specialist_name=raw.get("specialist_name", SPECIALIST_NAME),
+        custom_welcome_text=raw.get("welcome_text"),
+        max_concurrency=int(raw.get("max_concurrency", ADMISSION_MAX_CONCURRENCY)),
+    )
+    # Ошибку в шаблоне приветствия лучше увидеть при запуске, а не на первом /start
+    try:
+        tenant.format_welcome_text(user_name="")
+    except (KeyError, IndexError, ValueError) as e:
+        raise ValueError(f"Ошибка в welcome_text арендатора '{tenant_id}' (литеральные скобки пишутся как {{{{ }}}}): {e!r}")
+    return tenant
+
+
+class TenantRegistry:
+    """Арендаторы по id и по id бота."""
+
+    def __init__(self):
+        self._tenants: Dict[str, Tenant] = {}
+        self._by_bot_id: Dict[int, Tenant] = {}
+
+    def add(self, tenant: Tenant):
+        if tenant.id in self._tenants:
+            raise ValueError(f"Арендатор '{tenant.id}' указан дважды")
+        if tenant.bot_id in self._by_bot_id:
+            raise ValueError(f"Токен бота арендатора '{tenant.id}' уже используется '{self._by_bot_id[tenant.bot_id].id}'")
+        self._tenants[tenant.id] = tenant
+        self._by_bot_id[tenant.bot_id] = tenant
+
+    def __iter__(self) -> Iterator[Tenant]:
+        return iter(self._tenants.values())
+
+    def __len__(self):
+        return len(self._tenants)
+
+    def get(self, tenant_id: str) -> Optional[Tenant]:
+        return self._tenants.get(tenant_id)
+
+    def for_bot(self, bot: Bot) -> Optional[Tenant]:
+        return self._by_bot_id.get(bot.id)
+
+
+def load_tenant_registry(path: Optional[str] = TENANTS_CONFIG_PATH) -> TenantRegistry:
+    """
+    Загружает арендаторов из YAML-файла (ключ tenants — список словарей).
+    Без файла создается один арендатор 'default' из переменных окружения.
+    """
+    registry = TenantRegistry()
+    if not path:
+        registry.add(Tenant(
+            id=DEFAULT_TENANT_ID,
+            token=TELEGRAM_BOT_TOKEN,
+            support_chat_id=SUPPORT_CHAT_ID,
+            google_sheet_name=GOOGLE_SHEET_NAME,
+            support_log_worksheet_name=SUPPORT_LOG_WORKSHEET_NAME,
+        ))
+        return registry
+
+    with open(path, encoding="utf-8") as f:
+        raw = yaml.safe_load(f) or {}
+    for raw_tenant in raw.get("tenants", []):
+        registry.add(_tenant_from_dict(raw_tenant))
+    if not len(registry):
+        raise ValueError(f"В файле арендаторов {path} не найдено ни одного арендатора")
+    logger.info(f"Загружено арендаторов: {len(registry)} ({', '.join(t.id for t in registry)})")
+    return registry
+
+
+# Счетчики событий по арендаторам — для мониторинга
+tenant_metrics: Dict[str, Counter] = defaultdict(Counter)
+
+
+def record_tenant_event(tenant: Optional[Tenant], event: str):
+    tenant_metrics[tenant.id if tenant else DEFAULT_TENANT_ID][event] += 1
+
+
+# Инициализация tenant_registry для использования в остальной части проекта
+tenant_registry = load_tenant_registry()
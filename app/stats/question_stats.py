@@ -3,5 +3,6 @@ from aiogram.fsm.state import State, StatesGroup
 class QuestionStates(StatesGroup):
 
     waiting_for_question = State()
+    waiting_for_faq_decision = State()
     waiting_for_creating_record_request = State()
     finish = State()
\ No newline at end of file
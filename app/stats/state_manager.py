@@ -1,11 +1,18 @@
 # # app/state_management/state_manager.py
+from html import escape
 from typing import Dict, Callable, Awaitable
 
 from aiogram import types
 from aiogram.fsm.context import FSMContext
 
+from app.config import QUESTION_MAX_CHARS
+from app.keyboards.inline_buttons import create_inline_universal_keyboard
+from app.services.faq_engine import faq_engine
 from app.stats.question_stats import QuestionStates
 from app.stats.state_transitions import STATE_TRANSITIONS
+from app.utils.constants import (FAQ_SUGGESTION_TEXT, FAQ_ANSWER_CALLBACK_PREFIX,
+                                 FAQ_ESCALATE_BUTTON_TEXT, FAQ_ESCALATE_CALLBACK)
+from app.utils.formatters import sanitize_callback_data, truncate_text
 from app.utils.logger import setup_logger
 
 logger = setup_logger(__name__)
@@ -86,6 +93,7 @@ class StateManager:
         """
         handlers = {
             QuestionStates.waiting_for_question.state: self._handle_question_entry,
+            QuestionStates.waiting_for_faq_decision.state: self._handle_faq_suggestion_entry,
             QuestionStates.waiting_for_creating_record_request.state: self._handle_show_recording_user_request,
             QuestionStates.finish.state: self._handle_finish
 
@@ -110,6 +118,26 @@ class StateManager:
 
         )
 
+    async def _handle_faq_suggestion_entry(self, msg: types.Message, state: FSMContext):
+        """
+        Обработка входа в состояние выбора ответа из FAQ.
+        Показывает найденные вопросы кнопками и кнопку для создания обращения.
+        """
+        user_data = await state.get_data()
+        buttons = []
+        for entry_id in user_data.get("faq_matches", []):
+            entry = faq_engine.get(entry_id)
+            if entry:
+                button_text = entry.question if len(entry.question) <= 60 else entry.question[:57] + "..."
+                buttons.append([button_text, sanitize_callback_data(f"{FAQ_ANSWER_CALLBACK_PREFIX}{entry.id}")])
+
+        keyboard = create_inline_universal_keyboard(
+            buttons, 1, additional_buttons={FAQ_ESCALATE_BUTTON_TEXT: FAQ_ESCALATE_CALLBACK}
+        )
+        suggestion = await msg.answer(FAQ_SUGGESTION_TEXT, parse_mode="HTML", reply_markup=keyboard)
+        # Запоминаем сообщение с кнопками, чтобы убрать их, если пользователь ответит текстом
+        await state.update_data(faq_message_id=suggestion.message_id)
+
     async def _handle_show_recording_user_request(self, msg: types.Message, state: FSMContext):
         """
         Обработка входа в состояние показа сводки. Запись и уведомление УЖЕ произошли.
@@ -130,9 +158,9 @@ class StateManager:
         summary_question_text = (
 
             f"<b>❕Сводная информация об обращении❕:</b>\n\n"
-            f"👤<b>{user_name}</b>\n\n>"
+            f"👤<b>{escape(str(user_name))}</b>\n\n>"
             f"<i>Ваш № 🆔заявки(обращения):</i> <b>{id_query}</b>\n"
-            f"📝<i>Описание вашего обращения:</i> <b>{query_text}</b>\n\n"
+            f"📝<i>Описание вашего обращения:</i> <b>{escape(truncate_text(query_text, QUESTION_MAX_CHARS))}</b>\n\n"
             f"📅<i>Дата обращения :</i> <b>{date_str}</b>\n"
             f"Принято в работу на рассмотрение - позже мы сообщим о результате"
 
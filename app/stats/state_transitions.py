@@ -6,9 +6,16 @@ STATE_TRANSITIONS = {
 
     QuestionStates.waiting_for_question.state: {
         "next": QuestionStates.waiting_for_creating_record_request.state,
+        "faq": QuestionStates.waiting_for_faq_decision.state,
         "back": "start"
     },
 
+    QuestionStates.waiting_for_faq_decision.state: {
+        "next": QuestionStates.waiting_for_creating_record_request.state,
+        "faq": QuestionStates.waiting_for_faq_decision.state,  # повторный показ ответов после обновления базы
+        "back": QuestionStates.waiting_for_question.state
+    },
+
     QuestionStates.waiting_for_creating_record_request.state: {
         "next": QuestionStates.finish.state,
         "back": QuestionStates.waiting_for_creating_record_request.state,
@@ -0,0 +1,385 @@
+# app/tools/replay.py
+"""
+Воспроизведение записанного трафика (см. app/middlewares/capture.py) через setup_dispatcher
+на эмуляторах Telegram и Google Sheets. Порядок апдейтов каждого пользователя сохраняется.
+
+    python -m app.tools.replay capture.jsonl.gz --speed 10 --output new.json
+    python -m app.tools.replay capture.jsonl.gz --speed max --compare new.json
+
+Отчет содержит распределение задержек обработки апдейтов, отдельно — задержку вопроса
+(от последнего сообщения вопроса до создания обращения, включая паузу склейки и очередь)
+и итог диалога (состояние FSM, число обращений и ответов) для каждого пользователя. С --compare итоги сравниваются с отчетом,
+снятым на другой версии кода; при расхождениях команда завершается с кодом 1.
+
+Паузы приложения (склейка сообщений, размыкание предохранителей, повтор отложенной доставки)
+сжимаются вместе с трафиком: при --speed N они короче в N раз, а при --speed max склейка идет
+по времени записи (ReplayClock), иначе шаги диалога слились бы и итоги зависели бы от скорости.
+"""
+
+import argparse
+import asyncio
+import gzip
+import json
+import os
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from aiogram import Bot
+from aiogram.client.session.base import BaseSession
+from aiogram.methods import EditMessageText, SendMessage
+from aiogram.dispatcher.middlewares.user_context import UserContextMiddleware
+from aiogram.types import Chat, Message, Update
+
+
+class FakeTelegramSession(BaseSession):
+    """Сессия, которая ничего не отправляет в Telegram, а считает ответы по чатам."""
+
+    def __init__(self, latency: float = 0.0):
+        super().__init__()
+        self.latency = latency
+        self.sent: Dict[str, int] = defaultdict(int)
+        self._message_id = 0
+
+    async def close(self):
+        pass
+
+    async def stream_content(self, url, headers=None, timeout=30, chunk_size=65536, raise_for_status=True):
+        yield b""
+
+    async def make_request(self, bot, method, timeout=None):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        chat_id = getattr(method, "chat_id", None)
+        if chat_id is not None:
+            self.sent[str(chat_id)] += 1
+        if isinstance(method, (SendMessage, EditMessageText)):
+            self._message_id += 1
+            return Message(message_id=self._message_id, date=datetime.now(),
+                           chat=Chat(id=chat_id or 0, type="private"), text=method.text)
+        return True
+
+
+class FakeWorksheet:
+    def __init__(self, title: str, latency: float, headers: Optional[List[str]] = None):
+        self.title = title
+        self.latency = latency
+        self.rows: List[List[str]] = [list(headers)] if headers else []
+
+    def _wait(self):
+        if self.latency:
+            time.sleep(self.latency)  # вызывается в отдельном потоке, как и настоящий gspread
+
+    def row_values(self, row: int):
+        self._wait()
+        return list(self.rows[row - 1]) if len(self.rows) >= row else []
+
+    def append_row(self, values, value_input_option=None):
+        self._wait()
+        self.rows.append(list(values))
+
+    def get_all_values(self):
+        self._wait()
+        return [list(row) for row in self.rows]
+
+    def find(self, query, in_column=None):
+        self._wait()
+        for number, row in enumerate(self.rows, start=1):
+            if len(row) >= in_column and row[in_column - 1] == query:
+                return type("Cell", (), {"row": number, "col": in_column})()
+        return None
+
+
+class FakeSpreadsheet:
+    def __init__(self, latency: float, headers: List[str]):
+        self.latency = latency
+        self.headers = headers
+        self._worksheets: Dict[str, FakeWorksheet] = {}
+
+    def worksheet(self, title: str):
+        # Любой лист «существует», как будто его заранее создали с нужными заголовками
+        if title not in self._worksheets:
+            self._worksheets[title] = FakeWorksheet(title, self.latency, self.headers)
+        return self._worksheets[title]
+
+    def worksheets(self):
+        return list(self._worksheets.values())
+
+    def add_worksheet(self, title, rows, cols):
+        self._worksheets[title] = FakeWorksheet(title, self.latency)
+        return self._worksheets[title]
+
+    def del_worksheet(self, worksheet):
+        self._worksheets.pop(worksheet.title, None)
+
+
+class FakeSheetsClient:
+    """Эмулятор gspread-клиента: таблицы в памяти с задержкой на каждый вызов."""
+
+    def __init__(self, latency: float, headers: List[str]):
+        self.latency = latency
+        self.headers = headers
+        self.spreadsheets: Dict[str, FakeSpreadsheet] = {}
+
+    def open(self, name: str):
+        if name not in self.spreadsheets:
+            self.spreadsheets[name] = FakeSpreadsheet(self.latency, self.headers)
+        return self.spreadsheets[name]
+
+    def tickets_by_user(self) -> Dict[str, int]:
+        tickets: Dict[str, int] = defaultdict(int)
+        for spreadsheet in self.spreadsheets.values():
+            for worksheet in spreadsheet.worksheets():
+                if not worksheet.rows or "user_id" not in worksheet.rows[0]:
+                    continue
+                column = worksheet.rows[0].index("user_id")
+                for row in worksheet.rows[1:]:
+                    tickets[row[column]] += 1
+        return tickets
+
+
+def read_capture(path: str) -> List[dict]:
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def get_update_user_id(raw_update: dict) -> Optional[int]:
+    """Id пользователя из апдейта: from первого вложенного события (message, callback_query, ...)."""
+    for key, value in raw_update.items():
+        if key != "update_id" and isinstance(value, dict) and isinstance(value.get("from"), dict):
+            return value["from"].get("id")
+    return None
+
+
+def get_update_type(raw_update: dict) -> str:
+    return next((key for key in raw_update if key != "update_id"), "unknown")
+
+
+def percentiles(values: List[float]) -> dict:
+    if not values:
+        return {}
+    values = sorted(values)
+
+    def at(p: float) -> float:
+        return round(values[min(len(values) - 1, int(p * len(values)))], 2)
+
+    return {"count": len(values), "mean": round(sum(values) / len(values), 2),
+            "p50": at(0.5), "p90": at(0.9), "p99": at(0.99), "max": round(values[-1], 2)}
+
+
+async def replay(records: List[dict], speed: Optional[float], telegram_latency: float, sheets_latency: float) -> dict:
+    # Модули приложения импортируются здесь: окружение для них уже подготовлено в main()
+    from aiogram import Dispatcher
+    from aiogram.fsm.storage.memory import MemoryStorage
+
+    from app.config import OUTBOX_FLUSH_INTERVAL
+    from app.handlers.dispatcher import setup_dispatcher
+    from app.handlers.process_query import question_aggregator
+    from app.services.faq_engine import faq_engine
+    from app.services.google_sheet_api import SUPPORT_LOG_HEADERS, set_google_sheets_client
+    from app.services.question_aggregator import ReplayClock
+    from app.services.support_notifier import deliver_notification, get_notification_breaker, get_notification_outbox
+    from app.services.tenants import tenant_registry
+    from app.utils.google_sheet_utils import deliver_support_log, get_sheets_breaker, get_sheets_outbox
+
+    telegram = FakeTelegramSession(telegram_latency)
+    sheets = FakeSheetsClient(sheets_latency, SUPPORT_LOG_HEADERS)
+    set_google_sheets_client(sheets)
+    await faq_engine.reload_if_changed()
+
+    bots = {tenant.id: Bot(token=tenant.token, session=telegram) for tenant in tenant_registry}
+    default_bot = next(iter(bots.values()))
+    storage = MemoryStorage()
+    dp = Dispatcher(storage=storage)
+    setup_dispatcher(dp)
+
+    # Апдейты группируются по пользователю: внутри группы строго по порядку, группы — параллельно
+    groups: Dict[tuple, List[dict]] = defaultdict(list)
+    for record in records:
+        user_id = get_update_user_id(record["update"])
+        groups[(record.get("tenant"), user_id if user_id is not None else record["update"].get("update_id"))].append(record)
+
+    latencies: Dict[str, List[float]] = defaultdict(list)
+    errors = 0
+    first_ts = records[0]["ts"] if records else 0.0
+    loop = asyncio.get_running_loop()
+    started = loop.time()
+
+    # Обращение создается не в обработчике апдейта, а после склейки сообщений — меряем его отдельно:
+    # от поступления последнего сообщения вопроса до конца обработки склеенного текста
+    arrivals: Dict[tuple, float] = {}  # (id бота, id чата, id сообщения) -> время поступления
+    question_latencies: List[float] = []
+    on_flush = question_aggregator.on_flush
+
+    async def timed_on_flush(message, state, text, follow_up, previous):
+        try:
+            return await on_flush(message, state, text, follow_up, previous)
+        finally:
+            arrived = arrivals.pop((message.bot.id, message.chat.id, message.message_id), None)
+            if arrived is not None:
+                question_latencies.append((loop.time() - arrived) * 1000)
+
+    question_aggregator.on_flush = timed_on_flush
+
+    # Паузы приложения сжимаются вместе с трафиком (при max — до нуля, склейка идет по времени записи)
+    time_scale = 1 / speed if speed else 0.0
+    quiet_window = question_aggregator.quiet_window
+    if speed:
+        question_aggregator.quiet_window = quiet_window * time_scale
+    else:
+        question_aggregator.replay_clock = ReplayClock()
+    breakers = [get_sheets_breaker(tenant.google_sheet_name) for tenant in tenant_registry]
+    breakers += [get_notification_breaker(tenant.id) for tenant in tenant_registry]
+    open_timeouts = {breaker: breaker.open_timeout for breaker in breakers}
+    for breaker, open_timeout in open_timeouts.items():
+        breaker.open_timeout = open_timeout * time_scale
+    outbox_handlers = {}
+    for tenant in tenant_registry:
+        outbox_handlers[get_sheets_outbox(tenant.google_sheet_name)] = deliver_support_log
+        outbox_handlers[get_notification_outbox(tenant.id)] = \
+            lambda item: deliver_notification(bots.get(item["tenant_id"]), item)
+    # При max повтор отложенной доставки — только в конце, иначе цикл с нулевым интервалом крутился бы впустую
+    outbox_flushers = [asyncio.create_task(outbox.run(handler, OUTBOX_FLUSH_INTERVAL * time_scale))
+                       for outbox, handler in outbox_handlers.items()] if speed else []
+
+    async def play_user(user_records: List[dict]):
+        nonlocal errors
+        for record in user_records:
+            if speed:
+                delay = started + (record["ts"] - first_ts) / speed - loop.time()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            bot = bots.get(record.get("tenant"), default_bot)
+            update = Update.model_validate(record["update"], context={"bot": bot})
+            if question_aggregator.replay_clock is not None:
+                event_context = UserContextMiddleware.resolve_event_context(update)
+                state = dp.fsm.resolve_context(bot, event_context.chat_id, event_context.user_id,
+                                               thread_id=event_context.thread_id,
+                                               business_connection_id=event_context.business_connection_id)
+                if state is not None:
+                    await question_aggregator.advance(state.key, record["ts"])
+            update_started = loop.time()
+            if update.message:
+                arrivals[(bot.id, update.message.chat.id, update.message.message_id)] = update_started
+            try:
+                await dp.feed_update(bot, update)
+            except Exception as e:
+                errors += 1
+                print(f"Ошибка при обработке апдейта {update.update_id}: {e}", file=sys.stderr)
+            latencies[get_update_type(record["update"])].append((loop.time() - update_started) * 1000)
+
+    try:
+        await asyncio.gather(*(play_user(user_records) for user_records in groups.values()))
+        # Даем склейке сообщений досчитать паузу, как это было бы в реальной работе
+        if question_aggregator.replay_clock is None:
+            await asyncio.sleep(question_aggregator.quiet_window)
+        await question_aggregator.flush_all()
+        # Отложенное из-за разомкнутых предохранителей доставляется, как при следующем повторе
+        if any(len(outbox) for outbox in outbox_handlers):
+            await asyncio.sleep(max(breaker.open_timeout for breaker in breakers))
+            for outbox, handler in outbox_handlers.items():
+                await outbox.flush(handler)
+    finally:
+        question_aggregator.on_flush = on_flush
+        question_aggregator.quiet_window = quiet_window
+        question_aggregator.replay_clock = None
+        for breaker, open_timeout in open_timeouts.items():
+            breaker.open_timeout = open_timeout
+        for flusher in outbox_flushers:
+            flusher.cancel()
+    duration = loop.time() - started
+
+    tenant_by_bot_id = {bot.id: tenant_id for tenant_id, bot in bots.items()}
+    tickets = sheets.tickets_by_user()
+    outcomes = {}
+    for key, record in storage.storage.items():
+        outcomes[f"{tenant_by_bot_id.get(key.bot_id)}:{key.user_id}"] = {
+            "state": record.state,
+            "data_keys": sorted(record.data),
+        }
+    for (tenant_id, user_id) in groups:
+        outcome = outcomes.setdefault(f"{tenant_id}:{user_id}", {"state": None, "data_keys": []})
+        outcome["tickets"] = tickets.get(str(user_id), 0)
+        outcome["replies"] = telegram.sent.get(str(user_id), 0)
+
+    all_latencies = [value for values in latencies.values() for value in values]
+    return {
+        "updates": len(records),
+        "users": len(groups),
+        "errors": errors,
+        "duration_s": round(duration, 2),
+        "speed": speed or "max",
+        "latency_ms": percentiles(all_latencies),
+        "latency_ms_by_type": {update_type: percentiles(values) for update_type, values in latencies.items()},
+        "question_latency_ms": percentiles(question_latencies),
+        "tickets": sum(tickets.values()),
+        "support_notifications": sum(count for chat_id, count in telegram.sent.items() if chat_id.startswith("-")),
+        "outcomes": outcomes,
+    }
+
+
+def compare_outcomes(baseline: dict, current: dict) -> List[str]:
+    """Возвращает описание расхождений итогов диалогов между двумя отчетами."""
+    differences = []
+    for key in sorted(set(baseline) | set(current)):
+        before, after = baseline.get(key), current.get(key)
+        if before != after:
+            differences.append(f"{key}: {before} -> {after}")
+    return differences
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Воспроизведение записанного трафика через диспетчер бота.")
+    parser.add_argument("capture", help="файл записи (.jsonl.gz)")
+    parser.add_argument("--speed", default="1", help="ускорение: 1, 10, ... или max (без пауз)")
+    parser.add_argument("--telegram-latency-ms", type=float, default=0.0, help="задержка эмулятора Telegram")
+    parser.add_argument("--sheets-latency-ms", type=float, default=0.0, help="задержка эмулятора Google Sheets")
+    parser.add_argument("--output", help="куда сохранить отчет (JSON)")
+    parser.add_argument("--compare", help="отчет другой версии кода для сравнения итогов диалогов")
+    args = parser.parse_args(argv)
+
+    speed = None if args.speed == "max" else float(args.speed)
+
+    # Воспроизведение не должно писать трафик заново и трогать настоящие очереди, архив и снимок.
+    # Пустое значение, а не удаление переменной: load_dotenv вернул бы ее из .env, но не перезаписывает заданные
+    os.environ["CAPTURE_FILE_PATH"] = ""
+    os.environ["FSM_SNAPSHOT_PATH"] = ""
+    os.environ["OUTBOX_DIR"] = tempfile.mkdtemp(prefix="replay_outbox_")
+    os.environ["SUPPORT_LOG_ARCHIVE_DIR"] = tempfile.mkdtemp(prefix="replay_archive_")
+
+    records = read_capture(args.capture)
+    records.sort(key=lambda record: record["ts"])
+    report = asyncio.run(replay(records, speed, args.telegram_latency_ms / 1000, args.sheets_latency_ms / 1000))
+
+    latency = report["latency_ms"]
+    print(f"Апдейтов: {report['updates']}, пользователей: {report['users']}, ошибок: {report['errors']}, "
+          f"время: {report['duration_s']} с")
+    if latency:
+        print(f"Задержка, мс: p50 {latency['p50']}, p90 {latency['p90']}, p99 {latency['p99']}, max {latency['max']}")
+    question_latency = report["question_latency_ms"]
+    if question_latency:
+        print(f"Задержка вопроса до обращения, мс: p50 {question_latency['p50']}, p90 {question_latency['p90']}, "
+              f"p99 {question_latency['p99']}, max {question_latency['max']}")
+    print(f"Обращений: {report['tickets']}, уведомлений поддержке: {report['support_notifications']}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+        differences = compare_outcomes(baseline.get("outcomes", {}), report["outcomes"])
+        print(f"Расхождений в итогах диалогов: {len(differences)}")
+        for difference in differences[:20]:
+            print(f"  {difference}")
+        if differences:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -16,11 +16,56 @@ DESCRIPTION_TEXT = (
     
 )
 
-WELCOME_TEXT = (
-    f"👋Привет - я ваш интеллектуальный помощник\n<b>{SPECIALIST_NAME}</b>\n\n"
+# Шаблон приветствия: у каждого арендатора может быть свое имя специалиста
+WELCOME_TEXT_TEMPLATE = (
+    "👋Привет - я ваш интеллектуальный помощник\n<b>{specialist_name}</b>\n\n"
     f"{DESCRIPTION_TEXT}\n"
 )
 
+WELCOME_TEXT = WELCOME_TEXT_TEMPLATE.format(specialist_name=SPECIALIST_NAME)
+
+FAQ_SUGGESTION_TEXT = (
+    "🔎Возможно, ответ на ваш вопрос уже есть.\n"
+    "Выберите подходящий вопрос или создайте обращение:"
+)
+
+FAQ_ANSWER_TEXT = (
+    "❓<b>{question}</b>\n\n"
+    "💡{answer}\n\n"
+    "Помог ли этот ответ?"
+)
+
+FAQ_SOLVED_TEXT = (
+    "🙏Рады, что ответ помог! Если появятся вопросы - нажмите /start"
+)
+
+FAQ_OUTDATED_TEXT = "🔄База ответов обновилась - выберите вопрос еще раз"
+
+FAQ_NO_MATCHES_TEXT = (
+    "🔄База ответов обновилась, и подходящих ответов больше нет.\n"
+    "Создайте обращение или допишите вопрос сообщением:"
+)
+
+FOLLOW_UP_ACCEPTED_TEXT = (
+    "📎Продолжение вашего вопроса добавлено к обращению <b>{id_query}</b>"
+)
+
+BUSY_QUEUED_TEXT = (
+    "⏳Сейчас много обращений - ваше сообщение в очереди, ответим через минуту"
+)
+
+OVERLOADED_TEXT = (
+    "😔Сервис перегружен, пожалуйста, повторите попытку через несколько минут"
+)
+
+FIND_USAGE_TEXT = (
+    "Укажите номер обращения: /find q_123456789_261001120000"
+)
+
+FIND_NOT_FOUND_TEXT = (
+    "🔍Обращение <b>{id_query}</b> не найдено"
+)
+
 #_______________BUTTON_______________________________________________________________________________
 
 HELP_BUTTON_CALLBACK = "help"
@@ -33,4 +78,10 @@ START_BUTTON_TEXT = "🏁Начало работы"
 CANCEL_BUTTON_CALLBACK = "cancel"
 CANCEL_BUTTON_TEXT = "🚫Отмена"
 
+FAQ_ANSWER_CALLBACK_PREFIX = "faq_answer:"
+FAQ_SOLVED_CALLBACK = "faq_solved"
+FAQ_SOLVED_BUTTON_TEXT = "✅Ответ помог"
+FAQ_ESCALATE_CALLBACK = "faq_escalate"
+FAQ_ESCALATE_BUTTON_TEXT = "📝Создать обращение"
+
 
@@ -18,6 +18,13 @@ def sanitize_callback_data(data: str) -> str:
     # Декодируем, игнорируя обрезанные символы
     return encoded.decode("utf-8", "ignore")
 
+def truncate_text(text: str, limit: int) -> str:
+    """Обрезает текст до limit символов для показа (например, в сообщении Telegram), отмечая обрезку."""
+    if len(text) <= limit:
+        return text
+    return text[:limit - 1] + "…"
+
+
 def split_message(response):
 
     """Разбивает длинный текст на части, чтобы избежать ошибки Telegram."""
@@ -1,26 +1,88 @@
 # sheets_utils.py
+import asyncio
+import os
+from typing import Dict
+
 import gspread
 from datetime import datetime
 import pytz # Убедимся, что импортирован
 
 # Убираем TIMEZONE отсюда, он должен быть в config.py
-from app.config import SUPPORT_LOG_WORKSHEET_NAME # TIMEZONE убран
-from app.services.google_sheet_api import get_google_sheets_client, get_support_log_worksheet
+from app.config import (BREAKER_FAILURE_RATE, BREAKER_OPEN_SECONDS, BREAKER_SLOW_CALL_SECONDS, OUTBOX_DIR,
+                        OUTBOX_MAX_ATTEMPTS, GOOGLE_SHEET_NAME, SUPPORT_LOG_WORKSHEET_NAME)
+from app.services.circuit_breaker import CircuitBreaker, CircuitOpenError
+from app.services.outbox import Outbox, outbox_file_name
+from app.services.google_sheet_api import (SUPPORT_LOG_HEADERS, PartitionArchivedError, append_to_archived_partition,
+                                           get_partition_name, get_partition_name_for_id_query,
+                                           get_support_log_worksheet, read_archived_partition)
 from app.utils.logger import setup_logger
 
 logger = setup_logger(__name__)
 
 # Убедись, что эти заголовки ТОЧНО соответствуют ПЕРВОЙ строке в твоей таблице
 # И порядок важен! Если id_query нужен, добавь его сюда и в sheet_log_data.
-EXPECTED_SUPPORT_LOG_HEADERS = [
-    'date', 'user_id', 'user_name', 'query', 'id_query' # Раскомментируй, если есть такой столбец
-]
+EXPECTED_SUPPORT_LOG_HEADERS = SUPPORT_LOG_HEADERS
+
+# Заголовки уже проверенных листов-партиций ((таблица, лист) -> заголовки), чтобы не читать их при каждой записи
+_partition_headers = {}
+
+# Предохранитель и outbox у каждой таблицы свои: удаленная таблица или отозванный доступ
+# одного арендатора не должны останавливать запись у остальных
+_sheets_breakers: Dict[str, CircuitBreaker] = {}
+_sheets_outboxes: Dict[str, Outbox] = {}
+
+
+class SupportLogHeadersError(RuntimeError):
+    """В листе нет ожидаемых заголовков — записать обращение нельзя, пока лист не исправят."""
+
+
+def is_permanent_sheets_error(error: Exception) -> bool:
+    """Ошибка, которую повтор записи не исправит: нет таблицы/листа/заголовков или запрос отклонен (4xx)."""
+    if isinstance(error, (SupportLogHeadersError, gspread.exceptions.SpreadsheetNotFound,
+                          gspread.exceptions.WorksheetNotFound)):
+        return True
+    if isinstance(error, gspread.exceptions.APIError):
+        status = error.response.status_code
+        return 400 <= status < 500 and status not in (408, 429)
+    return False
+
+
+def get_sheets_breaker(sheet_name: str) -> CircuitBreaker:
+    breaker = _sheets_breakers.get(sheet_name)
+    if breaker is None:
+        breaker = _sheets_breakers[sheet_name] = CircuitBreaker(
+            f"google_sheets:{sheet_name}",
+            failure_rate_threshold=BREAKER_FAILURE_RATE,
+            slow_call_seconds=BREAKER_SLOW_CALL_SECONDS,
+            open_timeout=BREAKER_OPEN_SECONDS,
+            # Отсутствие листа — ошибка конфигурации/поиска, а не недоступность Google Sheets
+            ignore_exceptions=(gspread.exceptions.WorksheetNotFound,),
+        )
+    return breaker
+
+
+def get_sheets_outbox(sheet_name: str) -> Outbox:
+    """Обращения, которые не удалось записать в таблицу sheet_name: {"sheet_name", "base_name", "row"}."""
+    outbox = _sheets_outboxes.get(sheet_name)
+    if outbox is None:
+        outbox = _sheets_outboxes[sheet_name] = Outbox(
+            f"google_sheets:{sheet_name}",
+            os.path.join(OUTBOX_DIR, outbox_file_name("support_log", sheet_name)),
+            max_attempts=OUTBOX_MAX_ATTEMPTS,
+            is_permanent=is_permanent_sheets_error,
+        )
+    return outbox
 
 def _get_headers_with_retry(worksheet, retries=3):
-    """Пытается получить заголовки из первой строки листа."""
+    """
+    Пытается получить заголовки из первой строки листа. Возвращает None, если заголовков нет;
+    если прочитать строку не удалось ни разу, бросает последнюю ошибку.
+    """
+    last_error = None
     for i in range(retries):
         try:
             headers = worksheet.row_values(1) # Получаем значения первой строки
+            last_error = None
             if headers and isinstance(headers, list): # Проверяем, что это не пустой список
                 logger.info(f"Получены заголовки из таблицы: {headers}")
                 # Проверяем наличие *всех* ожидаемых заголовков
@@ -33,12 +95,14 @@ def _get_headers_with_retry(worksheet, retries=3):
                 logger.warning(f"Попытка {i+1}: Первая строка пуста или не удалось получить заголовки.")
 
         except gspread.exceptions.APIError as e:
+            last_error = e
             # Обрабатываем специфичные ошибки API, например, квоты
             if e.response.status_code == 429:
                  logger.warning(f"Попытка {i+1}: Ошибка API (429 - Too Many Requests) при чтении заголовков. Ждем...")
             else:
                  logger.warning(f"Попытка {i+1}: Ошибка API Google Sheets ({e.response.status_code}) при чтении заголовков: {e}")
         except Exception as e:
+            last_error = e
             logger.warning(f"Попытка {i+1}: Неожиданная ошибка при чтении заголовков: {e}", exc_info=True)
 
         if i < retries - 1:
@@ -48,42 +112,158 @@ def _get_headers_with_retry(worksheet, retries=3):
             time.sleep(delay)
 
     logger.error(f"Не удалось получить корректные заголовки из листа '{worksheet.title}' после {retries} попыток.")
+    if last_error is not None:
+        raise last_error  # таблица недоступна — это не отсутствие заголовков
     return None # Явно возвращаем None при неудаче
 
-async def add_support_log_to_sheet(user_request_data: dict):
-    """Добавляет строку с данными об обращении пользователя в лист лога поддержки."""
+def _get_partition_headers(worksheet, sheet_name: str):
+    """Возвращает заголовки листа, читая их из таблицы только при первом обращении к партиции."""
+    headers = _partition_headers.get((sheet_name, worksheet.title))
+    if headers is None:
+        headers = _get_headers_with_retry(worksheet)
+        if headers:
+            _partition_headers[(sheet_name, worksheet.title)] = headers
+    return headers
+
+
+def _append_support_log_row(user_request_data: dict, sheet_name: str, base_name: str):
+    """Синхронно записывает строку обращения в лист-партицию. При неудаче бросает исключение."""
+    # Партиция выбирается по времени обращения из id_query, чтобы запись и поиск всегда совпадали
+    partition_name = (get_partition_name_for_id_query(user_request_data.get('id_query', ''), base_name)
+                      or get_partition_name(base_name=base_name))
+    # Получаем (или создаем) нужный лист
     try:
-        worksheet = get_support_log_worksheet() # Получаем нужный лист
-        if not worksheet:
-            # get_support_log_worksheet уже логирует ошибку, если лист не найден
-            return False
+        worksheet = get_support_log_worksheet(partition_name, create=True, sheet_name=sheet_name, base_name=base_name)
+    except PartitionArchivedError:
+        # Обращение опоздало (например, пришло из outbox): его месяц уже в архиве — дописываем туда
+        append_to_archived_partition(partition_name, user_request_data, sheet_name)
+        logger.warning(f"Партиция '{partition_name}' уже в архиве, обращение {user_request_data.get('id_query', 'N/A')} "
+                       f"дописано в архив.")
+        return
 
-        # Получаем ЗАГОЛОВКИ из таблицы, чтобы знать порядок столбцов
-        headers = _get_headers_with_retry(worksheet)
-        if not headers:
-            logger.error("Не удалось добавить запись в лог: не удалось получить заголовки из таблицы.")
-            # Важно! Не пытаемся писать без заголовков
-            return False
+    # Получаем ЗАГОЛОВКИ из таблицы, чтобы знать порядок столбцов
+    headers = _get_partition_headers(worksheet, sheet_name)
+    if not headers:
+        # Важно! Не пытаемся писать без заголовков
+        raise SupportLogHeadersError(f"Не удалось получить заголовки из листа '{worksheet.title}'")
+
+    # Формируем строку данных В СООТВЕТСТВИИ С ПОРЯДКОМ ЗАГОЛОВКОВ В ТАБЛИЦЕ
+    row_to_insert = []
+    for header in headers:
+        # Используем .get() с пустой строкой по умолчанию, если ключ отсутствует в данных
+        # Это безопасно, даже если в таблице больше столбцов, чем данных мы передаем
+        value = user_request_data.get(header, '')
+        row_to_insert.append(str(value)) # Преобразуем в строку на всякий случай
 
-        # Формируем строку данных В СООТВЕТСТВИИ С ПОРЯДКОМ ЗАГОЛОВКОВ В ТАБЛИЦЕ
-        row_to_insert = []
-        for header in headers:
-            # Используем .get() с пустой строкой по умолчанию, если ключ отсутствует в данных
-            # Это безопасно, даже если в таблице больше столбцов, чем данных мы передаем
-            value = user_request_data.get(header, '')
-            row_to_insert.append(str(value)) # Преобразуем в строку на всякий случай
+    logger.debug(f"Подготовлена строка для вставки в '{worksheet.title}': {row_to_insert}")
 
-        logger.debug(f"Подготовлена строка для вставки в '{SUPPORT_LOG_WORKSHEET_NAME}': {row_to_insert}")
+    # Вставляем строку в конец таблицы
+    worksheet.append_row(row_to_insert, value_input_option='USER_ENTERED')
+    logger.info(f"Запись для пользователя '{user_request_data.get('user_name', 'N/A')}' (ID: {user_request_data.get('user_id', 'N/A')}) добавлена в лог '{worksheet.title}'.")
 
-        # Вставляем строку в конец таблицы
-        worksheet.append_row(row_to_insert, value_input_option='USER_ENTERED')
-        logger.info(f"Запись для пользователя '{user_request_data.get('user_name', 'N/A')}' (ID: {user_request_data.get('user_id', 'N/A')}) добавлена в лог '{SUPPORT_LOG_WORKSHEET_NAME}'.")
+
+async def deliver_support_log(item: dict):
+    """Записывает обращение из задания outbox в таблицу через предохранитель, не блокируя цикл событий."""
+    await get_sheets_breaker(item["sheet_name"]).call(
+        asyncio.to_thread, _append_support_log_row, item["row"], item["sheet_name"], item["base_name"]
+    )
+
+
+async def add_support_log_to_sheet(user_request_data: dict, sheet_name: str = GOOGLE_SHEET_NAME,
+                                   base_name: str = SUPPORT_LOG_WORKSHEET_NAME):
+    """
+    Добавляет строку с данными об обращении пользователя в лист-партицию лога поддержки таблицы sheet_name.
+    Если таблица недоступна (или предохранитель разомкнут), обращение откладывается в outbox
+    и будет записано позже; если запись невозможна в принципе — сразу уходит в dead letter outbox.
+    Возвращает True, только если запись уже в таблице.
+    """
+    item = {"sheet_name": sheet_name, "base_name": base_name, "row": user_request_data}
+    try:
+        await deliver_support_log(item)
         return True
 
-    except gspread.exceptions.APIError as e:
-        logger.error(f"Ошибка API Google Sheets при добавлении лога записи: {e}", exc_info=True)
-        # Можно добавить специфическую обработку, например, для ошибки квот 429
+    except CircuitOpenError:
+        logger.warning(f"Google Sheets недоступен (предохранитель разомкнут), обращение {user_request_data.get('id_query', 'N/A')} отложено.")
     except Exception as e:
-        logger.error(f"Непредвиденная ошибка при добавлении лога записи в таблицу: {e}", exc_info=True)
+        if is_permanent_sheets_error(e):
+            # Повтор не поможет — не держим обращение в голове очереди
+            get_sheets_outbox(sheet_name).dead_letter(item, e)
+            return False
+        if isinstance(e, gspread.exceptions.APIError):
+            logger.error(f"Ошибка API Google Sheets при добавлении лога записи: {e}", exc_info=True)
+        else:
+            logger.error(f"Непредвиденная ошибка при добавлении лога записи в таблицу: {e}", exc_info=True)
+
+    get_sheets_outbox(sheet_name).park(item)
+    return False # Возвращаем False при любой ошибке
+
+def _find_archived_support_log(partition_name: str, id_query: str, sheet_name: str):
+    """Ищет обращение в локальном архиве партиции. Возвращает (найден ли архив, запись или None)."""
+    rows = read_archived_partition(partition_name, sheet_name)
+    if rows is None:
+        return False, None
+    headers, records = rows[0], rows[1:]
+    for row in records:
+        record = dict(zip(headers, row))
+        if record.get('id_query') == id_query:
+            return True, record
+    return True, None
+
+
+def _find_sheet_support_log(partition_name: str, id_query: str, sheet_name: str):
+    """Ищет обращение в листе-партиции таблицы. Нет листа — нет и обращения."""
+    try:
+        worksheet = get_support_log_worksheet(partition_name, sheet_name=sheet_name)
+    except gspread.exceptions.WorksheetNotFound:
+        return None
+    headers = _get_partition_headers(worksheet, sheet_name)
+    if not headers or 'id_query' not in headers:
+        return None
+    cell = worksheet.find(id_query, in_column=headers.index('id_query') + 1)
+    if cell is None:
+        return None
+    return dict(zip(headers, worksheet.row_values(cell.row)))
 
-    return False # Возвращаем False при любой ошибке
\ No newline at end of file
+
+async def find_support_log(id_query: str, sheet_name: str = GOOGLE_SHEET_NAME,
+                           base_name: str = SUPPORT_LOG_WORKSHEET_NAME):
+    """
+    Ищет обращение по id_query в его партиции: в локальном архиве, если партиция уже архивирована,
+    иначе в таблице. Обращения, записанные до перехода на партиции, ищутся в общем листе base_name.
+    Возвращает словарь {заголовок: значение} или None, если обращение не найдено.
+    """
+    partition_name = get_partition_name_for_id_query(id_query, base_name)
+    if not partition_name:
+        logger.warning(f"Не удалось определить партицию для id_query '{id_query}'.")
+        return None
+
+    breaker = get_sheets_breaker(sheet_name)
+    try:
+        archived, record = await asyncio.to_thread(_find_archived_support_log, partition_name, id_query, sheet_name)
+        if not archived:
+            record = await breaker.call(asyncio.to_thread, _find_sheet_support_log, partition_name, id_query, sheet_name)
+        if record is None and partition_name != base_name:
+            record = await breaker.call(asyncio.to_thread, _find_sheet_support_log, base_name, id_query, sheet_name)
+        if record is None:
+            logger.info(f"Обращение '{id_query}' не найдено ни в партиции '{partition_name}', ни в листе '{base_name}'.")
+        return record
+
+    except CircuitOpenError:
+        logger.warning(f"Google Sheets недоступен (предохранитель разомкнут), поиск обращения '{id_query}' невозможен.")
+    except Exception as e:
+        logger.error(f"Ошибка при поиске обращения '{id_query}' в партиции '{partition_name}': {e}", exc_info=True)
+    return None
+
+    try:
+        archived, record = await asyncio.to_thread(_find_archived_support_log, partition_name, id_query, sheet_name)
+        if archived:
+            return record
+        return await get_sheets_breaker(sheet_name).call(asyncio.to_thread, _find_sheet_support_log, partition_name, id_query, sheet_name)
+
+    except CircuitOpenError:
+        logger.warning(f"Google Sheets недоступен (предохранитель разомкнут), поиск обращения '{id_query}' невозможен.")
+    except gspread.exceptions.WorksheetNotFound:
+        logger.warning(f"Партиция '{partition_name}' для id_query '{id_query}' не найдена ни в таблице, ни в архиве.")
+    except Exception as e:
+        logger.error(f"Ошибка при поиске обращения '{id_query}' в партиции '{partition_name}': {e}", exc_info=True)
+    return None
@@ -0,0 +1,29 @@
+# tests/conftest.py
+"""Окружение для тестов: app.config читает переменные при импорте, поэтому задаем их до импорта app."""
+
+import os
+import tempfile
+
+_TEST_DIR = tempfile.mkdtemp(prefix="support_bot_tests_")
+_CREDENTIALS_PATH = os.path.join(_TEST_DIR, "credentials.json")
+with open(_CREDENTIALS_PATH, "w") as f:
+    f.write("{}")
+
+os.environ.update({
+    "TELEGRAM_BOT_TOKEN": "123456:TESTtesttesttesttesttesttesttesttest",
+    "GOOGLE_CREDENTIALS_PATH": _CREDENTIALS_PATH,
+    "TIMEZONE": "Europe/Moscow",
+    "SUPPORT_CHAT_ID": "-100",
+    "GOOGLE_SHEET_NAME": "SupportSheet",
+    "SUPPORT_LOG_WORKSHEET_NAME": "Log",
+    "SUPPORT_LOG_PARTITION": "month",
+    "SUPPORT_LOG_HOT_PARTITIONS": "1",
+    "SUPPORT_LOG_ARCHIVE_DIR": os.path.join(_TEST_DIR, "archive"),
+    "OUTBOX_DIR": os.path.join(_TEST_DIR, "outbox"),
+    "LOG_LEVEL": "WARNING",
+})
+
+import app.config  # noqa: E402
+
+# Логгер пишет bot.log в текущую директорию — уводим его из репозитория (до импорта app.utils.logger)
+app.config.LOG_FILE = os.path.join(_TEST_DIR, "bot.log")
@@ -0,0 +1,149 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from app.middlewares.admission import AdmissionControlMiddleware, TenantAdmissionMiddleware
+from app.utils.constants import BUSY_QUEUED_TEXT, OVERLOADED_TEXT
+
+
+@pytest.mark.asyncio
+async def test_slot_limits_concurrency_and_keeps_user_order():
+    control = AdmissionControlMiddleware(max_concurrency=2, max_queue=10, max_pending_per_user=10)
+    running, peak, order = 0, 0, []
+
+    async def work(user_id, n):
+        nonlocal running, peak
+        async with control.slot(user_id):
+            running += 1
+            peak = max(peak, running)
+            await asyncio.sleep(0.01)
+            order.append((user_id, n))
+            running -= 1
+
+    await asyncio.gather(*(work(user_id, n) for n in range(3) for user_id in (1, 2, 3)))
+
+    assert peak == 2
+    for user_id in (1, 2, 3):
+        assert [n for uid, n in order if uid == user_id] == [0, 1, 2]
+    assert control.snapshot()["in_flight"] == 0
+    assert control.snapshot()["admitted"] == 9
+
+
+@pytest.mark.asyncio
+async def test_process_limit_bounds_all_tenants():
+    control = TenantAdmissionMiddleware(max_concurrency=3, max_queue=100, max_pending_per_user=10)
+    tenants = [SimpleNamespace(id=f"t{n}", max_concurrency=2) for n in range(3)]
+    running, peak, peak_by_tenant = 0, 0, {}
+    running_by_tenant = {tenant.id: 0 for tenant in tenants}
+
+    async def work(tenant, user_id):
+        nonlocal running, peak
+        async with control.slot(tenant, user_id):
+            running += 1
+            running_by_tenant[tenant.id] += 1
+            peak = max(peak, running)
+            peak_by_tenant[tenant.id] = max(peak_by_tenant.get(tenant.id, 0), running_by_tenant[tenant.id])
+            await asyncio.sleep(0.01)
+            running -= 1
+            running_by_tenant[tenant.id] -= 1
+
+    await asyncio.gather(*(work(tenant, user_id) for tenant in tenants for user_id in range(4)))
+
+    assert peak == 3
+    assert max(peak_by_tenant.values()) <= 2
+    assert control.global_snapshot() == {"in_flight": 0, "max_concurrency": 3}
+
+
+class FakeMessage:
+    def __init__(self):
+        self.answers = []
+
+    async def answer(self, text):
+        self.answers.append(text)
+
+
+def make_update(update_id, user_id):
+    return SimpleNamespace(update_id=update_id, message=FakeMessage(), callback_query=None), \
+        {"event_from_user": SimpleNamespace(id=user_id)}
+
+
+class BlockingHandler:
+    def __init__(self):
+        self.release = asyncio.Event()
+        self.handled = []
+
+    async def __call__(self, event, data):
+        self.handled.append(event.update_id)
+        await self.release.wait()
+
+
+@pytest.mark.asyncio
+async def test_full_queue_is_shed_with_overloaded_reply():
+    control = AdmissionControlMiddleware(max_concurrency=1, max_queue=1, max_pending_per_user=10)
+    handler = BlockingHandler()
+    updates = [make_update(n, user_id=n) for n in range(3)]
+
+    running = asyncio.create_task(control(handler, *updates[0]))
+    await asyncio.sleep(0)
+    waiting = asyncio.create_task(control(handler, *updates[1]))
+    await asyncio.sleep(0)
+    await control(handler, *updates[2])
+
+    assert updates[2][0].message.answers == [OVERLOADED_TEXT]
+    assert control.snapshot()["shed"] == 1
+
+    handler.release.set()
+    await asyncio.gather(running, waiting)
+    assert handler.handled == [0, 1]
+
+
+@pytest.mark.asyncio
+async def test_user_over_pending_limit_is_shed():
+    control = AdmissionControlMiddleware(max_concurrency=5, max_queue=100, max_pending_per_user=2)
+    handler = BlockingHandler()
+    updates = [make_update(n, user_id=1) for n in range(3)]
+
+    tasks = [asyncio.create_task(control(handler, *update)) for update in updates[:2]]
+    await asyncio.sleep(0)
+    await control(handler, *updates[2])
+
+    assert updates[2][0].message.answers == [OVERLOADED_TEXT]
+    # Другой пользователь проходит: лимит личный
+    other = make_update(3, user_id=2)
+    tasks.append(asyncio.create_task(control(handler, *other)))
+    await asyncio.sleep(0)
+    assert other[0].message.answers == []
+
+    handler.release.set()
+    await asyncio.gather(*tasks)
+    assert sorted(handler.handled) == [0, 1, 3]
+
+
+@pytest.mark.asyncio
+async def test_busy_reply_is_sent_once_per_wait():
+    control = AdmissionControlMiddleware(max_concurrency=1, max_queue=100, max_pending_per_user=10)
+    handler = BlockingHandler()
+
+    running = asyncio.create_task(control(handler, *make_update(0, user_id=1)))
+    await asyncio.sleep(0)
+    queued = [make_update(n, user_id=2) for n in range(1, 4)]
+    tasks = [asyncio.create_task(control(handler, *update)) for update in queued]
+    await asyncio.sleep(0.01)
+
+    assert [update[0].message.answers for update in queued] == [[BUSY_QUEUED_TEXT], [], []]
+
+    handler.release.set()
+    await asyncio.gather(running, *tasks)
+    assert handler.handled == [0, 1, 2, 3]
+
+    # Новое ожидание — новое уведомление
+    handler.release.clear()
+    running = asyncio.create_task(control(handler, *make_update(4, user_id=1)))
+    await asyncio.sleep(0)
+    update = make_update(5, user_id=2)
+    task = asyncio.create_task(control(handler, *update))
+    await asyncio.sleep(0.01)
+    assert update[0].message.answers == [BUSY_QUEUED_TEXT]
+    handler.release.set()
+    await asyncio.gather(running, task)
@@ -0,0 +1,38 @@
+import json
+
+from aiogram.types import Update
+
+from app.middlewares.capture import anonymize_update, hash_user_id
+
+SALT = "salt"
+
+
+def test_personal_data_is_removed_and_ids_hashed():
+    raw = {"update_id": 1, "message": {
+        "message_id": 1, "date": 0, "text": "вопрос",
+        "chat": {"id": 5, "type": "private", "first_name": "Иван"},
+        "from": {"id": 5, "is_bot": False, "first_name": "Иван", "last_name": "Петров", "username": "ivan"},
+        "sender_user": {"id": 5, "is_bot": False, "first_name": "Иван"},
+        "contact": {"phone_number": "+79990001122", "first_name": "Иван", "last_name": "Петров",
+                    "user_id": 5, "vcard": "BEGIN:VCARD"},
+        "forward_origin": {"type": "hidden_user", "date": 0, "sender_user_name": "Иван Петров"},
+        "new_chat_members": [{"id": 7, "is_bot": False, "first_name": "Анна"}],
+    }}
+
+    anonymized = anonymize_update(raw, SALT)
+    dumped = json.dumps(anonymized, ensure_ascii=False)
+    for secret in ("Иван", "Петров", "ivan", "79990001122", "VCARD", "Анна"):
+        assert secret not in dumped
+
+    message = Update.model_validate(anonymized).message  # запись остается валидным апдейтом
+    hashed = hash_user_id(5, SALT)
+    assert message.from_user.id == message.chat.id == message.contact.user_id == hashed
+    assert anonymized["message"]["sender_user"]["id"] == hashed
+    assert message.new_chat_members[0].id == hash_user_id(7, SALT)
+    assert message.text == "вопрос"
+
+
+def test_group_chat_id_is_kept():
+    raw = {"update_id": 1, "message": {"message_id": 1, "date": 0,
+                                       "chat": {"id": -100, "type": "supergroup", "title": "Поддержка"}}}
+    assert anonymize_update(raw, SALT)["message"]["chat"] == {"id": -100, "type": "supergroup"}
@@ -0,0 +1,116 @@
+import asyncio
+
+import pytest
+
+from app.services import circuit_breaker
+from app.services.circuit_breaker import CircuitBreaker, CircuitOpenError, CircuitState, circuit_breakers
+
+
+class IgnoredError(Exception):
+    pass
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(circuit_breaker.time, "monotonic", lambda: now[0])
+    return now
+
+
+@pytest.fixture
+def breaker(clock):
+    breaker = CircuitBreaker("test", failure_rate_threshold=0.5, slow_call_seconds=5, window_size=10,
+                             min_calls=4, open_timeout=30, ignore_exceptions=(IgnoredError,))
+    yield breaker
+    circuit_breakers.pop("test", None)
+
+
+async def ok():
+    return "ok"
+
+
+async def fail():
+    raise ConnectionError("down")
+
+
+async def ignored():
+    raise IgnoredError("bad request")
+
+
+async def call(breaker, func):
+    try:
+        return await breaker.call(func)
+    except (ConnectionError, IgnoredError):
+        return None
+
+
+@pytest.mark.asyncio
+async def test_opens_on_failure_rate_and_rejects_calls(breaker):
+    for func in (ok, fail, ok):
+        await call(breaker, func)
+    assert breaker.state == CircuitState.CLOSED  # меньше min_calls вызовов
+
+    await call(breaker, fail)
+    assert breaker.state == CircuitState.OPEN
+    with pytest.raises(CircuitOpenError):
+        await breaker.call(ok)
+    assert breaker.snapshot()["rejected"] == 1
+
+
+@pytest.mark.asyncio
+async def test_ignored_exceptions_do_not_open(breaker):
+    for _ in range(6):
+        await call(breaker, ignored)
+    assert breaker.state == CircuitState.CLOSED
+
+
+@pytest.mark.asyncio
+async def test_slow_calls_open(breaker, clock):
+    async def slow():
+        clock[0] += 6
+
+    for _ in range(4):
+        await breaker.call(slow)
+    assert breaker.state == CircuitState.OPEN
+
+
+@pytest.mark.asyncio
+async def test_half_open_probe_closes_or_reopens(breaker, clock):
+    for _ in range(4):
+        await call(breaker, fail)
+    assert breaker.state == CircuitState.OPEN
+
+    clock[0] += 30
+    assert breaker.state == CircuitState.HALF_OPEN
+    assert breaker.allow_request()
+    assert not breaker.allow_request()  # одна проба за раз
+    breaker._record(failed=True, duration=0)
+    assert breaker.state == CircuitState.OPEN
+
+    clock[0] += 30
+    assert await breaker.call(ok) == "ok"
+    assert breaker.state == CircuitState.CLOSED
+    assert breaker.snapshot()["calls_in_window"] == 0
+
+
+@pytest.mark.asyncio
+async def test_cancelled_probe_releases_its_slot(breaker, clock):
+    for _ in range(4):
+        await call(breaker, fail)
+    clock[0] += 30
+
+    started = asyncio.Event()
+
+    async def hanging():
+        started.set()
+        await asyncio.sleep(10)
+
+    probe = asyncio.create_task(breaker.call(hanging))
+    await started.wait()
+    probe.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await probe
+
+    assert breaker.state == CircuitState.HALF_OPEN
+    assert await breaker.call(ok) == "ok"
+    assert breaker.state == CircuitState.CLOSED
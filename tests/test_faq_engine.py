@@ -0,0 +1,53 @@
+import csv
+
+import pytest
+import pytest_asyncio
+
+from app.services.faq_engine import FaqEngine
+
+ENTRIES = [
+    {"id": "password", "question": "Как сбросить пароль?",
+     "answer": "Нажмите «Забыли пароль» на странице входа, ссылка придет на почту."},
+    {"id": "payment", "question": "Не проходит оплата картой",
+     "answer": "Проверьте лимиты карты или оплатите через СБП."},
+    {"id": "delivery", "question": "Сколько идет доставка?",
+     "answer": "Доставка занимает от двух до пяти рабочих дней."},
+]
+
+
+@pytest_asyncio.fixture
+async def engine(tmp_path):
+    path = tmp_path / "faq.csv"
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=["id", "question", "answer"])
+        writer.writeheader()
+        writer.writerows(ENTRIES)
+    engine = FaqEngine(str(path), top_k=3, min_score=0.2)
+    assert await engine.reload_if_changed()
+    return engine
+
+
+@pytest.mark.asyncio
+async def test_search_finds_best_match_by_word_forms(engine):
+    matches = engine.search("забыл пароль, как его сбросить")
+    assert matches[0][0].id == "password"
+    assert [score for _, score in matches] == sorted((score for _, score in matches), reverse=True)
+
+    assert engine.search("оплатой картой проблема")[0][0].id == "payment"
+
+
+@pytest.mark.asyncio
+async def test_search_returns_nothing_for_unrelated_text(engine):
+    assert engine.search("здравствуйте") == []  # только стоп-слова
+    assert engine.search("погода в москве") == []
+
+
+@pytest.mark.asyncio
+async def test_search_respects_top_k_and_min_score(engine):
+    assert len(engine.search("пароль оплата доставка", top_k=1)) == 1
+    engine.min_score = 0.99
+    assert engine.search("как сбросить пароль на почту") == []
+
+
+def test_search_without_knowledge_base():
+    assert FaqEngine(None).search("пароль") == []
@@ -0,0 +1,116 @@
+import csv
+
+import pytest
+import pytest_asyncio
+from aiogram import Bot, Dispatcher
+from aiogram.types import Update
+
+from app.handlers.dispatcher import setup_dispatcher
+from app.handlers.process_query import question_aggregator
+from app.services.faq_engine import faq_engine
+from app.services.google_sheet_api import SUPPORT_LOG_HEADERS, set_google_sheets_client
+from app.services.tenants import DEFAULT_TENANT_ID, tenant_registry
+from app.stats.question_stats import QuestionStates
+from app.tools.replay import FakeSheetsClient, FakeTelegramSession
+from app.utils.constants import FAQ_ANSWER_CALLBACK_PREFIX, FAQ_SOLVED_CALLBACK, START_QUERY_CALLBACK
+
+USER_ID = 7
+
+
+@pytest_asyncio.fixture
+async def bot_env(tmp_path, monkeypatch):
+    path = tmp_path / "faq.csv"
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=["id", "question", "answer"])
+        writer.writeheader()
+        writer.writerow({"id": "password", "question": "Как сбросить пароль?",
+                         "answer": "Нажмите «Забыли пароль» на странице входа."})
+    monkeypatch.setattr(faq_engine, "path", str(path))
+    monkeypatch.setattr(faq_engine, "_index", None)
+    monkeypatch.setattr(faq_engine, "_mtime", None)
+    await faq_engine.reload_if_changed()
+    monkeypatch.setattr(question_aggregator, "quiet_window", 0)
+
+    sheets = FakeSheetsClient(0, SUPPORT_LOG_HEADERS)
+    set_google_sheets_client(sheets)
+    telegram = FakeTelegramSession()
+    bot = Bot(token=tenant_registry.get(DEFAULT_TENANT_ID).token, session=telegram)
+    dp = Dispatcher()
+    setup_dispatcher(dp)
+    env = BotEnv(dp, bot, sheets)
+    # Пользователь задал вопрос, на который в FAQ есть ответ
+    await env.message("/start")
+    await env.callback(START_QUERY_CALLBACK)
+    await env.message("забыл пароль, как сбросить")
+    assert await env.state() == QuestionStates.waiting_for_faq_decision.state
+    yield env
+    set_google_sheets_client(None)
+
+
+class BotEnv:
+    def __init__(self, dp, bot, sheets):
+        self.dp, self.bot, self.sheets = dp, bot, sheets
+        self._update_id = 0
+
+    def _next_id(self):
+        self._update_id += 1
+        return self._update_id
+
+    async def _feed(self, raw):
+        await self.dp.feed_update(self.bot, Update.model_validate(raw, context={"bot": self.bot}))
+        await question_aggregator.flush_all()
+
+    async def message(self, text):
+        update_id = self._next_id()
+        await self._feed({"update_id": update_id, "message": {
+            "message_id": update_id, "date": 0, "text": text,
+            "chat": {"id": USER_ID, "type": "private"},
+            "from": {"id": USER_ID, "is_bot": False, "first_name": "user"},
+        }})
+
+    async def callback(self, data):
+        update_id = self._next_id()
+        await self._feed({"update_id": update_id, "callback_query": {
+            "id": str(update_id), "chat_instance": "chat", "data": data,
+            "from": {"id": USER_ID, "is_bot": False, "first_name": "user"},
+            "message": {"message_id": 1, "date": 0, "text": "menu", "chat": {"id": USER_ID, "type": "private"}},
+        }})
+
+    def context(self):
+        return self.dp.fsm.get_context(self.bot, chat_id=USER_ID, user_id=USER_ID)
+
+    async def state(self):
+        return await self.context().get_state()
+
+    def tickets(self):
+        return [row for spreadsheet in self.sheets.spreadsheets.values()
+                for worksheet in spreadsheet.worksheets() for row in worksheet.rows[1:]]
+
+
+@pytest.mark.asyncio
+async def test_typed_reply_files_one_ticket_with_both_texts(bot_env):
+    await bot_env.message("письмо для сброса не приходит")
+
+    tickets = bot_env.tickets()
+    assert len(tickets) == 1
+    query = tickets[0][SUPPORT_LOG_HEADERS.index("query")]
+    assert query == "забыл пароль, как сбросить\nписьмо для сброса не приходит"
+
+
+@pytest.mark.asyncio
+async def test_solved_files_no_ticket(bot_env):
+    await bot_env.callback(FAQ_SOLVED_CALLBACK)
+
+    assert bot_env.tickets() == []
+    assert await bot_env.state() is None
+
+
+@pytest.mark.asyncio
+async def test_answer_removed_by_reload_is_offered_again(bot_env):
+    await bot_env.context().update_data(faq_matches=["removed"])
+
+    await bot_env.callback(f"{FAQ_ANSWER_CALLBACK_PREFIX}removed")
+
+    assert bot_env.tickets() == []
+    assert await bot_env.state() == QuestionStates.waiting_for_faq_decision.state
+    assert (await bot_env.context().get_data())["faq_matches"] == ["password"]
@@ -0,0 +1,59 @@
+import os
+from datetime import datetime
+from time import time as real_time
+
+from aiogram.fsm.storage.base import StorageKey
+from aiogram.fsm.storage.memory import MemoryStorage, MemoryStorageRecord
+from aiogram.types import Chat, Message, Update, User
+
+from app.services import fsm_snapshot
+from app.services.fsm_snapshot import PendingWork, dump_update, load_fsm_snapshot, save_fsm_snapshot
+
+KEY = StorageKey(bot_id=42, chat_id=1, user_id=1)
+
+
+def make_update(update_id, text):
+    return Update(update_id=update_id, message=Message(
+        message_id=update_id, date=datetime(2026, 10, 1), chat=Chat(id=1, type="private"),
+        from_user=User(id=1, is_bot=False, first_name="U"), text=text,
+    ))
+
+
+def test_snapshot_round_trip_with_pending_work(tmp_path):
+    path = str(tmp_path / "snapshot.json.gz")
+    storage = MemoryStorage()
+    storage.storage[KEY] = MemoryStorageRecord(data={"query": "вопрос"}, state="QuestionStates:waiting_for_question")
+    storage.storage[StorageKey(bot_id=42, chat_id=2, user_id=2)] = MemoryStorageRecord()  # пустая — не сохраняется
+    question = {"key": {"bot_id": 42, "chat_id": 1, "user_id": 1}, "message": {}, "parts": ["a", "b"],
+                "follow_up": False, "previous": None}
+    pending = PendingWork(updates=[dump_update(42, make_update(7, "текст"))], questions=[question],
+                          last_update_ids={42: 7})
+
+    assert save_fsm_snapshot(storage, path, pending) == 1
+
+    restored_storage = MemoryStorage()
+    restored = load_fsm_snapshot(restored_storage, path)
+    assert not os.path.exists(path)
+    assert restored.restored_states == 1
+    assert restored_storage.storage[KEY].data == {"query": "вопрос"}
+    assert restored.last_update_ids == {42: 7}
+    assert restored.questions == [question]
+    update = Update.model_validate(restored.updates[0]["update"])
+    assert (restored.updates[0]["bot_id"], update.message.text, update.message.from_user.id) == (42, "текст", 1)
+
+
+def test_missing_snapshot(tmp_path):
+    assert load_fsm_snapshot(MemoryStorage(), str(tmp_path / "missing.json.gz")) is None
+
+
+def test_stale_snapshot_is_rejected(tmp_path, monkeypatch):
+    path = str(tmp_path / "snapshot.json.gz")
+    storage = MemoryStorage()
+    storage.storage[KEY] = MemoryStorageRecord(state="QuestionStates:waiting_for_question")
+    save_fsm_snapshot(storage, path)
+
+    monkeypatch.setattr(fsm_snapshot.time, "time", lambda: real_time() + 601)
+    restored_storage = MemoryStorage()
+    assert load_fsm_snapshot(restored_storage, path, max_age=600) is None
+    assert not restored_storage.storage
+    assert not os.path.exists(path)
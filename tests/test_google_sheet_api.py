@@ -0,0 +1,217 @@
+import threading
+import time
+from datetime import datetime
+from types import SimpleNamespace
+
+import gspread
+import pytest
+
+from app.services import google_sheet_api
+from app.services.google_sheet_api import (SUPPORT_LOG_HEADERS, archive_cold_partitions, get_partition_name,
+                                           get_partition_name_for_id_query, read_archived_partition,
+                                           set_google_sheets_client)
+from app.utils.google_sheet_utils import (_append_support_log_row, add_support_log_to_sheet, find_support_log,
+                                          get_sheets_breaker, get_sheets_outbox)
+
+SHEET = "SupportSheet"
+
+
+class FakeWorksheet:
+    def __init__(self, title):
+        self.title = title
+        self.rows = []
+
+    def row_values(self, row):
+        return list(self.rows[row - 1]) if len(self.rows) >= row else []
+
+    def append_row(self, values, value_input_option=None):
+        self.rows.append(list(values))
+
+    def get_all_values(self):
+        return [list(row) for row in self.rows]
+
+    def find(self, query, in_column=None):
+        for number, row in enumerate(self.rows, start=1):
+            if len(row) >= in_column and row[in_column - 1] == query:
+                return SimpleNamespace(row=number, col=in_column)
+        return None
+
+
+class FakeSpreadsheet:
+    def __init__(self):
+        self.sheets = {}
+
+    def worksheet(self, title):
+        if title not in self.sheets:
+            raise gspread.exceptions.WorksheetNotFound(title)
+        return self.sheets[title]
+
+    def worksheets(self):
+        return list(self.sheets.values())
+
+    def add_worksheet(self, title, rows, cols):
+        if title in self.sheets:
+            raise gspread.exceptions.GSpreadException(f"A sheet with the name \"{title}\" already exists.")
+        time.sleep(0.05)  # окно, в котором параллельный поток тоже не видит нового листа
+        self.sheets[title] = FakeWorksheet(title)
+        return self.sheets[title]
+
+    def del_worksheet(self, worksheet):
+        del self.sheets[worksheet.title]
+
+
+class FakeClient:
+    def __init__(self):
+        self.spreadsheet = FakeSpreadsheet()
+
+    def open(self, name):
+        return self.spreadsheet
+
+
+@pytest.fixture
+def spreadsheet(tmp_path, monkeypatch):
+    monkeypatch.setattr(google_sheet_api, "SUPPORT_LOG_ARCHIVE_DIR", str(tmp_path / "archive"))
+    client = FakeClient()
+    set_google_sheets_client(client)
+    yield client.spreadsheet
+    set_google_sheets_client(None)
+
+
+def ticket(id_query, query="вопрос"):
+    return {"date": "2026-09-30 23:59:59", "user_id": "1", "user_name": "user", "query": query, "id_query": id_query}
+
+
+def write(row):
+    _append_support_log_row(row, SHEET, "Log")
+
+
+def test_partition_name_by_month():
+    assert get_partition_name(datetime(2026, 9, 30, 23, 59), base_name="Log") == "Log_2026_09"
+
+
+def test_partition_name_for_id_query():
+    assert get_partition_name_for_id_query("q_1_260930235959", "Log") == "Log_2026_09"
+    assert get_partition_name_for_id_query("q_1_261001000000", "Log") == "Log_2026_10"
+    assert get_partition_name_for_id_query("not-an-id", "Log") is None
+
+
+def test_rollover_archives_cold_partition(spreadsheet):
+    write(ticket("q_1_260915120000"))
+    write(ticket("q_1_261001120000"))
+
+    assert list(spreadsheet.sheets) == ["Log_2026_10"]
+    archived = read_archived_partition("Log_2026_09", SHEET)
+    assert archived[0] == SUPPORT_LOG_HEADERS
+    assert [row[4] for row in archived[1:]] == ["q_1_260915120000"]
+
+
+def test_late_write_goes_to_archive_and_keeps_it(spreadsheet):
+    write(ticket("q_1_260915120000", "ранний"))
+    write(ticket("q_1_261001120000"))
+
+    # Обращение из outbox за уже архивированный сентябрь
+    write(ticket("q_1_260930235959", "поздний"))
+
+    assert list(spreadsheet.sheets) == ["Log_2026_10"]
+    archived = read_archived_partition("Log_2026_09", SHEET)
+    assert [row[3] for row in archived[1:]] == ["ранний", "поздний"]
+
+    # Повторная архивация не трогает архив сентября
+    archive_cold_partitions(sheet_name=SHEET, base_name="Log")
+    assert read_archived_partition("Log_2026_09", SHEET) == archived
+
+
+def test_archive_merges_into_existing_file(spreadsheet):
+    write(ticket("q_1_260915120000", "первый"))
+    write(ticket("q_1_261001120000"))
+
+    # Лист сентября появился снова (например, создан вручную) — архив дополняется, а не перезаписывается
+    worksheet = spreadsheet.add_worksheet("Log_2026_09", rows=10, cols=5)
+    worksheet.append_row(SUPPORT_LOG_HEADERS)
+    worksheet.append_row(list(ticket("q_1_260916120000", "второй").values()))
+    worksheet.append_row(list(ticket("q_1_260915120000", "первый").values()))
+    archive_cold_partitions(sheet_name=SHEET, base_name="Log")
+
+    archived = read_archived_partition("Log_2026_09", SHEET)
+    assert [row[3] for row in archived[1:]] == ["первый", "второй"]
+
+
+def test_without_archive_dir_cold_partitions_stay_in_sheet(spreadsheet, monkeypatch):
+    monkeypatch.setattr(google_sheet_api, "SUPPORT_LOG_ARCHIVE_DIR", None)
+    write(ticket("q_1_260915120000"))
+    write(ticket("q_1_261001120000"))
+
+    assert sorted(spreadsheet.sheets) == ["Log_2026_09", "Log_2026_10"]
+    assert read_archived_partition("Log_2026_09", SHEET) is None
+
+
+def test_concurrent_first_writes_create_partition_once(spreadsheet):
+    threads = [threading.Thread(target=write, args=(ticket(f"q_{n}_261001120000"),)) for n in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    rows = spreadsheet.sheets["Log_2026_10"].rows
+    assert rows[0] == SUPPORT_LOG_HEADERS
+    assert sorted(row[4] for row in rows[1:]) == ["q_0_261001120000", "q_1_261001120000"]
+
+
+@pytest.mark.asyncio
+async def test_missing_spreadsheet_does_not_block_other_sheets(spreadsheet, monkeypatch):
+    client = google_sheet_api.get_google_sheets_client()
+    open_spreadsheet = client.open
+
+    def open_or_fail(name):
+        if name == "Deleted":
+            raise gspread.exceptions.SpreadsheetNotFound(name)
+        return open_spreadsheet(name)
+
+    monkeypatch.setattr(client, "open", open_or_fail)
+
+    for n in range(5):
+        assert not await add_support_log_to_sheet(ticket(f"q_{n}_261001120000"), sheet_name="Deleted", base_name="Log")
+
+    # Запись невозможна — обращения в dead letter, а не в голове очереди
+    assert len(get_sheets_outbox("Deleted")) == 0
+    assert get_sheets_outbox("Deleted")._dead == 5
+    assert get_sheets_breaker("Deleted").state.value == "open"
+
+    # Таблица другого арендатора работает
+    assert get_sheets_breaker(SHEET).state.value == "closed"
+    assert await add_support_log_to_sheet(ticket("q_9_261001120000"), sheet_name=SHEET, base_name="Log")
+    assert spreadsheet.sheets["Log_2026_10"].rows[-1][4] == "q_9_261001120000"
+
+
+@pytest.mark.asyncio
+async def test_find_support_log_in_sheet_partition(spreadsheet):
+    write(ticket("q_1_261001120000", "октябрь"))
+
+    record = await find_support_log("q_1_261001120000", sheet_name=SHEET, base_name="Log")
+
+    assert record["query"] == "октябрь"
+    assert await find_support_log("q_2_261001120000", sheet_name=SHEET, base_name="Log") is None
+
+
+@pytest.mark.asyncio
+async def test_find_support_log_in_archived_partition(spreadsheet):
+    write(ticket("q_1_260915120000", "сентябрь"))
+    write(ticket("q_1_261001120000"))
+    assert "Log_2026_09" not in spreadsheet.sheets
+
+    record = await find_support_log("q_1_260915120000", sheet_name=SHEET, base_name="Log")
+
+    assert record["query"] == "сентябрь"
+
+
+@pytest.mark.asyncio
+async def test_find_support_log_in_sheet_before_partitioning(spreadsheet):
+    # Обращения, записанные до перехода на партиции, остались в общем листе
+    legacy = spreadsheet.add_worksheet("Log", rows=10, cols=5)
+    legacy.append_row(SUPPORT_LOG_HEADERS)
+    legacy.append_row(list(ticket("q_1_260801120000", "старый").values()))
+    write(ticket("q_1_261001120000"))
+
+    record = await find_support_log("q_1_260801120000", sheet_name=SHEET, base_name="Log")
+
+    assert record["query"] == "старый"
@@ -0,0 +1,124 @@
+import json
+
+import pytest
+
+from app.services.circuit_breaker import CircuitOpenError
+from app.services.outbox import Outbox, outboxes
+
+
+class PermanentError(Exception):
+    pass
+
+
+@pytest.fixture
+def make_outbox(tmp_path):
+    created = []
+
+    def make(**kwargs):
+        outbox = Outbox(f"test_{len(created)}", str(tmp_path / f"test_{len(created)}.jsonl"), **kwargs)
+        created.append(outbox)
+        return outbox
+
+    yield make
+    for outbox in created:
+        outboxes.pop(outbox.name, None)
+
+
+def read_dead_letters(outbox):
+    with open(outbox.dead_letter_path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f]
+
+
+@pytest.mark.asyncio
+async def test_flush_keeps_order_and_stops_on_transient_error(make_outbox):
+    outbox = make_outbox()
+    for n in range(3):
+        outbox.park({"n": n})
+    delivered = []
+
+    async def handler(item):
+        if item["n"] == 1 and not delivered[1:]:
+            delivered.append("failed")
+            raise ConnectionError("timeout")
+        delivered.append(item["n"])
+
+    assert await outbox.flush(handler) == 1
+    assert len(outbox) == 2
+    assert await outbox.flush(handler) == 2
+    assert delivered == [0, "failed", 1, 2]
+    assert len(outbox) == 0
+
+
+@pytest.mark.asyncio
+async def test_open_circuit_is_not_counted_as_attempt(make_outbox):
+    outbox = make_outbox(max_attempts=1)
+    outbox.park({"n": 0})
+
+    async def handler(item):
+        raise CircuitOpenError("test")
+
+    assert await outbox.flush(handler) == 0
+    assert len(outbox) == 1
+    assert outbox._dead == 0
+
+
+@pytest.mark.asyncio
+async def test_permanent_error_moves_item_to_dead_letter(make_outbox):
+    outbox = make_outbox(is_permanent=lambda error: isinstance(error, PermanentError))
+    for n in range(3):
+        outbox.park({"n": n})
+    delivered = []
+
+    async def handler(item):
+        if item["n"] == 0:
+            raise PermanentError("bad request")
+        delivered.append(item["n"])
+
+    assert await outbox.flush(handler) == 2
+    assert delivered == [1, 2]
+    assert len(outbox) == 0
+    dead = read_dead_letters(outbox)
+    assert [record["item"]["n"] for record in dead] == [0]
+    assert "PermanentError" in dead[0]["error"]
+
+
+@pytest.mark.asyncio
+async def test_item_goes_to_dead_letter_after_max_attempts(make_outbox):
+    outbox = make_outbox(max_attempts=3)
+    outbox.park({"n": 0})
+    outbox.park({"n": 1})
+    delivered = []
+
+    async def handler(item):
+        if item["n"] == 0:
+            raise ConnectionError("still failing")
+        delivered.append(item["n"])
+
+    assert await outbox.flush(handler) == 0
+    assert await outbox.flush(handler) == 0
+    assert await outbox.flush(handler) == 1
+    assert delivered == [1]
+    assert [record["item"]["_attempts"] for record in read_dead_letters(outbox)] == [3]
+
+
+@pytest.mark.asyncio
+async def test_items_and_attempts_survive_restart(make_outbox, tmp_path):
+    outbox = make_outbox(max_attempts=2)
+    outbox.park({"n": 0})
+
+    async def failing(item):
+        raise ConnectionError("down")
+
+    await outbox.flush(failing)
+    outboxes.pop(outbox.name)
+
+    restarted = Outbox(outbox.name, outbox.path, max_attempts=2)
+    try:
+        assert len(restarted) == 1
+        await restarted.flush(failing)
+        assert len(restarted) == 0
+        assert restarted._dead == 1
+        assert Outbox(f"{outbox.name}_copy", outbox.path)._dead == 1
+    finally:
+        outboxes.pop(outbox.name, None)
+        outboxes.pop(f"{outbox.name}_copy", None)
@@ -0,0 +1,141 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+from aiogram.fsm.storage.base import StorageKey
+
+from app.services.question_aggregator import QuestionAggregator
+
+
+def make_state(user_id=1):
+    return SimpleNamespace(key=StorageKey(bot_id=42, chat_id=user_id, user_id=user_id))
+
+
+class Recorder:
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.calls = []
+
+    async def __call__(self, message, state, text, follow_up, previous):
+        await asyncio.sleep(self.delay)
+        self.calls.append({"text": text, "follow_up": follow_up, "previous": previous})
+        return f"ticket{len(self.calls)}"
+
+
+@pytest.mark.asyncio
+async def test_messages_within_quiet_window_are_merged():
+    recorder = Recorder()
+    aggregator = QuestionAggregator(recorder, quiet_window=0.05, max_messages=10, max_chars=1000)
+    state = make_state()
+    for text in ("Привет", "не работает", "оплата"):
+        aggregator.add(None, state, text)
+        await asyncio.sleep(0.01)
+
+    assert recorder.calls == []
+    await asyncio.sleep(0.1)
+    assert recorder.calls == [{"text": "Привет\nне работает\nоплата", "follow_up": False, "previous": None}]
+
+
+@pytest.mark.asyncio
+async def test_overflow_files_the_rest_as_follow_up():
+    recorder = Recorder(delay=0.05)
+    aggregator = QuestionAggregator(recorder, quiet_window=0.05, max_messages=10, max_chars=10_000)
+    state = make_state()
+    for n in range(12):
+        aggregator.add(None, state, f"part{n}")
+
+    await aggregator.flush_all()
+
+    assert [call["text"].split("\n") for call in recorder.calls] == [
+        [f"part{n}" for n in range(10)],
+        ["part10", "part11"],
+    ]
+    assert recorder.calls[1]["follow_up"] is True
+    assert recorder.calls[1]["previous"] == "ticket1"
+
+
+@pytest.mark.asyncio
+async def test_long_text_is_not_truncated():
+    recorder = Recorder()
+    aggregator = QuestionAggregator(recorder, quiet_window=1, max_messages=10, max_chars=100)
+    text = "x" * 250
+    aggregator.add(None, make_state(), text)
+
+    await aggregator.flush_all()
+
+    assert recorder.calls[0]["text"] == text
+
+
+@pytest.mark.asyncio
+async def test_message_right_after_processing_is_a_follow_up():
+    recorder = Recorder()
+    aggregator = QuestionAggregator(recorder, quiet_window=0.05, max_messages=10, max_chars=1000)
+    state = make_state()
+    aggregator.add(None, state, "вопрос")
+    await asyncio.sleep(0.07)
+    assert aggregator.is_collecting(state.key)
+
+    aggregator.add(None, state, "забыл добавить")
+    await asyncio.sleep(0.07)
+    assert recorder.calls[1] == {"text": "забыл добавить", "follow_up": True, "previous": "ticket1"}
+
+    await asyncio.sleep(0.1)
+    assert not aggregator.is_collecting(state.key)
+
+
+@pytest.mark.asyncio
+async def test_users_are_aggregated_separately():
+    recorder = Recorder()
+    aggregator = QuestionAggregator(recorder, quiet_window=0.02, max_messages=10, max_chars=1000)
+    aggregator.add(None, make_state(1), "первый")
+    aggregator.add(None, make_state(2), "второй")
+    await asyncio.sleep(0.05)
+
+    assert sorted(call["text"] for call in recorder.calls) == ["второй", "первый"]
+    assert not any(call["follow_up"] for call in recorder.calls)
+
+
+@pytest.mark.asyncio
+async def test_unfinished_parts_are_returned_and_resumed_in_order():
+    slow = Recorder(delay=1)
+    aggregator = QuestionAggregator(slow, quiet_window=0.05, max_messages=2, max_chars=10_000)
+    state = make_state()
+    for n in range(3):
+        aggregator.add(None, state, f"part{n}")
+
+    unfinished = await aggregator.flush_all(timeout=0.05)
+
+    assert slow.calls == []
+    assert [chunk.text for chunk in unfinished] == ["part0\npart1", "part2"]
+    assert len(aggregator) == 0
+
+    # Следующий процесс: части обрабатываются по порядку, продолжение получает номер обращения
+    recorder = Recorder()
+    restarted = QuestionAggregator(recorder, quiet_window=0.05, max_messages=2, max_chars=10_000)
+    for chunk in unfinished:
+        restarted.resume(chunk)
+    assert await restarted.flush_all() == []
+    assert recorder.calls == [
+        {"text": "part0\npart1", "follow_up": False, "previous": None},
+        {"text": "part2", "follow_up": True, "previous": "ticket1"},
+    ]
+
+
+@pytest.mark.asyncio
+async def test_message_flood_keeps_one_follow_up_per_user():
+    recorder = Recorder(delay=0.05)
+    aggregator = QuestionAggregator(recorder, quiet_window=0.01, max_messages=10, max_chars=10_000)
+    state = make_state()
+    for n in range(100):
+        aggregator.add(None, state, f"part{n}")
+    # Таймер тишины продолжения срабатывает, пока первая часть еще обрабатывается
+    await asyncio.sleep(0.02)
+    aggregator.add(None, state, "part100")
+
+    await aggregator.flush_all()
+
+    assert len(recorder.calls) == 2
+    assert recorder.calls[0]["text"].split("\n") == [f"part{n}" for n in range(10)]
+    assert recorder.calls[1]["text"].split("\n") == [f"part{n}" for n in range(10, 101)]
+    assert recorder.calls[1]["follow_up"] is True
+    assert recorder.calls[1]["previous"] == "ticket1"
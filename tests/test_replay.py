@@ -0,0 +1,60 @@
+import pytest
+
+from app.services.tenants import DEFAULT_TENANT_ID
+from app.tools.replay import compare_outcomes, replay
+from app.utils.constants import START_QUERY_CALLBACK
+
+
+def message(update_id, user_id, text):
+    return {"update_id": update_id, "message": {
+        "message_id": update_id, "date": 0, "text": text,
+        "chat": {"id": user_id, "type": "private"},
+        "from": {"id": user_id, "is_bot": False, "first_name": "user"},
+    }}
+
+
+def callback(update_id, user_id, data):
+    return {"update_id": update_id, "callback_query": {
+        "id": str(update_id), "chat_instance": "chat", "data": data,
+        "from": {"id": user_id, "is_bot": False, "first_name": "user"},
+        "message": {"message_id": 1, "date": 0, "text": "menu", "chat": {"id": user_id, "type": "private"}},
+    }}
+
+
+def dialog():
+    """Два вопроса пользователя 1 с паузой между ними и один вопрос из двух сообщений пользователя 2."""
+    steps = [
+        (0.0, 1, message, "/start"), (0.5, 1, callback, START_QUERY_CALLBACK), (1.0, 1, message, "не работает оплата"),
+        (8.0, 1, message, "/start"), (8.5, 1, callback, START_QUERY_CALLBACK), (9.0, 1, message, "и доставка"),
+        (0.0, 2, message, "/start"), (0.5, 2, callback, START_QUERY_CALLBACK),
+        (1.0, 2, message, "Привет"), (1.5, 2, message, "не приходит код"),
+    ]
+    records = [{"ts": 1_000 + ts, "tenant": DEFAULT_TENANT_ID, "update": make(update_id, user_id, payload)}
+               for update_id, (ts, user_id, make, payload) in enumerate(steps, start=1)]
+    return sorted(records, key=lambda record: record["ts"])
+
+
+def test_compare_outcomes_reports_changed_and_missing_dialogs():
+    baseline = {"default:1": {"state": None, "tickets": 1}, "default:2": {"state": None, "tickets": 1}}
+    current = {"default:1": {"state": None, "tickets": 2}, "default:3": {"state": None, "tickets": 0}}
+
+    assert compare_outcomes(baseline, baseline) == []
+    assert compare_outcomes(baseline, current) == [
+        "default:1: {'state': None, 'tickets': 1} -> {'state': None, 'tickets': 2}",
+        "default:2: {'state': None, 'tickets': 1} -> None",
+        "default:3: None -> {'state': None, 'tickets': 0}",
+    ]
+
+
+@pytest.mark.asyncio
+async def test_outcomes_do_not_depend_on_replay_speed():
+    records = dialog()
+
+    accelerated = await replay(records, speed=10, telegram_latency=0, sheets_latency=0)
+    unpaced = await replay(records, speed=None, telegram_latency=0, sheets_latency=0)
+
+    assert accelerated["errors"] == unpaced["errors"] == 0
+    # Шаги диалога не слились: у пользователя 1 два обращения, у пользователя 2 сообщения склеены в одно
+    assert accelerated["outcomes"][f"{DEFAULT_TENANT_ID}:1"]["tickets"] == 2
+    assert accelerated["outcomes"][f"{DEFAULT_TENANT_ID}:2"]["tickets"] == 1
+    assert compare_outcomes(accelerated["outcomes"], unpaced["outcomes"]) == []
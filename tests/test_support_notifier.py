@@ -0,0 +1,54 @@
+import pytest
+from aiogram.exceptions import TelegramBadRequest
+
+from app.services.support_notifier import (deliver_notification, get_notification_breaker,
+                                           get_notification_outbox, notify_support)
+from app.services.tenants import Tenant
+
+
+class FakeBot:
+    def __init__(self, error=None):
+        self.error = error
+        self.sent = []
+
+    async def send_message(self, chat_id, text, **kwargs):
+        if self.error:
+            raise self.error
+        self.sent.append((chat_id, text))
+
+
+def make_tenant(tenant_id):
+    return Tenant(id=tenant_id, token="42:test", support_chat_id="-100",
+                  google_sheet_name="SupportSheet", support_log_worksheet_name="Log")
+
+
+@pytest.mark.asyncio
+async def test_rejected_notification_goes_to_dead_letter():
+    tenant = make_tenant("rejected")
+    bot = FakeBot(TelegramBadRequest(method=None, message="Bad Request: chat not found"))
+
+    assert not await notify_support(bot, tenant, "<b>вопрос</b>")
+
+    outbox = get_notification_outbox(tenant.id)
+    assert len(outbox) == 0
+    assert outbox._dead == 1
+    # Отказ Telegram — не сбой канала, предохранитель остается замкнутым
+    assert get_notification_breaker(tenant.id).state.value == "closed"
+
+
+@pytest.mark.asyncio
+async def test_flush_dead_letters_rejected_and_orphaned_notifications():
+    tenant = make_tenant("orphaned")
+    outbox = get_notification_outbox(tenant.id)
+    outbox.park({"tenant_id": tenant.id, "chat_id": "-100", "text": "раз"})
+    outbox.park({"tenant_id": tenant.id, "chat_id": "-100", "text": "два"})
+    bot = FakeBot(TelegramBadRequest(method=None, message="Bad Request: can't parse entities"))
+
+    assert await outbox.flush(lambda item: deliver_notification(bot, item)) == 0
+    assert len(outbox) == 0
+    assert outbox._dead == 2
+
+    # Бота арендатора больше нет в конфигурации — уведомление тоже не теряется молча
+    outbox.park({"tenant_id": tenant.id, "chat_id": "-100", "text": "три"})
+    assert await outbox.flush(lambda item: deliver_notification(None, item)) == 0
+    assert outbox._dead == 3
@@ -0,0 +1,82 @@
+from types import SimpleNamespace
+
+import pytest
+
+from app.middlewares.tenant import TenantMiddleware
+from app.services.tenants import DEFAULT_TENANT_ID, Tenant, load_tenant_registry, tenant_registry
+
+
+def write_tenants(tmp_path, text):
+    path = tmp_path / "tenants.yaml"
+    path.write_text(text, encoding="utf-8")
+    return str(path)
+
+
+def make_tenant(**kwargs):
+    return Tenant(id="brand", token="777:secret", support_chat_id="-100",
+                  google_sheet_name="Sheet", support_log_worksheet_name="Log", **kwargs)
+
+
+def test_registry_reads_token_from_env(tmp_path, monkeypatch):
+    monkeypatch.setenv("BRAND_BOT_TOKEN", "555:from-env")
+    path = write_tenants(tmp_path, """
+tenants:
+  - id: brand
+    token_env: BRAND_BOT_TOKEN
+    support_chat_id: -200
+    google_sheet_name: BrandSheet
+    max_concurrency: 4
+""")
+
+    registry = load_tenant_registry(path)
+
+    tenant = registry.get("brand")
+    assert tenant.token == "555:from-env"
+    assert tenant.support_chat_id == "-200"
+    assert tenant.google_sheet_name == "BrandSheet"
+    assert tenant.max_concurrency == 4
+    assert registry.for_bot(SimpleNamespace(id=555)) is tenant
+
+
+@pytest.mark.parametrize("text, error", [
+    ("tenants:\n  - id: a\n    token: '1:a'\n  - id: a\n    token: '2:b'\n", "указан дважды"),
+    ("tenants:\n  - id: a\n    token: '1:a'\n  - id: b\n    token: '1:a'\n", "уже используется"),
+    ("tenants:\n  - id: a\n    token_env: MISSING_BOT_TOKEN\n", "не задан token"),
+    ("", "не найдено ни одного арендатора"),
+    ("tenants:\n  - id: a\n    token: '1:a'\n    welcome_text: 'Привет, {name}'\n", "welcome_text"),
+])
+def test_invalid_registry_is_rejected(tmp_path, text, error):
+    with pytest.raises(ValueError, match=error):
+        load_tenant_registry(write_tenants(tmp_path, text))
+
+
+def test_default_tenant_without_file():
+    registry = load_tenant_registry(None)
+    assert [tenant.id for tenant in registry] == [DEFAULT_TENANT_ID]
+
+
+def test_bot_id_is_taken_from_token():
+    assert make_tenant().bot_id == 777
+
+
+def test_welcome_text_is_formatted_once():
+    tenant = make_tenant(specialist_name="Мария {вечер}",
+                         custom_welcome_text="{{Бренд}} {specialist_name} приветствует {user_name}")
+
+    assert tenant.format_welcome_text(user_name="{user_name}") == "{Бренд} Мария {вечер} приветствует {user_name}"
+    assert "<b>Мария {вечер}</b>" in make_tenant(specialist_name="Мария {вечер}").format_welcome_text(user_name="Аня")
+
+
+@pytest.mark.asyncio
+async def test_middleware_skips_updates_of_unknown_bots():
+    middleware = TenantMiddleware()
+    handled = []
+
+    async def handler(event, data):
+        handled.append(data["tenant"].id)
+
+    known_bot = SimpleNamespace(id=tenant_registry.get(DEFAULT_TENANT_ID).bot_id)
+    await middleware(handler, SimpleNamespace(update_id=1), {"bot": known_bot})
+    assert await middleware(handler, SimpleNamespace(update_id=2), {"bot": SimpleNamespace(id=1)}) is None
+
+    assert handled == [DEFAULT_TENANT_ID]